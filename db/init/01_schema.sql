@@ -1,14 +1,27 @@
 -- Enable PostGIS (geometry types, spatial indexes, etc.)
 CREATE EXTENSION IF NOT EXISTS postgis;
 
+-- Trigram matching, lets ILIKE '%...%' text search use GIN indexes
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- ============================================================================
 -- Table: quake
 -- Main earthquake event table (USGS-like feed)
+--
+-- Range-partitioned by month on time_utc, so time-range queries only touch
+-- the partitions they need. Unique keys on a partitioned table must include
+-- the partition key, hence (id, time_utc) / (usgs_id, time_utc); loaders
+-- additionally skip usgs_ids already present (see quake_loader). Being part
+-- of the primary key, time_utc is NOT NULL: loaders skip features without a
+-- time. Loaders create the monthly partitions with ensure_quake_partitions()
+-- before inserting. There is no default partition: a row outside the created
+-- months fails loudly instead of parking in a default partition, which would
+-- then block creating its month's partition.
 -- ============================================================================
 
 CREATE TABLE IF NOT EXISTS quake (
-    id            bigserial PRIMARY KEY,
-    usgs_id       text UNIQUE,
+    id            bigserial,
+    usgs_id       text,
     mag           numeric,
     place         text,
     time_utc      timestamptz,
@@ -25,13 +38,83 @@ CREATE TABLE IF NOT EXISTS quake (
     depth_km      numeric,
     lon           double precision,
     lat           double precision,
-    geom          geometry(Point, 4326)
-);
-
-CREATE INDEX IF NOT EXISTS quake_time_idx ON quake (time_utc DESC);
+    geom          geometry(Point, 4326),
+    PRIMARY KEY (id, time_utc),
+    UNIQUE (usgs_id, time_utc)
+) PARTITION BY RANGE (time_utc);
+
+-- Creates the missing monthly partitions quake_yYYYYmMM covering [from_ts, to_ts].
+-- Call it in a short transaction of its own: CREATE TABLE ... PARTITION OF
+-- holds an ACCESS EXCLUSIVE lock on quake until commit.
+CREATE OR REPLACE FUNCTION ensure_quake_partitions(from_ts timestamptz, to_ts timestamptz)
+RETURNS integer AS $$
+DECLARE
+    -- UTC wall-clock month start; stepping a timestamp (not a timestamptz)
+    -- keeps the session TimeZone and its DST changes out of the arithmetic
+    m       timestamp := date_trunc('month', from_ts AT TIME ZONE 'UTC');
+    created integer := 0;
+    part    text;
+BEGIN
+    -- one creator at a time (key 'qpart'); later callers then find the partitions
+    PERFORM pg_advisory_xact_lock(487216738932);
+    WHILE m AT TIME ZONE 'UTC' <= to_ts LOOP
+        part := format('quake_y%sm%s', to_char(m, 'YYYY'), to_char(m, 'MM'));
+        IF to_regclass(part) IS NULL THEN
+            BEGIN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF quake FOR VALUES FROM (%L) TO (%L)',
+                    part, m AT TIME ZONE 'UTC', (m + interval '1 month') AT TIME ZONE 'UTC'
+                );
+                created := created + 1;
+            EXCEPTION WHEN duplicate_table THEN
+                NULL;  -- created by a caller that did not take the lock
+            END;
+        END IF;
+        m := m + interval '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- BRIN on time: tiny, and rows arrive roughly in time order within a month
+CREATE INDEX IF NOT EXISTS quake_time_brin ON quake USING BRIN (time_utc);
+-- BRIN cannot return rows in order; this btree serves the newest-first
+-- ORDER BY time_utc DESC, id DESC LIMIT n (and the keyset paging of
+-- iter_columns in that order) without sorting the whole range
+CREATE INDEX IF NOT EXISTS quake_time_id_idx ON quake (time_utc DESC, id DESC);
+CREATE INDEX IF NOT EXISTS quake_usgs_id_idx ON quake (usgs_id);
 CREATE INDEX IF NOT EXISTS quake_mag_idx  ON quake (mag);
 CREATE INDEX IF NOT EXISTS quake_geom_gix ON quake USING GIST (geom);
 
+-- Substring search on place/title (sidebar text filter): ILIKE '%q%' is
+-- answered from these trigram indexes instead of a sequential scan
+CREATE INDEX IF NOT EXISTS quake_place_trgm_idx ON quake USING GIN (place gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS quake_title_trgm_idx ON quake USING GIN (title gin_trgm_ops);
+
+-- ============================================================================
+-- Table: quake_rollup
+-- Pre-aggregated quake counts per time bucket x 1 degree grid cell x
+-- magnitude band, kept for two grains ('hour', 'day'). Buckets are UTC.
+--   cell_x = floor(lon), cell_y = floor(lat)   (-999 when unknown)
+--   mag_band = floor(mag)                      (-9 when unknown)
+-- Updated incrementally by the bulk loader in the same statement that inserts
+-- into quake; rebuilt from quake with `python -m quake.rollups rebuild`.
+-- Read by data/rollup_queries.py for the magnitude band / time series charts.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS quake_rollup (
+    grain      TEXT        NOT NULL,
+    bucket     TIMESTAMPTZ NOT NULL,
+    cell_x     SMALLINT    NOT NULL,
+    cell_y     SMALLINT    NOT NULL,
+    mag_band   SMALLINT    NOT NULL,
+    n          INTEGER     NOT NULL,
+    mag_sum    DOUBLE PRECISION NOT NULL,
+    mag_max    DOUBLE PRECISION,
+    tsunami_n  INTEGER     NOT NULL,
+    PRIMARY KEY (grain, bucket, cell_x, cell_y, mag_band)
+);
+
 -- ============================================================================
 -- Table: country
 -- Countries, keyed by ISO3 code
@@ -74,13 +157,8 @@ CREATE TABLE IF NOT EXISTS location (
     sea_id       INTEGER              -- FK to sea.id (nullable)
 );
 
--- Add foreign keys for data integrity (optional but recommended)
-ALTER TABLE location
-    ADD CONSTRAINT location_quake_fk
-    FOREIGN KEY (quake_id)
-    REFERENCES quake (id)
-    ON DELETE CASCADE;
-
+-- Add foreign keys for data integrity (optional but recommended).
+-- No FK to quake: quake is partitioned, so quake.id alone is not a unique key.
 ALTER TABLE location
     ADD CONSTRAINT location_country_fk
     FOREIGN KEY (country_iso)
@@ -97,6 +175,45 @@ ALTER TABLE location
 CREATE INDEX IF NOT EXISTS location_country_idx ON location (country_iso);
 CREATE INDEX IF NOT EXISTS location_sea_idx     ON location (sea_id);
 
+-- ============================================================================
+-- Tables: eez_part / goas_part
+-- EEZ and GOaS polygons cut into small pieces with ST_Subdivide, used by the
+-- in-database resolver (PostGISLocationResolver). src_pos is the row position
+-- in the source layer; the lowest covering src_pos wins, like in Python.
+-- Filled later by PostGISLocationResolver.load_polygons
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS eez_part (
+    id       bigserial PRIMARY KEY,
+    src_pos  INTEGER NOT NULL,
+    iso      TEXT,
+    geom     geometry(Geometry, 4326) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS eez_part_geom_gix ON eez_part USING GIST (geom);
+
+CREATE TABLE IF NOT EXISTS goas_part (
+    id       bigserial PRIMARY KEY,
+    src_pos  INTEGER NOT NULL,
+    sea_id   INTEGER,
+    geom     geometry(Geometry, 4326) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS goas_part_geom_gix ON goas_part USING GIST (geom);
+
+-- ============================================================================
+-- Table: app_metadata
+-- Small key/value store for bookkeeping, e.g. the fingerprint of the EEZ/GOaS
+-- files the country/sea lookup tables were last filled from
+-- (used by CountrySeaManager.fill_all)
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS app_metadata (
+    key         TEXT PRIMARY KEY,
+    value       TEXT NOT NULL,
+    updated_at  TIMESTAMPTZ DEFAULT NOW()
+);
+
 -- Tracks what data ranges have been loaded
 CREATE TABLE IF NOT EXISTS data_load_log (
     id SERIAL PRIMARY KEY,
@@ -1,74 +1,122 @@
 from __future__ import annotations
-from typing import Dict, Any
-from utils.utils import features_to_dataframe
+from typing import Any, Dict, List
+
+from utils.stats import Distribution
 
 import streamlit as st
 import pandas as pd
 import altair as alt
 
 
-def hist_chart(df: pd.DataFrame, value_col: str, bins: int, x_title: str, log_scale: bool) -> alt.Chart:
+def hist_chart(bins_df: pd.DataFrame, x_title: str, log_scale: bool) -> alt.Chart:
+    """Bar chart of pre-binned counts (bin_start, bin_end, count); only the bins are sent to the browser."""
     y_scale = alt.Scale(type="log") if log_scale else alt.Scale()
+    if log_scale:
+        bins_df = bins_df[bins_df["count"] > 0]
     return (
-        alt.Chart(df)
+        alt.Chart(bins_df)
         .mark_bar()
         .encode(
-            x=alt.X(value_col, bin=alt.Bin(maxbins=bins), title=x_title),
-            y=alt.Y("count()", title="Count", scale=y_scale),
-            tooltip=[alt.Tooltip("count()", title="Count")],
+            x=alt.X("bin_start:Q", bin="binned", title=x_title),
+            x2="bin_end:Q",
+            y=alt.Y("count:Q", title="Count", scale=y_scale),
+            tooltip=[
+                alt.Tooltip("bin_start:Q", title="From", format=".2f"),
+                alt.Tooltip("bin_end:Q", title="To", format=".2f"),
+                alt.Tooltip("count:Q", title="Count"),
+            ],
         )
         .properties(height=240)
         .interactive()
     )
 
 
-def render_mag_hist(gj: Dict[str, Any]) -> None:
-    """Histogram of magnitude for the provided GeoJSON FeatureCollection."""
+def render_mag_hist(dists: Dict[str, Distribution]) -> None:
+    """Histogram of magnitude from precomputed distributions (see utils.utils.distributions_for_cfg)."""
     st.subheader("Magnitude distribution")
 
     try:
-        df = features_to_dataframe(gj)
-        if not df.empty:
-            mag_df = df.dropna(subset=["mag"])
-            if mag_df.empty:
-                st.info("No magnitude data to plot.")
-                return
-
-            c1, c2, c3 = st.columns([1, 1, 2])
-            bins = c1.slider("Bins (mag)", 10, 60, 30, 5, key="mag_bins")
-            log_y = c2.checkbox("Log scale (Y)", value=False, key="mag_log_y")
-
-            st.altair_chart(hist_chart(mag_df, "mag", bins, "Magnitude", log_y), use_container_width=True)
-
-            with st.expander("Summary stats", expanded=False):
-                st.write(mag_df["mag"].describe().to_frame("Magnitudes"))
-        else:
-            st.info("No events found for selected filters.")
+        dist = dists.get("mag")
+        if dist is None or dist.empty:
+            st.info("No magnitude data to plot.")
+            return
+
+        c1, c2, c3 = st.columns([1, 1, 2])
+        bins = c1.slider("Bins (mag)", 10, 60, 30, 5, key="mag_bins")
+        log_y = c2.checkbox("Log scale (Y)", value=False, key="mag_log_y")
+
+        st.altair_chart(hist_chart(dist.histogram(bins), "Magnitude", log_y), use_container_width=True)
+
+        with st.expander("Summary stats", expanded=False):
+            st.write(pd.Series(dist.stats).to_frame("Magnitudes"))
     except Exception as e:
         st.error(f"Failed to render magnitude histogram: {e}")
 
 
-def render_depth_hist(gj: Dict[str, Any]) -> None:
-    """Histogram of depth (km) for the provided GeoJSON FeatureCollection."""
+def render_depth_hist(dists: Dict[str, Distribution]) -> None:
+    """Histogram of depth (km) from precomputed distributions (see utils.utils.distributions_for_cfg)."""
     st.subheader("Depth distribution (km)")
 
     try:
-        df = features_to_dataframe(gj)
-        if not df.empty:
-            depth_df = df[(df["depth_km"].notna()) & (df["depth_km"] >= 0)]
-            if depth_df.empty:
-                st.info("No depth data to plot.")
-                return
-
-            c1, c2, c3 = st.columns([1, 1, 2])
-            bins = c1.slider("Bins (depth)", 10, 80, 40, 5, key="depth_bins")
-            log_y = c2.checkbox("Log scale (Y)", value=False, key="depth_log_y")
-
-            st.altair_chart(hist_chart(depth_df, "depth_km", bins, "Depth (km)", log_y), use_container_width=True)
-
-            with st.expander("Summary stats", expanded=False):
-                st.write(depth_df["depth_km"].describe().to_frame("Depth (km)"))
-        else:
-            st.info("No events found for selected filters.")
+        dist = dists.get("depth_km")
+        if dist is None or dist.empty:
+            st.info("No depth data to plot.")
+            return
+
+        c1, c2, c3 = st.columns([1, 1, 2])
+        bins = c1.slider("Bins (depth)", 10, 80, 40, 5, key="depth_bins")
+        log_y = c2.checkbox("Log scale (Y)", value=False, key="depth_log_y")
+
+        st.altair_chart(hist_chart(dist.histogram(bins), "Depth (km)", log_y), use_container_width=True)
+
+        with st.expander("Summary stats", expanded=False):
+            st.write(pd.Series(dist.stats).to_frame("Depth (km)"))
     except Exception as e:
         st.error(f"Failed to render depth histogram: {e}")
+
+
+def render_mag_bands(bands: List[Dict[str, Any]]) -> None:
+    """Events per whole-magnitude band over the full range (see data.rollup_queries.magnitude_bands)."""
+    st.subheader("Magnitude bands (all matching events)")
+    if not bands:
+        st.info("No magnitude data to plot.")
+        return
+
+    log_y = st.checkbox("Log scale (Y)", value=False, key="band_log_y")
+    bins_df = pd.DataFrame({
+        "bin_start": [b["band"] for b in bands],
+        "bin_end": [b["band"] + 1 for b in bands],
+        "count": [b["count"] for b in bands],
+    })
+    st.altair_chart(hist_chart(bins_df, "Magnitude band", log_y), use_container_width=True)
+
+
+def render_time_series(series: Dict[str, Any]) -> None:
+    """Events per hour/day over the full range (see data.rollup_queries.time_series)."""
+    st.subheader(f"Events per {series['grain']} (all matching events)")
+    buckets = series["buckets"]
+    if not any(b["count"] for b in buckets):
+        st.info("No events in this range.")
+        return
+
+    df = pd.DataFrame({
+        "time": pd.to_datetime([b["time"] for b in buckets], unit="ms", utc=True),
+        "count": [b["count"] for b in buckets],
+        "mag_max": [b["mag_max"] for b in buckets],
+    })
+    chart = (
+        alt.Chart(df)
+        .mark_bar()
+        .encode(
+            x=alt.X("time:T", title="Time (UTC)"),
+            y=alt.Y("count:Q", title="Count"),
+            tooltip=[
+                alt.Tooltip("time:T", title="From", format="%Y-%m-%d %H:%M"),
+                alt.Tooltip("count:Q", title="Count"),
+                alt.Tooltip("mag_max:Q", title="Max magnitude", format=".1f"),
+            ],
+        )
+        .properties(height=240)
+        .interactive()
+    )
+    st.altair_chart(chart, use_container_width=True)
@@ -1,38 +1,194 @@
-// Injected values
-const MAPBOX_TOKEN = __MAPBOX_TOKEN__;
-const MAP_STYLE = __MAP_STYLE__;
-const MAP_STYLE_NAME = __MAP_STYLE_NAME__;
-const LAYER_MODE = __LAYER_MODE__; // "bubbles"/"heatmap"
-const SPEED_HPS = __SPEED_HPS__;
-const START_MS = __START_MS__;
-const END_MS = __END_MS__;
-
-const MAG_MIN = __MAG_MIN__;
-const MAG_MAX = __MAG_MAX__;
-const DEPTH_MIN = __DEPTH_MIN__;
-const DEPTH_MAX = __DEPTH_MAX__;
-const TSUNAMI_ONLY = __TSUNAMI_ONLY__;  // true/false
-const TEXT_QUERY = __TEXT_QUERY__;      // lowercased substring or ''
-const NETWORKS = __NETWORKS_JSON__;     // array of strings
-const BBOX = __BBOX_JSON__;             // [minLon, minLat, maxLon, maxLat] or null
-
-const GEOJSON = __GEOJSON__;  // FeatureCollection or null
-
-if (!MAPBOX_TOKEN) {
-    document.body.innerHTML =
-        '<div style="color:#fff;padding:20px;font:16px system-ui;">No Mapbox token found. Set st.secrets["MAPBOX_TOKEN"].</div>';
+// Settings from Python (utils.utils.map_config), replaced on every Streamlit render
+let MAPBOX_TOKEN = '';
+let MAP_STYLE = '';
+let MAP_STYLE_NAME = '';
+let LAYER_MODE = 'bubbles'; // "bubbles"/"heatmap"
+let SPEED_HPS = 1;
+let START_MS = 0;
+let END_MS = 0;
+
+let MAG_MIN = 0;
+let MAG_MAX = 10;
+let DEPTH_MIN = 0;
+let DEPTH_MAX = 1000;
+let TSUNAMI_ONLY = false;
+
+let GEOJSON = null;  // FeatureCollection or null
+// Area/zoom the data was fetched for (utils.utils.map_view): {bbox, zoom, cell_deg}
+let VIEW = null;
+
+const FRAME_HEIGHT = 780;
+// Clusters carry cluster=true, count and mag (= max magnitude in the cell)
+const IS_CLUSTER = ['==', ['get', 'cluster'], true];
+const NOT_CLUSTER = ['!=', ['get', 'cluster'], true];
+
+let map = null;
+let mapReady = false;
+let currentStyle = null;
+
+// ---------- Streamlit component protocol ----------
+// Plain postMessage (no streamlit-component-lib, there is no JS build step).
+
+function toStreamlit(type, data) {
+    window.parent.postMessage(Object.assign({ isStreamlitMessage: true, type }, data), '*');
 }
 
-mapboxgl.accessToken = MAPBOX_TOKEN;
-const map = new mapboxgl.Map({
-    container: 'map',
-    style: MAP_STYLE,
-    center: [0, 15],
-    zoom: 1.7,
-    pitch: 30,
-    bearing: 0
+window.addEventListener('message', (event) => {
+    if (event.data && event.data.type === 'streamlit:render') {
+        onRender(event.data.args || {});
+    }
 });
-map.addControl(new mapboxgl.NavigationControl({ visualizePitch: true }));
+
+function applyConfig(cfg) {
+    MAPBOX_TOKEN = cfg.mapbox_token || '';
+    MAP_STYLE = cfg.style_url || '';
+    MAP_STYLE_NAME = cfg.style_name || '';
+    LAYER_MODE = cfg.layer_mode || 'bubbles';
+    SPEED_HPS = Number(cfg.speed_hps) || 1;
+    START_MS = Number(cfg.start_ms) || 0;
+    END_MS = Number(cfg.end_ms) || 0;
+    MAG_MIN = cfg.mag_min;
+    MAG_MAX = cfg.mag_max;
+    DEPTH_MIN = cfg.depth_min;
+    DEPTH_MAX = cfg.depth_max;
+    TSUNAMI_ONLY = !!cfg.tsunami_only;
+}
+
+function onRender(args) {
+    applyConfig(args.config || {});
+    GEOJSON = args.geojson ? JSON.parse(args.geojson) : null;
+    VIEW = args.view || null;
+
+    if (!map) {
+        createMap();
+        return;
+    }
+    if (!mapReady) return; // init() picks up the latest settings once the map has loaded
+
+    updateLegend();
+    setSliderBounds();
+    tNow = Math.max(START_MS, Math.min(END_MS, tNow));
+    if (MAP_STYLE !== currentStyle) {
+        // a new style drops sources and layers; rebuild them once it is loaded
+        currentStyle = MAP_STYLE;
+        map.once('style.load', () => {
+            loadData();
+            setLayerVisibility();
+            setFadingByAge();
+        });
+        map.setStyle(MAP_STYLE);
+        return;
+    }
+    loadData();
+    setLayerVisibility();
+    setFadingByAge();
+}
+
+function createMap() {
+    if (!MAPBOX_TOKEN) {
+        document.body.innerHTML =
+            '<div style="color:#fff;padding:20px;font:16px system-ui;">No Mapbox token found. Set st.secrets["MAPBOX_TOKEN"].</div>';
+        return;
+    }
+
+    mapboxgl.accessToken = MAPBOX_TOKEN;
+    currentStyle = MAP_STYLE;
+    map = new mapboxgl.Map({
+        container: 'map',
+        style: MAP_STYLE,
+        center: [0, 15],
+        zoom: 1.7,
+        pitch: 30,
+        bearing: 0
+    });
+    map.addControl(new mapboxgl.NavigationControl({ visualizePitch: true }));
+
+    init().catch(err => {
+        console.error(err);
+        document.body.innerHTML = '<pre style="color:#fff;padding:16px">' + String(err) + '</pre>';
+    });
+}
+
+// ---------- Viewport reporting (level of detail) ----------
+
+// Visible area as [w, s, e, n] with longitudes in [-180, 180]; w > e when
+// the view crosses the antimeridian, views wider than the world cover all
+// longitudes.
+function viewBounds() {
+    const b = map.getBounds();
+    const span = b.getEast() - b.getWest();
+    const wrap = lon => ((lon + 180) % 360 + 360) % 360 - 180;
+    let w = wrap(b.getWest());
+    let e = w + span > 180 ? w + span - 360 : w + span;
+    if (span >= 360) {
+        w = -180;
+        e = 180;
+    }
+    return [w, Math.max(-90, b.getSouth()), e, Math.min(90, b.getNorth())];
+}
+
+// Longitude ranges of a bbox, two when it crosses the antimeridian.
+function lonRanges(bbox) {
+    return bbox[0] <= bbox[2] ? [[bbox[0], bbox[2]]] : [[bbox[0], 180], [-180, bbox[2]]];
+}
+
+function bboxContains(outer, inner) {
+    const eps = 1e-6;
+    if (inner[1] < outer[1] - eps || inner[3] > outer[3] + eps) return false;
+    const outerLon = lonRanges(outer);
+    return lonRanges(inner).every(([iw, ie]) =>
+        outerLon.some(([ow, oe]) => iw >= ow - eps && ie <= oe + eps));
+}
+
+let lastReported = null;
+
+// Tell Python about the viewport, but only when the fetched data no longer
+// covers it (left the fetched bbox or changed zoom level); every report
+// triggers a rerun.
+function reportViewport() {
+    const bbox = viewBounds();
+    const zoom = map.getZoom();
+    if (VIEW && Math.floor(zoom) === VIEW.zoom && bboxContains(VIEW.bbox, bbox)) return;
+
+    const value = {
+        bbox: bbox.map(v => Math.round(v * 1e4) / 1e4),
+        zoom: Math.round(zoom * 100) / 100
+    };
+    const key = JSON.stringify(value);
+    if (key === lastReported) return;
+    lastReported = key;
+    toStreamlit('streamlit:setComponentValue', { value, dataType: 'json' });
+}
+
+function debounce(fn, ms) {
+    let timer = null;
+    return (...args) => {
+        clearTimeout(timer);
+        timer = setTimeout(() => fn(...args), ms);
+    };
+}
+
+function updateLegend() {
+    const legend = document.getElementById('legend-content');
+    if (legend) legend.textContent = `Layer: ${LAYER_MODE} · Style: ${MAP_STYLE_NAME}`;
+
+    const filters = document.getElementById('legend-filters');
+    if (filters) {
+        filters.textContent =
+            `Filters: mag [${MAG_MIN}, ${MAG_MAX}], depth [${DEPTH_MIN}, ${DEPTH_MAX}] km, tsunami-only: ${TSUNAMI_ONLY}`;
+    }
+
+    const lod = document.getElementById('legend-lod');
+    if (lod) {
+        const meta = GEOJSON?.metadata || {};
+        if (meta.lod === 'clusters') {
+            lod.textContent = `${meta.events} events in ${meta.count} clusters of ${meta.cell_deg}° ` +
+                `(${meta.time_steps} time steps) · zoom in for single events`;
+        } else {
+            lod.textContent = `${meta.count ?? (GEOJSON?.features || []).length} events in view`;
+        }
+    }
+}
 
 const MS_PER_HOUR = 3600 * 1000;
 
@@ -46,8 +202,8 @@ let sliderEl, startLabelEl, endLabelEl, clock;
 let userScrubbing = false;
 
 function featurePassesTimeFilter(f) {
+    // clusters too: they are split into time steps, timed at their first event
     const p = f.properties || {};
-
     const time_ms = Number(p.time_ms || p.time || 0);
     return !(!(time_ms >= START_MS && time_ms <= Math.min(tNow, END_MS)));
 }
@@ -60,7 +216,7 @@ function formatIso(ms) {
 function updateTable(filtered) {
     const tbody = document.getElementById('event-tbody');
     if (!tbody) return;
-    const rows = filtered.slice().sort((a, b) => (b.properties.time_ms || 0) - (a.properties.time_ms || 0));
+    const rows = filtered.filter(f => !f.properties?.cluster).sort((a, b) => (b.properties.time_ms || 0) - (a.properties.time_ms || 0));
 
     let html = '';
     for (const f of rows) {
@@ -136,108 +292,172 @@ async function loadData() {
         src.setData(fc);
     } else {
         map.addSource('eq', { type: 'geojson', data: fc });
+        addLayers();
+    }
 
-        // Circle (bubbles)
-        map.addLayer({
-            id: 'eq-circles',
-            type: 'circle',
-            source: 'eq',
-            layout: { visibility: LAYER_MODE === 'bubbles' ? 'visible' : 'none' },
-            paint: {
-                'circle-radius': [
-                    'interpolate', ['linear'], ['coalesce', ['get', 'mag'], 0],
-                    0, 3,
-                    2, 5,
-                    4, 8,
-                    6, 14,
-                    7, 20
-                ],
-                'circle-color': [
-                    'interpolate', ['linear'], ['coalesce', ['get', 'mag'], 0],
-                    0, '#4fe08a',
-                    3, '#ffd166',
-                    5, '#ef476f',
-                    7, '#d90429'
-                ],
-                'circle-stroke-color': 'rgba(0,0,0,0.5)',
-                'circle-stroke-width': 1,
-                'circle-opacity': 1
-            }
-        });
+    updateTable(filtered);
+    updateLegend();
+    window.__eq_features = features;
+}
 
-        // Heatmap
-        map.addLayer({
-            id: 'eq-heat',
-            type: 'heatmap',
-            source: 'eq',
-            maxzoom: 9,
-            layout: { visibility: LAYER_MODE === 'heatmap' ? 'visible' : 'none' },
-            paint: {
-                'heatmap-weight': [
-                    'interpolate', ['linear'], ['coalesce', ['get', 'mag'], 0],
-                    0, 0.1,
-                    2, 0.3,
-                    4, 0.7,
-                    6, 1
-                ],
-                'heatmap-intensity': 1,
-                'heatmap-radius': [
-                    'interpolate', ['linear'], ['zoom'],
-                    0, 2,
-                    3, 8,
-                    6, 25,
-                    9, 40
-                ],
-                'heatmap-opacity': 0.9
-            }
-        });
+const MAG_COLOR = [
+    'interpolate', ['linear'], ['coalesce', ['get', 'mag'], 0],
+    0, '#4fe08a',
+    3, '#ffd166',
+    5, '#ef476f',
+    7, '#d90429'
+];
+
+function addLayers() {
+    // Circle (bubbles)
+    map.addLayer({
+        id: 'eq-circles',
+        type: 'circle',
+        source: 'eq',
+        filter: NOT_CLUSTER,
+        layout: { visibility: LAYER_MODE === 'bubbles' ? 'visible' : 'none' },
+        paint: {
+            'circle-radius': [
+                'interpolate', ['linear'], ['coalesce', ['get', 'mag'], 0],
+                0, 3,
+                2, 5,
+                4, 8,
+                6, 14,
+                7, 20
+            ],
+            'circle-color': MAG_COLOR,
+            'circle-stroke-color': 'rgba(0,0,0,0.5)',
+            'circle-stroke-width': 1,
+            'circle-opacity': 1
+        }
+    });
 
-        // --- Click-to-open popup ---
-        const popup = new mapboxgl.Popup({
-            closeButton: true,
-            closeOnClick: true
-        });
+    // Server-side clusters (coarse zoom): size by count, color by max magnitude
+    map.addLayer({
+        id: 'eq-clusters',
+        type: 'circle',
+        source: 'eq',
+        filter: IS_CLUSTER,
+        layout: { visibility: LAYER_MODE === 'bubbles' ? 'visible' : 'none' },
+        paint: {
+            'circle-radius': [
+                'interpolate', ['linear'], ['ln', ['get', 'count']],
+                0, 6,
+                3, 12,
+                6, 22,
+                9, 34
+            ],
+            'circle-color': MAG_COLOR,
+            'circle-stroke-color': 'rgba(255,255,255,0.7)',
+            'circle-stroke-width': 1,
+            'circle-opacity': 0.85
+        }
+    });
+    map.addLayer({
+        id: 'eq-cluster-count',
+        type: 'symbol',
+        source: 'eq',
+        filter: IS_CLUSTER,
+        layout: {
+            visibility: LAYER_MODE === 'bubbles' ? 'visible' : 'none',
+            'text-field': ['to-string', ['get', 'count']],
+            'text-size': 11,
+            'text-allow-overlap': true
+        },
+        paint: { 'text-color': '#111' }
+    });
 
-        function quakeHTML(p) {
-            const dt = new Date(Number(p.time_ms || p.time || 0));
-            return `
-                <div style="font:12px system-ui">
-                  <b>${p.title || p.place || 'Earthquake'}</b><br/>
-                  Mag: <b>${p.mag ?? '—'}</b> · Net: ${p.net || '—'} · Tsunami: ${p.tsunami || 0}<br/>
-                  UTC: ${dt.toISOString().replace('T',' ').replace('Z',' Z')}<br/>
-                  <a href="${p.url || '#'}" target="_blank" style="color:#8ab4f8">event page</a>
-                </div>`;
+    // Heatmap
+    map.addLayer({
+        id: 'eq-heat',
+        type: 'heatmap',
+        source: 'eq',
+        maxzoom: 9,
+        layout: { visibility: LAYER_MODE === 'heatmap' ? 'visible' : 'none' },
+        paint: {
+            'heatmap-weight': heatWeight(null),
+            'heatmap-intensity': 1,
+            'heatmap-radius': [
+                'interpolate', ['linear'], ['zoom'],
+                0, 2,
+                3, 8,
+                6, 25,
+                9, 40
+            ],
+            'heatmap-opacity': 0.9
         }
+    });
+}
+
+// Heatmap weight by magnitude; single events fade with age (ageFade), clusters
+// count with the log of their size instead.
+function heatWeight(ageFade) {
+    const magWeight = ['interpolate', ['linear'], ['coalesce', ['get', 'mag'], 0],
+        0, 0.1,
+        2, 0.3,
+        4, 0.7,
+        6, 1
+    ];
+    return ['case', IS_CLUSTER,
+        ['*', magWeight, ['ln', ['+', 1, ['get', 'count']]]],
+        ageFade ? ['*', magWeight, ageFade] : magWeight
+    ];
+}
+
+function registerHandlers() {
+    // --- Click-to-open popup ---
+    const popup = new mapboxgl.Popup({
+        closeButton: true,
+        closeOnClick: true
+    });
 
-        // Cursor feedback
-        map.on('mouseenter', 'eq-circles', () => {
+    function quakeHTML(p) {
+        const dt = new Date(Number(p.time_ms || p.time || 0));
+        return `
+            <div style="font:12px system-ui">
+              <b>${p.title || p.place || 'Earthquake'}</b><br/>
+              Mag: <b>${p.mag ?? '—'}</b> · Net: ${p.net || '—'} · Tsunami: ${p.tsunami || 0}<br/>
+              UTC: ${dt.toISOString().replace('T',' ').replace('Z',' Z')}<br/>
+              <a href="${p.url || '#'}" target="_blank" style="color:#8ab4f8">event page</a>
+            </div>`;
+    }
+
+    // Cursor feedback
+    for (const layer of ['eq-circles', 'eq-clusters']) {
+        map.on('mouseenter', layer, () => {
             map.getCanvas().style.cursor = 'pointer';
         });
-        map.on('mouseleave', 'eq-circles', () => {
+        map.on('mouseleave', layer, () => {
             map.getCanvas().style.cursor = '';
         });
+    }
 
-        // Open on click (anchored at feature's center)
-        map.on('click', 'eq-circles', (e) => {
-            const f = e?.features[0];
-            if (!f) return;
+    // Open on click (anchored at feature's center)
+    map.on('click', 'eq-circles', (e) => {
+        const f = e?.features[0];
+        if (!f) return;
 
-            const p = f.properties || {};
-            const coords = (f?.geometry?.coordinates) || null;
-            if (!coords || coords[0] == null || coords[1] == null) return;
+        const p = f.properties || {};
+        const coords = (f?.geometry?.coordinates) || null;
+        if (!coords || coords[0] == null || coords[1] == null) return;
 
-            const lngLat = [Number(coords[0]), Number(coords[1])];
-            popup.setLngLat(lngLat).setHTML(quakeHTML(p)).addTo(map);
+        const lngLat = [Number(coords[0]), Number(coords[1])];
+        popup.setLngLat(lngLat).setHTML(quakeHTML(p)).addTo(map);
 
-            // Prevent the subsequent map 'click' from immediately closing it
-            if (e.originalEvent) {
-                e.originalEvent.cancelBubble = true;
-            }
-        });
-    }
+        // Prevent the subsequent map 'click' from immediately closing it
+        if (e.originalEvent) {
+            e.originalEvent.cancelBubble = true;
+        }
+    });
 
-    updateTable(filtered);
-    window.__eq_features = features;
+    // Clicking a cluster zooms in on it (the map then reports the new viewport)
+    map.on('click', 'eq-clusters', (e) => {
+        const coords = e?.features[0]?.geometry?.coordinates;
+        if (!coords) return;
+        map.easeTo({ center: [Number(coords[0]), Number(coords[1])], zoom: Math.floor(map.getZoom()) + 2 });
+    });
+
+    map.on('moveend', debounce(reportViewport, 250));
 }
 
 function updateSourceData() {
@@ -257,16 +477,8 @@ function setFadingByAge() {
         72 * MS_PER_HOUR, 0
     ];
 
-    // Base weight by magnitude (same as your layer definition)
-    const magWeight = ['interpolate', ['linear'], ['coalesce', ['get', 'mag'], 0],
-        0, 0.1,
-        2, 0.3,
-        4, 0.7,
-        6, 1
-    ];
-
     if (map.getLayer('eq-heat')) {
-        map.setPaintProperty('eq-heat', 'heatmap-weight', ['*', magWeight, ageFade]);
+        map.setPaintProperty('eq-heat', 'heatmap-weight', heatWeight(ageFade));
         map.setPaintProperty('eq-heat', 'heatmap-intensity', 1);
     }
 
@@ -282,7 +494,10 @@ function setFadingByAge() {
 }
 
 function setLayerVisibility() {
-    if (map.getLayer('eq-circles')) map.setLayoutProperty('eq-circles', 'visibility', LAYER_MODE === 'bubbles' ? 'visible' : 'none');
+    const bubbles = LAYER_MODE === 'bubbles' ? 'visible' : 'none';
+    for (const layer of ['eq-circles', 'eq-clusters', 'eq-cluster-count']) {
+        if (map.getLayer(layer)) map.setLayoutProperty(layer, 'visibility', bubbles);
+    }
     if (map.getLayer('eq-heat')) map.setLayoutProperty('eq-heat', 'visibility', LAYER_MODE === 'heatmap' ? 'visible' : 'none');
 }
 
@@ -291,6 +506,8 @@ function setSliderBounds() {
     sliderEl.min = String(START_MS);
     sliderEl.max = String(END_MS);
     sliderEl.step = String(MS_PER_HOUR); // 1 hour steps
+    if (startLabelEl) startLabelEl.textContent = new Date(START_MS).toISOString().slice(0,19).replace('T',' ') + ' Z';
+    if (endLabelEl) endLabelEl.textContent   = new Date(END_MS).toISOString().slice(0,19).replace('T',' ') + ' Z';
 }
 
 function updateSliderFromTime() {
@@ -315,8 +532,6 @@ function initSliderUI() {
     setSliderBounds();
     clock.textContent = new Date(START_MS).toISOString().replace('T',' ').replace('Z',' Z');
     sliderEl.value = String(START_MS);
-    if (startLabelEl) startLabelEl.textContent = new Date(START_MS).toISOString().slice(0,19).replace('T',' ') + ' Z';
-    if (endLabelEl) endLabelEl.textContent   = new Date(END_MS).toISOString().slice(0,19).replace('T',' ') + ' Z';
 
     // Pause while scrubbing, resume only if it was playing
     let wasPlaying = false;
@@ -343,7 +558,10 @@ async function init() {
     setLayerVisibility();
     setFadingByAge();
     initSliderUI();
+    registerHandlers();
     animate();
+    mapReady = true;
+    reportViewport();
 }
 
 function animate() {
@@ -373,12 +591,9 @@ function animate() {
     if (pauseBtn) pauseBtn.onclick = () => (playing = false);
 
     tNow = START_MS;
-    const legend = document.getElementById('legend-content');
-    if (legend) legend.textContent = `Layer: ${LAYER_MODE} · Style: ${MAP_STYLE_NAME}`;
+    updateLegend();
 }
 
-// start script
-init().catch(err => {
-    console.error(err);
-    document.body.innerHTML = '<pre style="color:#fff;padding:16px">' + String(err) + '</pre>';
-});
\ No newline at end of file
+// start: Streamlit answers with a render message carrying the settings and data
+toStreamlit('streamlit:componentReady', { apiVersion: 1 });
+toStreamlit('streamlit:setFrameHeight', { height: FRAME_HEIGHT });
\ No newline at end of file
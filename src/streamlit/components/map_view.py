@@ -1,31 +1,31 @@
 from pathlib import Path
-import streamlit as st
-from utils.utils import fill_template_vars
+from typing import Any, Dict
+import streamlit.components.v1 as components
+from utils.utils import map_config
 
-def render_map(cfg, gj) -> None:
-    """
-    Render the map using a pre-fetched GeoJSON FeatureCollection (gj).
-    """
-    # Load assets from components/html folder
-    root = Path(__file__).resolve().parents[1]
-    html_path = root / "components" / "html" / "earthquakes.html"
-    css_path  = root / "components" / "html" / "earthquakes.css"
-    js_path   = root / "components" / "html" / "earthquakes.js"
-
-    html = html_path.read_text(encoding="utf-8")
-    css  = css_path.read_text(encoding="utf-8")
-    js   = js_path.read_text(encoding="utf-8")
+# session_state key holding the viewport the map last reported
+MAP_KEY = "quake_map"
 
-    geojson = gj or {"type": "FeatureCollection", "features": []}
+# Bidirectional component served from components/html (index.html loads
+# earthquakes.css/.js). The iframe survives reruns, so the map keeps its
+# position while new data arrives.
+_map_component = components.declare_component(
+    "earthquake_map",
+    path=str(Path(__file__).resolve().parent / "html"),
+)
 
-    # Fill placeholders for BOTH JS and HTML
-    js   = fill_template_vars(js,   cfg, geojson)
-    html = fill_template_vars(html, cfg, geojson)
 
-    # Inline CSS + JS into the HTML template
-    html_inlined = (
-        html.replace("</head>", f"<style>{css}</style></head>")
-        .replace("</body>", f"<script>{js}</script></body>")
+def render_map(cfg, gj: str, view: Dict[str, Any]) -> Dict[str, Any] | None:
+    """
+    Render the map with a pre-serialized GeoJSON FeatureCollection (gj) for
+    `view` (see utils.utils.map_view). Returns the viewport the map reports
+    back, {"bbox": [w, s, e, n], "zoom": z}; it is also kept in
+    st.session_state[MAP_KEY] for fetching the next run's data.
+    """
+    return _map_component(
+        config=map_config(cfg),
+        geojson=gj or '{"type": "FeatureCollection", "features": []}',
+        view=view,
+        key=MAP_KEY,
+        default=None,
     )
-
-    st.components.v1.html(html_inlined, height=780, scrolling=False)
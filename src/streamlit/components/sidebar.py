@@ -5,6 +5,7 @@ import os
 from dotenv import load_dotenv
 
 from data.data_sources import DATA_SOURCES
+from data.query_cache import query_cache
 from utils.types import AppConfig
 
 # Load .env variables (only once)
@@ -65,6 +66,7 @@ def render_sidebar_return_config() -> AppConfig:
     tsunami_only = st.sidebar.checkbox("Tsunami only", value=False)
     text_query = st.sidebar.text_input("Text search in title/place (contains)", value="")
     networks_csv = st.sidebar.text_input("Restrict to networks (comma-separated, e.g., us,ak,pr)", value="")
+    countries, seas = location_filters(ds_choice)
     use_bbox = st.sidebar.checkbox("Restrict to bounding box", value=False)
 
     col1, col2 = st.sidebar.columns(2)
@@ -74,6 +76,10 @@ def render_sidebar_return_config() -> AppConfig:
     max_lat = col2.number_input("max lat", value=85.0, step=0.5, format="%.4f")
     bbox = [min_lon, min_lat, max_lon, max_lat] if use_bbox else None
 
+    max_events = int(st.sidebar.number_input(
+        "Max events (newest first)", min_value=1000, max_value=200_000, value=5000, step=1000
+    ))
+
     return AppConfig(
         ds_choice=ds_choice,
         mapbox_token=MAPBOX_TOKEN,
@@ -91,4 +97,29 @@ def render_sidebar_return_config() -> AppConfig:
         networks_csv=networks_csv,
         bbox=bbox,
         speed_hps=speed_hps,
+        max_events=max_events,
+        countries=countries,
+        seas=seas,
+    )
+
+
+def location_filters(ds) -> tuple[list[str], list[int]]:
+    """Country / sea multiselects, for sources whose events have resolved locations."""
+    if not getattr(ds, "supports_location_filters", False):
+        return [], []
+
+    try:
+        options = query_cache.get_or_compute(
+            (ds.name(), "location_options"), ds.location_options, version=ds.data_version
+        )
+    except Exception as e:
+        st.sidebar.caption(f"Country/sea filters unavailable: {e}")
+        return [], []
+
+    country_names = dict(options["countries"])
+    sea_names = dict(options["seas"])
+    countries = st.sidebar.multiselect(
+        "Countries (onshore / EEZ)", list(country_names), format_func=lambda iso: f"{country_names[iso]} ({iso})"
     )
+    seas = st.sidebar.multiselect("Seas", list(sea_names), format_func=lambda i: sea_names[i])
+    return countries, seas
@@ -1,16 +1,12 @@
-from utils.utils import features_to_dataframe
 import pandas as pd
 import streamlit as st
-from typing import Dict, Any
 
-def render_table(gj: Dict[str, Any]) -> None:
+def render_table(df: pd.DataFrame) -> None:
     """
-    Render the events table from a pre-fetched GeoJSON FeatureCollection (gj).
+    Render the events table from pre-fetched columns (see DataSource.fetch_columns).
     No DB/HTTP calls happen here.
     """
     try:
-        df = features_to_dataframe(gj)
-
         if not df.empty:
             if "time" in df.columns:
                 df = df.sort_values("time", ascending=True)
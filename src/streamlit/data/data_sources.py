@@ -1,10 +1,22 @@
-from typing import Optional, Sequence, Dict, Any, List
+from typing import Optional, Sequence, Dict, Any, Iterable, Iterator, List, Tuple
 from datetime import datetime, timezone
+import json
+import math
+import threading
+import time
+
+import pandas as pd
 
 from sqlmodel import select
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, case, cast, null, literal_column, text, tuple_, BigInteger, Float, Text
+from sqlalchemy import select as sa_select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from data.db import get_session
-from models.models import Earthquake
+from models.models import Country, Earthquake, Location, Sea
+from quake.quake_loader import REVISIONS_KEY, get_http_session
+
+# rows per DataSource.iter_columns() chunk
+CHUNK_EVENTS = 5000
 
 class DataSource:
     """Interface for a data source that returns a GeoJSON feed."""
@@ -23,28 +35,242 @@ class DataSource:
                       networks: Sequence[str],
                       bbox: Optional[Sequence[float]],
                       limit: int = 5000,
+                      countries: Sequence[str] = (),
+                      seas: Sequence[int] = (),
+                      bboxes: Sequence[Sequence[float]] = (),
                       ) -> Dict[str, Any]: ...
 
+    def fetch_geojson_text(self, **kwargs) -> str:
+        """FeatureCollection as a JSON string; sources may build it more cheaply than dicts."""
+        return json.dumps(self.fetch_geojson(**kwargs))
+
+    def iter_columns(self, *, chunk_size: int = CHUNK_EVENTS, **filters) -> Iterator[pd.DataFrame]:
+        """
+        Every matching event, not capped at a limit, as table/histogram
+        columns (EVENT_COLUMNS, newest first) in frames of at most chunk_size
+        rows. Consumers hold one chunk at a time; stopping early stops the query.
+        """
+        ...
+
+    def fetch_columns(self, *, limit: int = 5000, **filters) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        The events fetch_geojson() would return, as the table/histogram columns
+        (EVENT_COLUMNS, newest first) plus the FeatureCollection metadata,
+        without building or parsing GeoJSON. Read from iter_columns() until
+        one row past limit.
+        """
+        return take_columns(self.iter_columns(chunk_size=min(limit + 1, CHUNK_EVENTS), **filters), limit)
+
+    def fetch_map_geojson_text(self, *, view: Dict[str, Any], limit: int = 5000, **filters) -> str:
+        """
+        Map payload for a view (see utils.utils.map_view): only events inside
+        view["bbox"]. Sources that can aggregate return clusters instead when
+        view["cell_deg"] is set.
+        """
+        filters = view_filters(filters, view)
+        if filters is None:
+            return json.dumps(empty_collection(limit))
+        return self.fetch_geojson_text(limit=limit, **filters)
+
+    # results may go through the shared QueryCache, invalidated by data_version()
+    cacheable: bool = False
+    # countries/seas filters backed by the location table
+    supports_location_filters: bool = False
+    # magnitude bands / time series from quake_rollup (see data.rollup_queries)
+    supports_rollups: bool = False
+
+    def data_version(self) -> Any:
+        """Changes whenever the underlying data changes."""
+        return None
+
+# ---------- Live USGS summary feeds ----------
+
+USGS_FEEDS = {
+    "hour": "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_hour.geojson",
+    "day": "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_day.geojson",
+    "week": "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_week.geojson",
+}
+# USGS regenerates the summary feeds about once a minute
+FEED_TTL_S = 60
+
+
+class _FeedCache:
+    """
+    Process-wide cache of parsed summary feeds, shared by all Streamlit sessions.
+    Entries are refreshed at most once per FEED_TTL_S with a conditional GET
+    (ETag / If-Modified-Since), so an unchanged feed costs a 304 and no parsing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, url: str) -> Dict[str, Any]:
+        # single lock: concurrent viewers wait for one upstream request
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry and time.monotonic() - entry["fetched_at"] < FEED_TTL_S:
+                return entry
+
+            headers = {}
+            if entry:
+                if entry["etag"]:
+                    headers["If-None-Match"] = entry["etag"]
+                if entry["last_modified"]:
+                    headers["If-Modified-Since"] = entry["last_modified"]
+
+            resp = get_http_session().get(url, headers=headers, timeout=15)
+            if resp.status_code == 304 and entry:
+                entry["fetched_at"] = time.monotonic()
+                return entry
+            resp.raise_for_status()
+
+            features = resp.json().get("features", []) or []
+            entry = {
+                "fetched_at": time.monotonic(),
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "features": features,
+                "columns": _feed_columns(features),
+            }
+            self._entries[url] = entry
+            return entry
+
+
+def _feed_columns(features: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Columnar view of the filterable feed properties, one row per feature."""
+    props = [f.get("properties") or {} for f in features]
+    coords = [((f.get("geometry") or {}).get("coordinates") or [None, None, None]) for f in features]
+    df = pd.DataFrame({
+        "time": [p.get("time") for p in props],
+        "mag": [p.get("mag") for p in props],
+        "tsunami": [p.get("tsunami") for p in props],
+        "net": [p.get("net") for p in props],
+        "place": [p.get("place") for p in props],
+        "title": [p.get("title") for p in props],
+        "url": [p.get("url") for p in props],
+        "lon": [c[0] for c in coords],
+        "lat": [c[1] for c in coords],
+        "depth_km": [c[2] if len(c) > 2 else None for c in coords],
+    })
+    for col in ("time", "mag", "tsunami", "lon", "lat", "depth_km"):
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df["net"] = df["net"].fillna("").str.lower()
+    df["text"] = (df["place"].fillna("") + "\n" + df["title"].fillna("")).str.lower()
+    return df
+
+
+_feed_cache = _FeedCache()
+
+
 class LiveUSGSDataSource(DataSource):
-    def name(self): return "USGS (live, last 24h)"
+    def name(self): return "USGS (live, last 7 days)"
+
     def get_endpoint(self, **kwargs) -> str:
-        return "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_day.geojson"
-    def fetch_geojson(self,
-                      *,
-                      start_ms: int,
-                      end_ms: int,
-                      mag_min: float,
-                      mag_max: float,
-                      depth_min: float,
-                      depth_max: float,
-                      tsunami_only: bool,
-                      text_query: str,
-                      networks: Sequence[str],
-                      bbox: Optional[Sequence[float]],
-                      limit: int = 5000,) -> Dict[str, Any]:
-        return {}
+        """Smallest summary feed covering start_ms (hour/day/week)."""
+        start_ms = kwargs.get("start_ms")
+        if start_ms is None:
+            return USGS_FEEDS["day"]
+        age_h = (time.time() * 1000 - start_ms) / 3_600_000
+        if age_h <= 1:
+            return USGS_FEEDS["hour"]
+        if age_h <= 24:
+            return USGS_FEEDS["day"]
+        return USGS_FEEDS["week"]
+
+    def _match(self,
+               *,
+               start_ms: int,
+               end_ms: int,
+               mag_min: float,
+               mag_max: float,
+               depth_min: float,
+               depth_max: float,
+               tsunami_only: bool,
+               text_query: str,
+               networks: Sequence[str],
+               bbox: Optional[Sequence[float]],
+               limit: Optional[int] = 5000,
+               countries: Sequence[str] = (),
+               seas: Sequence[int] = (),
+               bboxes: Sequence[Sequence[float]] = (),) -> Tuple[Dict[str, Any], pd.Index, int]:
+        """
+        Same filters as PostgresORMDataSource, applied as vectorized masks over the cached feed.
+        Feed events have no resolved location, so countries/seas are not supported
+        (supports_location_filters is False and the sidebar does not offer them).
+        Returns (feed entry, index of the newest `limit` matches (all if None), number of matches).
+        """
+        entry = _feed_cache.get(self.get_endpoint(start_ms=start_ms))
+        df = entry["columns"]
+
+        mask = (
+            df["time"].between(start_ms, end_ms)
+            & df["mag"].between(mag_min, mag_max)
+            & df["depth_km"].between(depth_min, depth_max)
+        )
+
+        if tsunami_only:
+            mask &= df["tsunami"] == 1
+
+        tq = (text_query or "").strip().lower()
+        if tq:
+            mask &= df["text"].str.contains(tq, regex=False)
+
+        nets = [n.strip().lower() for n in networks or [] if n.strip()]
+        if nets:
+            mask &= df["net"].isin(nets)
+
+        if bbox:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            mask &= df["lon"].between(min_lon, max_lon) & df["lat"].between(min_lat, max_lat)
+
+        if bboxes:
+            in_any = False
+            for min_lon, min_lat, max_lon, max_lat in bboxes:
+                in_any = in_any | (df["lon"].between(min_lon, max_lon) & df["lat"].between(min_lat, max_lat))
+            mask &= in_any
+
+        # newest first, like the DB source
+        idx = df.index[mask.to_numpy()]
+        matched = len(idx)
+        idx = df.loc[idx, "time"].sort_values(ascending=False).index[:limit]
+        return entry, idx, matched
+
+    def fetch_geojson(self, *, limit: int = 5000, **filters) -> Dict[str, Any]:
+        """Matching feed features (see _match())."""
+        entry, idx, matched = self._match(limit=limit, **filters)
+        features = entry["features"]
+        return {
+            "type": "FeatureCollection",
+            "metadata": collection_metadata(len(idx), limit, matched > limit),
+            "features": [features[i] for i in idx],
+        }
+
+    def iter_columns(self, *, chunk_size: int = CHUNK_EVENTS, **filters) -> Iterator[pd.DataFrame]:
+        """Matching events straight from the feed's columnar view (see _match()), chunk by chunk."""
+        entry, idx, _ = self._match(limit=None, **filters)
+        for i in range(0, len(idx), chunk_size):
+            df = entry["columns"].loc[idx[i:i + chunk_size]]
+            yield events_frame({
+                "time_ms": df["time"],
+                "mag": df["mag"],
+                "depth_km": df["depth_km"],
+                "lon": df["lon"],
+                "lat": df["lat"],
+                "place": df["place"].fillna(df["title"]),
+                "net": df["net"],
+                "tsunami": df["tsunami"],
+                "url": df["url"],
+            })
 
 # ---------- ORM-backed Postgres ----------
+# At cluster zoom levels a view with at most this many events gets them as-is.
+MAP_RAW_EVENTS = 2000
+# Map clusters are split into this many time steps of the range, so the
+# timelapse can show them as it reaches them.
+MAP_TIME_STEPS = 24
+
+
 class PostgresORMDataSource(DataSource):
     def name(self):
         return "PostgreSQL"
@@ -52,49 +278,88 @@ class PostgresORMDataSource(DataSource):
     def get_endpoint(self, **kwargs) -> str:
         return ""  # Not used
 
-    def fetch_geojson(
-            self,
+    cacheable = True
+    supports_location_filters = True
+    supports_rollups = True
+
+    def data_version(self) -> tuple:
+        """
+        Latest load log entry, quake id and revision counter (all index
+        lookups); together they move on every ingest, including one that only
+        revises stored events.
+        """
+        with get_session() as session:
+            return tuple(session.execute(text("""
+                SELECT (SELECT COALESCE(MAX(id), 0) FROM data_load_log),
+                       (SELECT COALESCE(MAX(id), 0) FROM quake),
+                       (SELECT value FROM app_metadata WHERE key = :revisions)
+            """), {"revisions": REVISIONS_KEY}).one())
+
+    @staticmethod
+    def conditions(
             *,
             start_ms: int,
             end_ms: int,
-            mag_min: float,
-            mag_max: float,
-            depth_min: float,
-            depth_max: float,
+            mag_min: Optional[float],
+            mag_max: Optional[float],
+            depth_min: Optional[float],
+            depth_max: Optional[float],
             tsunami_only: bool,
             text_query: str,
             networks: Sequence[str],
             bbox: Optional[Sequence[float]],
-            limit: int = 5000,
-    ) -> Dict[str, Any]:
-        """Build SQL with expressions, run via session.exec, return FeatureCollection."""
+            countries: Sequence[str] = (),
+            seas: Sequence[int] = (),
+            bboxes: Sequence[Sequence[float]] = (),
+    ) -> list:
+        """
+        WHERE conditions on Earthquake for the dashboard filters (combined with
+        AND). A magnitude or depth range of None is not filtered on. bboxes
+        restricts to any of several boxes (a map view split at the
+        antimeridian, see view_filters()), on top of bbox.
+        """
 
         # Convert ms -> datetime
         start_dt = datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc)
         end_dt   = datetime.fromtimestamp(end_ms   / 1000, tz=timezone.utc)
 
         # create condition array that is combined with and in the where clause
-        conds = [
-            Earthquake.time_utc.between(start_dt, end_dt),
-            Earthquake.mag.between(mag_min, mag_max),
-            Earthquake.depth_km.between(depth_min, depth_max),
-        ]
+        conds = [Earthquake.time_utc.between(start_dt, end_dt)]
+        if mag_min is not None and mag_max is not None:
+            conds.append(Earthquake.mag.between(mag_min, mag_max))
+        if depth_min is not None and depth_max is not None:
+            conds.append(Earthquake.depth_km.between(depth_min, depth_max))
 
         if tsunami_only:
             conds.append(Earthquake.tsunami == 1)
 
-        tq = (text_query or "").strip().lower()
+        tq = (text_query or "").strip()
         if tq:
-            like = f"%{tq}%"
+            # plain column ILIKE (no lower()) so the pg_trgm GIN indexes apply;
+            # user input is matched literally
+            like = "%" + tq.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
             conds.append(or_(
-                func.lower(Earthquake.place).ilike(like),
-                func.lower(Earthquake.title).ilike(like),
+                Earthquake.place.ilike(like, escape="\\"),
+                Earthquake.title.ilike(like, escape="\\"),
             ))
 
         nets = [n.strip().lower() for n in networks or [] if n.strip()]
         if nets:
             conds.append(func.lower(Earthquake.net).in_(nets))
 
+        # --- Country / sea filter ---
+        # semi-join to location; its country_iso / sea_id indexes find the
+        # quake ids, an event matches if it is in any selected country or sea
+        isos = [c for c in countries or [] if c]
+        sea_ids = [int(x) for x in seas or []]
+        if isos or sea_ids:
+            loc_conds = []
+            if isos:
+                loc_conds.append(Location.country_iso.in_(isos))
+            if sea_ids:
+                loc_conds.append(Location.sea_id.in_(sea_ids))
+            conds.append(Earthquake.id.in_(sa_select(Location.quake_id).where(or_(*loc_conds))))
+
         # --- BBOX filter ---
         if bbox:
             min_lon, min_lat, max_lon, max_lat = bbox
@@ -104,22 +369,321 @@ class PostgresORMDataSource(DataSource):
                     func.ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, 4326)
                 )
             )
+        if bboxes:
+            conds.append(or_(*(
+                func.ST_Intersects(Earthquake.geom, func.ST_MakeEnvelope(*b, 4326))
+                for b in bboxes
+            )))
+
+        return conds
+
+    def location_options(self) -> Dict[str, List[tuple]]:
+        """Choices for the country/sea filters: {"countries": [(iso, name)], "seas": [(id, name)]}."""
+        with get_session() as session:
+            countries = session.execute(sa_select(Country.iso, Country.name).order_by(Country.name)).all()
+            seas = session.execute(sa_select(Sea.id, Sea.name).order_by(Sea.name)).all()
+        return {"countries": [tuple(r) for r in countries], "seas": [tuple(r) for r in seas]}
 
-        # finally: statement, select from Earthquake table with conditions, ordered by time
+    def location_counts(self, **filters) -> Dict[str, Any]:
+        """
+        Matching events per country and per sea (all matches, not capped by
+        limit), from the location table. Events with a location row that is
+        in neither a country nor a sea are counted as "unresolved"; events
+        without a location row yet (not processed by the ingest worker) as
+        "pending".
+        """
+        filters.pop("limit", None)
+        n = func.count()
+        pending = Location.quake_id.is_(None)
+        stmt = (
+            sa_select(Location.country_iso, Country.name, Location.sea_id, Sea.name, pending, n)
+            .select_from(Earthquake)
+            .outerjoin(Location, Location.quake_id == Earthquake.id)
+            .outerjoin(Country, Country.iso == Location.country_iso)
+            .outerjoin(Sea, Sea.id == Location.sea_id)
+            .where(and_(*self.conditions(**filters)))
+            .group_by(Location.country_iso, Country.name, Location.sea_id, Sea.name, pending)
+        )
+        with get_session() as session:
+            rows = session.execute(stmt).all()
+
+        countries: Dict[str, Dict[str, Any]] = {}
+        seas: Dict[int, Dict[str, Any]] = {}
+        unresolved = no_row = 0
+        for iso, country_name, sea_id, sea_name, is_pending, count in rows:
+            if is_pending:
+                no_row += count
+            elif iso is None and sea_id is None:
+                unresolved += count
+            if iso is not None:
+                c = countries.setdefault(iso, {"iso": iso, "name": country_name or iso, "count": 0})
+                c["count"] += count
+            if sea_id is not None:
+                sv = seas.setdefault(sea_id, {"id": sea_id, "name": sea_name or str(sea_id), "count": 0})
+                sv["count"] += count
+        by_count = lambda d: sorted(d.values(), key=lambda x: -x["count"])
+        return {
+            "countries": by_count(countries),
+            "seas": by_count(seas),
+            "unresolved": unresolved,
+            "pending": no_row,
+        }
+
+    def fetch_geojson(self, *, limit: int = 5000, **filters) -> Dict[str, Any]:
+        """Build SQL with expressions, run via session.exec, return FeatureCollection."""
+
+        # statement, select from Earthquake table with conditions, ordered by time;
+        # one extra row tells whether the result was truncated
         stmt = (
             select(Earthquake)
-            .where(and_(*conds))
-            .order_by(Earthquake.time_utc.desc())
-            .limit(limit)
+            .where(and_(*self.conditions(**filters)))
+            .order_by(Earthquake.time_utc.desc(), Earthquake.id.desc())
+            .limit(limit + 1)
         )
 
         # fetch from session
         with get_session() as session:
             rows: List[Earthquake] = session.exec(stmt).all()
 
-        return {"type": "FeatureCollection", "features": [feat(r) for r in rows]}
+        truncated = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "type": "FeatureCollection",
+            "metadata": collection_metadata(len(rows), limit, truncated),
+            "features": [feat(r) for r in rows],
+        }
+
+    def fetch_map_geojson_text(self, *, view: Dict[str, Any], limit: int = 5000, **filters) -> str:
+        """
+        Level of detail for the map: with view["cell_deg"] set, events inside
+        the view are snapped to a grid of that size (ST_SnapToGrid) and each
+        cell becomes one cluster feature per time step (see time_step()) with
+        its count and max magnitude, placed at its members' mean position and
+        timed at its first member, so playback reveals it like an event.
+        When there are more than `limit` clusters the grid is coarsened until
+        they fit, so every event is in some cluster. Views with few events,
+        and views zoomed in far enough that cell_deg is None, get single
+        events.
+        """
+        filters = view_filters(filters, view)
+        if filters is None:
+            return json.dumps(empty_collection(limit))
+
+        cell = view.get("cell_deg")
+        if cell:
+            conds = and_(Earthquake.geom.isnot(None), *self.conditions(**filters))
+            while True:
+                n = func.count()
+                stmt = (
+                    sa_select(
+                        n, func.max(Earthquake.mag), func.avg(Earthquake.lon), func.avg(Earthquake.lat),
+                        func.min(Earthquake.time_utc),
+                        # totals over all clusters, not just the ones returned
+                        func.count().over(), func.sum(n).over(),
+                    )
+                    .where(conds)
+                    .group_by(
+                        func.ST_SnapToGrid(Earthquake.geom, cell),
+                        time_step(Earthquake.time_utc, filters["start_ms"], filters["end_ms"]),
+                    )
+                    .limit(limit)
+                )
+                with get_session() as session:
+                    rows = session.execute(stmt).all()
+                cells, events = (rows[0][5], int(rows[0][6])) if rows else (0, 0)
+                if cells <= limit or cell >= 360:
+                    break
+                # cell count shrinks roughly with the cell area
+                cell *= 2 ** max(1, math.ceil(math.log2(math.sqrt(cells / limit))))
+
+            if events > MAP_RAW_EVENTS:
+                meta = collection_metadata(len(rows), limit, False)
+                meta.update(lod="clusters", cell_deg=cell, events=events, time_steps=MAP_TIME_STEPS)
+                return json.dumps({
+                    "type": "FeatureCollection",
+                    "metadata": meta,
+                    "features": [cluster_feat(*r[:5]) for r in rows],
+                })
+
+        return self.fetch_geojson_text(limit=limit, **filters)
+
+    def iter_columns(self, *, chunk_size: int = CHUNK_EVENTS, **filters) -> Iterator[pd.DataFrame]:
+        """
+        Only the table/histogram columns, read as rows and turned into columns
+        directly. Keyset pagination on (time_utc, id): every chunk is a range
+        scan of quake_time_id_idx continuing below the last row of the
+        previous one, so there is no OFFSET and no cap on the total.
+        """
+        e = Earthquake
+        conds = self.conditions(**filters)
+        names = [c for c in EVENT_COLUMNS if c != "time"]
+        last: Optional[tuple] = None
+        while True:
+            page_conds = list(conds)
+            if last is not None:
+                page_conds.append(tuple_(e.time_utc, e.id) < tuple_(*last))
+            stmt = (
+                sa_select(
+                    cast(func.floor(func.extract("epoch", e.time_utc) * 1000), BigInteger),
+                    cast(e.mag, Float), cast(e.depth_km, Float), e.lon, e.lat,
+                    func.coalesce(e.place, e.title), e.net, func.coalesce(e.tsunami, 0), e.url,
+                    e.time_utc, e.id,
+                )
+                .where(and_(*page_conds))
+                .order_by(e.time_utc.desc(), e.id.desc())
+                .limit(chunk_size)
+            )
+            with get_session() as session:
+                rows = session.execute(stmt).all()
+
+            if not rows:
+                return
+            yield events_frame(dict(zip(names, zip(*(r[:-2] for r in rows)))))
+            if len(rows) < chunk_size:
+                return
+            last = tuple(rows[-1][-2:])
+
+    def fetch_geojson_text(self, *, limit: int = 5000, **filters) -> str:
+        """
+        Fast path: the FeatureCollection is built by Postgres (json_build_object /
+        json_agg) from only the columns the dashboard uses, and returned as one
+        pre-serialized string. Same shape as fetch_geojson(), which stays
+        available for callers that need dicts.
+        """
+        q = (
+            sa_select(
+                Earthquake.time_utc, Earthquake.mag, Earthquake.place, Earthquake.depth_km,
+                Earthquake.lon, Earthquake.lat, Earthquake.tsunami, Earthquake.net,
+                Earthquake.url, Earthquake.title,
+            )
+            .add_columns(func.row_number().over(
+                order_by=(Earthquake.time_utc.desc(), Earthquake.id.desc())
+            ).label("rn"))
+            .where(and_(*self.conditions(**filters)))
+            .order_by(Earthquake.time_utc.desc(), Earthquake.id.desc())
+            # one extra row tells whether the result was truncated
+            .limit(limit + 1)
+            .subquery("q")
+        )
+        in_limit = q.c.rn <= limit
+
+        time_ms = cast(func.floor(func.extract("epoch", q.c.time_utc) * 1000), BigInteger)
+        feature = func.json_build_object(
+            "type", "Feature",
+            "geometry", case(
+                (and_(q.c.lon.isnot(None), q.c.lat.isnot(None)),
+                 func.json_build_object("type", "Point", "coordinates", func.json_build_array(q.c.lon, q.c.lat))),
+                else_=null(),
+            ),
+            "properties", func.json_build_object(
+                "time", func.coalesce(time_ms, 0),
+                "mag", q.c.mag,
+                "place", q.c.place,
+                "depth_km", q.c.depth_km,
+                "lon", q.c.lon,
+                "lat", q.c.lat,
+                "tsunami", func.coalesce(q.c.tsunami, 0),
+                "net", q.c.net,
+                "url", q.c.url,
+                "title", q.c.title,
+            ),
+        )
+        collection = func.json_build_object(
+            "type", "FeatureCollection",
+            "metadata", func.json_build_object(
+                "count", func.count().filter(in_limit),
+                "limit", limit,
+                "truncated", func.count() > limit,
+            ),
+            "features", func.coalesce(
+                func.json_agg(aggregate_order_by(feature, q.c.rn)).filter(in_limit),
+                literal_column("'[]'::json"),
+            ),
+        )
+        # cast to text so the driver hands back the string instead of parsing it
+        stmt = sa_select(cast(collection, Text)).select_from(q)
+
+        with get_session() as session:
+            return session.execute(stmt).scalar_one()
 
 # --- Helper methods ---
+def collection_metadata(count: int, limit: int, truncated: bool) -> Dict[str, Any]:
+    """FeatureCollection 'metadata' member: truncated is True if more events matched than limit."""
+    return {"count": count, "limit": limit, "truncated": truncated}
+
+# fetch_columns() frame, in table order; time is a UTC datetime, time_ms epoch ms
+EVENT_COLUMNS = ["time", "time_ms", "mag", "depth_km", "lon", "lat", "place", "net", "tsunami", "url"]
+
+def events_frame(cols: Dict[str, Any]) -> pd.DataFrame:
+    """fetch_columns() frame from the EVENT_COLUMNS other than time (derived from time_ms)."""
+    df = pd.DataFrame({c: list(cols[c]) for c in EVENT_COLUMNS if c != "time"})
+    for col in ("time_ms", "mag", "depth_km", "lon", "lat"):
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df.insert(0, "time", pd.to_datetime(df["time_ms"], unit="ms", utc=True, errors="coerce"))
+    return df
+
+def take_columns(chunks: Iterable[pd.DataFrame], limit: int) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """The first `limit` rows of iter_columns() chunks plus metadata; reads at most one row past limit."""
+    frames, n = [], 0
+    for chunk in chunks:
+        frames.append(chunk)
+        n += len(chunk)
+        if n > limit:
+            break
+    if not frames:
+        frames = [events_frame({c: [] for c in EVENT_COLUMNS})]
+    df = pd.concat(frames, ignore_index=True)
+    return df.iloc[:limit], collection_metadata(min(n, limit), limit, n > limit)
+
+def empty_collection(limit: int) -> Dict[str, Any]:
+    return {"type": "FeatureCollection", "metadata": collection_metadata(0, limit, False), "features": []}
+
+def split_bbox(bbox: Sequence[float]) -> List[List[float]]:
+    """[w, s, e, n] as boxes within [-180, 180]; w > e crosses the antimeridian and gives two."""
+    w, s, e, n = bbox
+    if w <= e:
+        return [[w, s, e, n]]
+    return [[w, s, 180.0, n], [-180.0, s, e, n]]
+
+def view_filters(filters: Dict[str, Any], view: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    filters restricted to the view's bbox, as bboxes: one box, or two when
+    the view crosses the antimeridian. Each is intersected with the filters'
+    own bbox; None if none of them overlaps it.
+    """
+    bbox = view.get("bbox")
+    if not bbox:
+        return filters
+    boxes = split_bbox(bbox)
+    if filters.get("bbox"):
+        a = filters["bbox"]
+        boxes = [[max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])] for b in boxes]
+        boxes = [b for b in boxes if b[0] <= b[2] and b[1] <= b[3]]
+        if not boxes:
+            return None
+    return dict(filters, bbox=None, bboxes=boxes)
+
+def time_step(ts, start_ms: int, end_ms: int):
+    """SQL: which of MAP_TIME_STEPS equal steps of [start_ms, end_ms] the timestamp ts falls in."""
+    step_ms = max(1, math.ceil((end_ms - start_ms + 1) / MAP_TIME_STEPS))
+    return func.floor((func.extract("epoch", ts) * 1000 - start_ms) / step_ms)
+
+def cluster_feat(count: int, mag_max, lon, lat, first: Optional[datetime]) -> Dict[str, Any]:
+    """
+    Map feature for a grid cluster (one cell, one time step); "mag" is its max
+    magnitude so bubble styling applies, "time" its first member's.
+    """
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [float(lon), float(lat)]},
+        "properties": {
+            "cluster": True,
+            "count": int(count),
+            "mag": float(mag_max) if mag_max is not None else None,
+            "time": to_epoch_ms(first) or 0,
+        },
+    }
+
 def to_epoch_ms(ts: Optional[datetime]) -> Optional[int]:
     return int(ts.timestamp() * 1000) if ts else None
 
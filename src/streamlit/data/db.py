@@ -1,11 +1,29 @@
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from typing import Any, Callable, Dict, Mapping
 import os
+import threading
+import time
+from sqlalchemy.pool import QueuePool
 from sqlmodel import create_engine, Session
 
 # Load environment variables from .env
 load_dotenv()
 
+# Connection pool; the defaults suit one dashboard process with a few sessions.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "4"))
+# seconds to wait for a free connection before giving up
+POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "30"))
+# reconnect connections older than this (firewalls / pgbouncer drop idle ones)
+POOL_RECYCLE_S = int(os.getenv("DB_POOL_RECYCLE_S", "1800"))
+# server-side statement_timeout per connection, 0 = none. Only applied in
+# processes that opt in with use_statement_timeout() (the dashboard), so the
+# ingest worker and maintenance commands reading the same .env are unaffected.
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+
 def build_connection_string() -> str:
     host = os.getenv("POSTGRES_HOST", "localhost")
     port = os.getenv("POSTGRES_PORT", "5432")
@@ -15,13 +33,128 @@ def build_connection_string() -> str:
 
     return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db}"
 
+
+class _PoolStats:
+    """Checkout counters shared by the engine's pool (see pool_stats())."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+
+    def record(self, waited: float, ok: bool) -> None:
+        with self.lock:
+            if ok:
+                self.checkouts += 1
+                self.wait_total_s += waited
+                self.wait_max_s = max(self.wait_max_s, waited)
+            else:
+                self.timeouts += 1
+
+
+_pool_stats = _PoolStats()
+
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            _pool_stats.record(time.perf_counter() - t0, ok=False)
+            raise
+        _pool_stats.record(time.perf_counter() - t0, ok=True)
+        return conn
+
+
 _engine = None
+_engine_lock = threading.Lock()
+_statement_timeout_ms = 0
+
+
+def use_statement_timeout(ms: int = STATEMENT_TIMEOUT_MS) -> None:
+    """
+    Apply a statement_timeout of `ms` (default DB_STATEMENT_TIMEOUT_MS) to this
+    process's connections. Must be called before the engine is created; calling
+    it again with the same value (e.g. on every Streamlit rerun) is a no-op.
+    """
+    global _statement_timeout_ms
+    with _engine_lock:
+        if _engine is not None and ms != _statement_timeout_ms:
+            raise RuntimeError("use_statement_timeout() must be called before the first query")
+        _statement_timeout_ms = ms
+
 
 def get_engine():
     global _engine
-    if _engine is None:
-        _engine = create_engine(build_connection_string(), pool_pre_ping=True)
+    with _engine_lock:
+        if _engine is None:
+            connect_args = {}
+            if _statement_timeout_ms > 0:
+                connect_args["options"] = f"-c statement_timeout={_statement_timeout_ms}"
+            _engine = create_engine(
+                build_connection_string(),
+                poolclass=_TimedQueuePool,
+                pool_pre_ping=True,
+                pool_size=POOL_SIZE,
+                max_overflow=POOL_MAX_OVERFLOW,
+                pool_timeout=POOL_TIMEOUT_S,
+                pool_recycle=POOL_RECYCLE_S,
+                connect_args=connect_args,
+            )
     return _engine
 
 def get_session() -> Session:
-    return Session(get_engine())
\ No newline at end of file
+    return Session(get_engine())
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Pool utilization and checkout wait times since process start."""
+    pool = get_engine().pool
+    capacity = POOL_SIZE + max(POOL_MAX_OVERFLOW, 0)
+    in_use = pool.checkedout()
+    with _pool_stats.lock:
+        n = _pool_stats.checkouts
+        return {
+            "size": POOL_SIZE,
+            "max_overflow": POOL_MAX_OVERFLOW,
+            "in_use": in_use,
+            "idle": pool.checkedin(),
+            "utilization": in_use / capacity if capacity else 0.0,
+            "checkouts": n,
+            "timeouts": _pool_stats.timeouts,
+            "wait_avg_ms": 1000 * _pool_stats.wait_total_s / n if n else 0.0,
+            "wait_max_ms": 1000 * _pool_stats.wait_max_s,
+        }
+
+
+# Threads for run_concurrently(); one per pooled connection is enough, more
+# would only queue on the pool.
+_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="db-query")
+
+
+def run_concurrently(
+    calls: Mapping[str, Callable[[], Any]],
+    return_exceptions: bool = False,
+) -> Dict[str, Any]:
+    """
+    Run independent query functions in parallel, each on its own pooled
+    connection (they must open their own session, e.g. via get_session()).
+    Returns {name: result}. With return_exceptions=True a failing call's
+    exception is returned in its slot instead of being raised, like
+    asyncio.gather.
+    """
+    futures = {name: _executor.submit(fn) for name, fn in calls.items()}
+    results: Dict[str, Any] = {}
+    for name, fut in futures.items():
+        try:
+            results[name] = fut.result()
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results[name] = e
+    return results
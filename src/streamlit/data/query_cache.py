@@ -0,0 +1,135 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+import sys
+import threading
+import time
+
+
+class QueryCache:
+    """
+    Process-wide LRU cache for data source results, shared by all Streamlit
+    sessions.
+
+    - keys are normalized filter tuples (see normalize_filters())
+    - bounded by total payload size; least recently used entries go first
+    - every entry remembers the data version it was computed at; when the
+      source reports a newer version (new ingest), all entries are dropped,
+      and a result computed before the change is not stored afterwards
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, version_ttl_s: float = 2.0):
+        self.max_bytes = max_bytes
+        # how long a looked-up data version is trusted before asking the DB again
+        self.version_ttl_s = version_ttl_s
+        # key -> (value, size, data version it was computed at)
+        self._entries: OrderedDict[Hashable, tuple[Any, int, Any]] = OrderedDict()
+        self._bytes = 0
+        self._version: Any = None
+        self._version_checked = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        version: Optional[Callable[[], Any]] = None,
+    ) -> Any:
+        """Cached compute() for key; version() is the source's current data version."""
+        if version is not None:
+            self._check_version(version)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] == self._version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            computed_at = self._version
+
+        value = compute()
+        size = _size_of(value)
+
+        with self._lock:
+            # an ingest seen while computing: the value may predate it, don't keep it
+            stale = computed_at != self._version
+            if not stale and size <= self.max_bytes and key not in self._entries:
+                self._entries[key] = (value, size, computed_at)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, (_, old_size, _) = self._entries.popitem(last=False)
+                    self._bytes -= old_size
+                    self.evictions += 1
+        return value
+
+    def _check_version(self, version: Callable[[], Any]) -> None:
+        now = time.monotonic()
+        if now - self._version_checked < self.version_ttl_s:
+            return
+        current = version()
+        with self._lock:
+            self._version_checked = now
+            if current != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._bytes = 0
+                self._version = current
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "data_version": self._version,
+            }
+
+
+def _size_of(value: Any) -> int:
+    # results are mostly pre-serialized JSON strings; others are estimated shallowly
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size_of(v) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_size_of(v) for v in value)
+    if hasattr(value, "nbytes"):  # numpy arrays and wrappers around them
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+def normalize_filters(filters: Dict[str, Any]) -> tuple:
+    """Hashable, order-independent form of DataSource.fetch_geojson kwargs."""
+    out = []
+    for k in sorted(filters):
+        v = filters[k]
+        if k == "text_query":
+            v = (v or "").strip().lower()
+        elif k == "networks":
+            v = tuple(sorted({n.strip().lower() for n in v or [] if n.strip()}))
+        elif k in ("countries", "seas"):
+            v = tuple(sorted(set(v or [])))
+        elif isinstance(v, float):
+            v = round(v, 6)
+        elif isinstance(v, (list, tuple)):
+            v = tuple(round(x, 6) if isinstance(x, float) else x for x in v)
+        out.append((k, v))
+    return tuple(out)
+
+
+# shared instance
+query_cache = QueryCache()
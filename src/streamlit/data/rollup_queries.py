@@ -0,0 +1,259 @@
+"""
+Coarse aggregate queries (magnitude bands, time series, map clusters)
+answered from the quake_rollup table instead of raw quake rows. The bands
+and time series are shown next to the event histograms on the main page
+(see utils.utils.rollup_views_for_cfg); map_clusters() serves the map at
+coarse zoom (see utils.utils.fetch_map_geojson_text_for_cfg).
+
+Every function takes the same filter kwargs as
+PostgresORMDataSource.fetch_geojson() (without limit, they cover every
+matching event) and returns a result whose size depends only on the number of
+bands/buckets, never on the number of events.
+
+The time range is split into whole rollup buckets, read from quake_rollup,
+and the partial buckets at both ends, aggregated from quake on the fly. When
+a filter cannot be expressed on the rollups (text, networks, tsunami, bbox,
+countries/seas, a narrowed depth range, fractional magnitude bounds) everything is aggregated
+from quake instead; the result has the same shape either way.
+
+Both parts filter with the same predicates (see _conditions()): magnitude is
+half-open like the bands, [mag_min, mag_max), and the full depth range is no
+depth filter at all, since the rollups count every depth.
+"""
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+import json
+import math
+
+from sqlalchemy import and_, or_, func, union_all, table, column, SmallInteger
+from sqlalchemy import select as sa_select
+
+from data.db import get_session
+from data.data_sources import (
+    MAP_RAW_EVENTS, MAP_TIME_STEPS, PostgresORMDataSource, cluster_feat, collection_metadata, time_step,
+    to_epoch_ms, view_filters,
+)
+from data.query_cache import query_cache, normalize_filters
+from models.models import Earthquake
+from quake.rollups import UNKNOWN_BAND, UNKNOWN_CELL
+
+GRAIN_STEP = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+# ranges at least this long use daily buckets, shorter ones hourly
+DAY_GRAIN_FROM = timedelta(days=14)
+# depth slider range in the sidebar; the rollups have no depth dimension
+FULL_DEPTH = (0.0, 1000.0)
+# rollup cells are 1 degree; coarser map clusters can be built from them
+ROLLUP_CELL_DEG = 1.0
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+quake_rollup = table(
+    "quake_rollup",
+    column("grain"), column("bucket"), column("cell_x"), column("cell_y"), column("mag_band"),
+    column("n"), column("mag_sum"), column("mag_max"), column("tsunami_n"),
+)
+
+
+def choose_grain(start_ms: int, end_ms: int) -> str:
+    return "day" if end_ms - start_ms >= DAY_GRAIN_FROM.total_seconds() * 1000 else "hour"
+
+
+def rollup_applicable(**filters) -> bool:
+    """True if the filters can be answered (in whole buckets) from quake_rollup."""
+    if filters.get("tsunami_only") or (filters.get("text_query") or "").strip() or filters.get("bbox"):
+        return False
+    if any(n.strip() for n in filters.get("networks") or []):
+        return False
+    if filters.get("countries") or filters.get("seas"):
+        return False
+    if filters["depth_min"] > FULL_DEPTH[0] or filters["depth_max"] < FULL_DEPTH[1]:
+        return False
+    # magnitude is only known per band [b, b + 1)
+    return float(filters["mag_min"]).is_integer() and float(filters["mag_max"]).is_integer()
+
+
+def _aligned(start: datetime, end: datetime, grain: str) -> Tuple[datetime, datetime]:
+    """[start of the first whole bucket, end of the last whole bucket) inside [start, end]."""
+    step = GRAIN_STEP[grain]
+    lo = _EPOCH - ((_EPOCH - start) // step) * step  # round up
+    hi = _EPOCH + ((end - _EPOCH) // step) * step    # round down
+    return lo, hi
+
+
+def _conditions(filters: Dict[str, Any]) -> list:
+    """PostgresORMDataSource.conditions() with the magnitude/depth semantics of the rollups."""
+    full_depth = filters["depth_min"] <= FULL_DEPTH[0] and filters["depth_max"] >= FULL_DEPTH[1]
+    conds = PostgresORMDataSource.conditions(**{
+        **filters,
+        "mag_min": None, "mag_max": None,
+        **({"depth_min": None, "depth_max": None} if full_depth else {}),
+    })
+    return conds + [Earthquake.mag >= filters["mag_min"], Earthquake.mag < filters["mag_max"]]
+
+
+def _raw_rollup(grain: str, conds: list):
+    """quake rows matching conds, aggregated like quake.rollups.rollup_select_sql()."""
+    e = Earthquake
+    bucket = func.timezone("UTC", func.date_trunc(grain, func.timezone("UTC", e.time_utc)))
+    cell_x = func.coalesce(func.floor(e.lon).cast(SmallInteger), UNKNOWN_CELL)
+    cell_y = func.coalesce(func.floor(e.lat).cast(SmallInteger), UNKNOWN_CELL)
+    mag_band = func.coalesce(func.floor(e.mag).cast(SmallInteger), UNKNOWN_BAND)
+    return (
+        sa_select(
+            bucket.label("bucket"), cell_x.label("cell_x"), cell_y.label("cell_y"),
+            mag_band.label("mag_band"),
+            func.count().label("n"),
+            func.coalesce(func.sum(e.mag), 0).label("mag_sum"),
+            func.max(e.mag).label("mag_max"),
+            func.count().filter(e.tsunami == 1).label("tsunami_n"),
+        )
+        .where(and_(*conds))
+        .group_by("bucket", "cell_x", "cell_y", "mag_band")
+    )
+
+
+def _source(grain: str, filters: Dict[str, Any]):
+    """Subquery of rollup-shaped rows for the filters: stored buckets + raw remainder."""
+    start = datetime.fromtimestamp(filters["start_ms"] / 1000, tz=timezone.utc)
+    end = datetime.fromtimestamp(filters["end_ms"] / 1000, tz=timezone.utc)
+    conds = _conditions(filters)
+
+    lo, hi = _aligned(start, end, grain)
+    if not (rollup_applicable(**filters) and lo < hi):
+        return _raw_rollup(grain, conds).subquery("src")
+
+    r = quake_rollup.c
+    stored = sa_select(
+        r.bucket, r.cell_x, r.cell_y, r.mag_band, r.n, r.mag_sum, r.mag_max, r.tsunami_n,
+    ).where(
+        r.grain == grain, r.bucket >= lo, r.bucket < hi,
+        r.mag_band >= int(filters["mag_min"]), r.mag_band < int(filters["mag_max"]),
+    )
+    if filters.get("bboxes"):
+        # whole cells touching any of the (map view) boxes
+        stored = stored.where(or_(*(
+            and_(r.cell_x >= math.floor(w), r.cell_x <= math.floor(e),
+                 r.cell_y >= math.floor(so), r.cell_y <= math.floor(n))
+            for w, so, e, n in filters["bboxes"]
+        )))
+    edges = _raw_rollup(grain, conds + [or_(Earthquake.time_utc < lo, Earthquake.time_utc >= hi)])
+    return union_all(stored, edges).subquery("src")
+
+
+def _run(stmt) -> list:
+    with get_session() as session:
+        return session.execute(stmt).all()
+
+
+def _cached(kind: str, compute, filters: Dict[str, Any], *extra) -> Any:
+    key = ("rollup", kind, *extra, normalize_filters(filters))
+    return query_cache.get_or_compute(key, compute, version=PostgresORMDataSource().data_version)
+
+
+def magnitude_bands(**filters) -> List[Dict[str, Any]]:
+    """Event count per whole-magnitude band (band b covers [b, b + 1))."""
+    def compute():
+        src = _source(choose_grain(filters["start_ms"], filters["end_ms"]), filters)
+        rows = _run(
+            sa_select(src.c.mag_band, func.sum(src.c.n))
+            .where(src.c.mag_band != UNKNOWN_BAND)
+            .group_by(src.c.mag_band)
+            .order_by(src.c.mag_band)
+        )
+        return [{"band": b, "count": int(cnt)} for b, cnt in rows]
+    return _cached("mag_bands", compute, filters)
+
+
+def time_series(grain: str | None = None, **filters) -> Dict[str, Any]:
+    """
+    Event count and max magnitude per time bucket, oldest first. grain is
+    'hour' or 'day' (default: chosen from the range length). Empty buckets
+    are included, so there is exactly one entry per bucket in the range.
+    """
+    grain = grain or choose_grain(filters["start_ms"], filters["end_ms"])
+    if grain not in GRAIN_STEP:
+        raise ValueError(f"grain must be one of {sorted(GRAIN_STEP)}")
+
+    def compute():
+        src = _source(grain, filters)
+        rows = _run(
+            sa_select(src.c.bucket, func.sum(src.c.n), func.max(src.c.mag_max))
+            .group_by(src.c.bucket)
+        )
+        by_bucket = {b: (int(cnt), _num(mx)) for b, cnt, mx in rows}
+
+        step = GRAIN_STEP[grain]
+        start = datetime.fromtimestamp(filters["start_ms"] / 1000, tz=timezone.utc)
+        end = datetime.fromtimestamp(filters["end_ms"] / 1000, tz=timezone.utc)
+        bucket = _EPOCH + ((start - _EPOCH) // step) * step
+        buckets = []
+        while bucket <= end:
+            cnt, mx = by_bucket.get(bucket, (0, None))
+            buckets.append({"time": to_epoch_ms(bucket), "count": cnt, "mag_max": mx})
+            bucket += step
+        return {"grain": grain, "buckets": buckets}
+    return _cached("time_series", compute, filters, grain)
+
+
+def map_clusters(view: Dict[str, Any], limit: int = 5000, **filters) -> str | None:
+    """
+    Map payload for a coarse view (see utils.utils.map_view) from the rollups:
+    the 1-degree cells inside the view are merged into view["cell_deg"] cells,
+    coarsened until at most `limit` are left, each placed at the mean of its
+    events' cell centres and split into time steps like the raw clusters
+    (timed at their first bucket). Same clusters FeatureCollection as
+    PostgresORMDataSource.fetch_map_geojson_text(); None when the rollups
+    cannot serve the view (finer cells, filters they cannot express) or it has
+    few enough events to be shown one by one.
+    """
+    cell = view.get("cell_deg")
+    if not cell or cell < ROLLUP_CELL_DEG or not rollup_applicable(**filters):
+        return None
+
+    def compute():
+        in_view = view_filters(filters, view)
+        if in_view is None:
+            return None
+        src = _source(choose_grain(filters["start_ms"], filters["end_ms"]), in_view)
+        # the first bucket may begin before the range; time it at the range start
+        first = func.greatest(src.c.bucket, datetime.fromtimestamp(filters["start_ms"] / 1000, tz=timezone.utc))
+        c = cell
+        while True:
+            n = func.sum(src.c.n)
+            rows = _run(
+                sa_select(
+                    n, func.max(src.c.mag_max),
+                    func.sum(src.c.n * (src.c.cell_x + 0.5)) / n,
+                    func.sum(src.c.n * (src.c.cell_y + 0.5)) / n,
+                    func.min(first),
+                    # totals over all clusters, not just the ones returned
+                    func.count().over(), func.sum(n).over(),
+                )
+                .where(src.c.cell_x != UNKNOWN_CELL)
+                .group_by(
+                    func.floor((src.c.cell_x + 0.5) / c), func.floor((src.c.cell_y + 0.5) / c),
+                    time_step(first, filters["start_ms"], filters["end_ms"]),
+                )
+                .limit(limit)
+            )
+            cells, events = (rows[0][5], int(rows[0][6])) if rows else (0, 0)
+            if cells <= limit or c >= 360:
+                break
+            # cell count shrinks roughly with the cell area
+            c *= 2 ** max(1, math.ceil(math.log2(math.sqrt(cells / limit))))
+
+        if events <= MAP_RAW_EVENTS:
+            return None
+        meta = collection_metadata(len(rows), limit, False)
+        meta.update(lod="clusters", cell_deg=c, events=events, time_steps=MAP_TIME_STEPS)
+        return json.dumps({
+            "type": "FeatureCollection",
+            "metadata": meta,
+            "features": [cluster_feat(*r[:5]) for r in rows],
+        })
+    return _cached("map_clusters", compute, filters, normalize_filters(view), limit)
+
+
+def _num(v) -> float | None:
+    return float(v) if v is not None else None
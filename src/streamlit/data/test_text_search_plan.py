@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+import re
+
+from sqlalchemy import and_, text
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+
+from data.data_sources import PostgresORMDataSource
+from data.db import get_session
+from models.models import Earthquake
+from quake.partitioning import ensure_partitions
+
+# quake is partitioned by month; without a partition there is nothing to scan
+ensure_partitions(datetime.now(timezone.utc), datetime.now(timezone.utc))
+
+# Text filter only, so the plan shows what the text search itself can use.
+conds = PostgresORMDataSource.conditions(
+    start_ms=0,
+    end_ms=4_102_444_800_000,
+    mag_min=-10.0,
+    mag_max=10.0,
+    depth_min=-100.0,
+    depth_max=1000.0,
+    tsunami_only=False,
+    text_query="alaska",
+    networks=[],
+    bbox=None,
+)[-1:]
+
+stmt = select(Earthquake.id).where(and_(*conds))
+sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+with get_session() as session:
+    # on a small table a seq scan is cheaper; disable it to check the index is usable at all
+    session.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = "\n".join(r[0] for r in session.execute(text("EXPLAIN " + sql)))
+    # the partitions' own copies of the trigram indexes carry generated names
+    trgm_indexes = {
+        parent: {parent} | {name for (name,) in session.execute(text("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:parent AS regclass)
+        """), {"parent": parent})}
+        for parent in ("quake_place_trgm_idx", "quake_title_trgm_idx")
+    }
+
+print(plan)
+scanned = set(re.findall(r"Bitmap Index Scan on (\w+)", plan))
+for parent, names in trgm_indexes.items():
+    assert scanned & names, f"text search does not use {parent}"
@@ -18,6 +18,9 @@ class CountrySeaManager:
     Assumes tables are already created by init SQL.
     """
 
+    # app_metadata key holding the source fingerprint of the last fill
+    FINGERPRINT_KEY = "country_sea_sources"
+
     def __init__(self, loader: DataLoader | None = None):
         self.loader = loader or DataLoader()
 
@@ -95,12 +98,42 @@ class CountrySeaManager:
 
         return len(seas_unique)
 
-    def fill_all(self) -> tuple[int, int]:
+    def fill_all(self, force: bool = False) -> tuple[int, int]:
         """
         Fill both country and sea tables.
         Assumes schema was created by init SQL (01_schema.sql).
+
+        Skipped entirely (no file parse, no writes) when the EEZ/GOaS source
+        fingerprint matches the one stored in app_metadata by the last fill.
+        force=True refreshes regardless.
+
         Returns (num_countries_upserted, num_seas_upserted).
         """
+        fingerprint = self.loader.sources_fingerprint()
+        if not force and self._stored_fingerprint() == fingerprint:
+            return 0, 0
+
         c = self.fill_country()
         s = self.fill_sea()
+        self._store_fingerprint(fingerprint)
         return c, s
+
+    def _stored_fingerprint(self) -> str | None:
+        with get_session() as session:
+            return session.execute(
+                text("SELECT value FROM app_metadata WHERE key = :key"),
+                {"key": self.FINGERPRINT_KEY},
+            ).scalar_one_or_none()
+
+    def _store_fingerprint(self, fingerprint: str) -> None:
+        with get_session() as session:
+            session.execute(
+                text("""
+                    INSERT INTO app_metadata (key, value, updated_at)
+                    VALUES (:key, :value, NOW())
+                    ON CONFLICT (key)
+                    DO UPDATE SET value = EXCLUDED.value, updated_at = EXCLUDED.updated_at
+                """),
+                {"key": self.FINGERPRINT_KEY, "value": fingerprint},
+            )
+            session.commit()
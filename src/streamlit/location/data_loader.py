@@ -1,17 +1,33 @@
 from __future__ import annotations
 from pathlib import Path
+from typing import Callable, Sequence
 import glob
+import hashlib
+import threading
 import geopandas as gpd
 import pandas as pd
 
+from location.grid_index import GridIndex
+
+# Process-wide memo: {cache_key: (fingerprint, GeoDataFrame)}.
+# Shared by every DataLoader instance, so repeated loads within one process
+# (CountrySeaManager, LocationManager, ...) return the same frame and spatial index.
+_MEMO: dict[str, tuple[str, gpd.GeoDataFrame]] = {}
+_GRID_MEMO: dict[str, tuple[str, GridIndex]] = {}
+_MEMO_LOCK = threading.Lock()
+
+
 class DataLoader:
-    def __init__(self) -> None:
+    def __init__(self, use_disk_cache: bool = True) -> None:
         # project_root = parent of "src/" (because this file lives in src/)
         self.project_root = Path(__file__).resolve().parents[1]
         self.data_dir = (self.project_root / "data").resolve()
         self.eez_dir = self.data_dir / "EEZ_land_union_v4_202410"
         self.eez_path = self.eez_dir / "EEZ_land_union_v4_202410.shp"
         self.goas_split_dir = self.data_dir / "GOaS_v1_20211214_gpkg" / "split"
+        # preprocessed GeoParquet copies of the source layers
+        self.cache_dir = self.data_dir / ".cache"
+        self.use_disk_cache = use_disk_cache
 
     def _require_exists(self, path: Path, hint: str = "") -> None:
         if not path.exists():
@@ -33,6 +49,15 @@ class DataLoader:
         self._require_exists(self.eez_path, "Expected 'EEZ_land_union_v4_202410.shp' in 'data/eez/'.")
         self._require_shapefile_set(self.eez_path)
 
+        return self._cached("eez_land_union", self._eez_sources(), self._read_eez_land_union)
+
+    def _eez_sources(self) -> list[Path]:
+        return [
+            p for p in (self.eez_path.with_suffix(ext) for ext in (".shp", ".shx", ".dbf", ".prj", ".cpg"))
+            if p.exists()
+        ]
+
+    def _read_eez_land_union(self) -> gpd.GeoDataFrame:
         gdf = gpd.read_file(str(self.eez_path))
         if gdf.crs and gdf.crs.to_epsg() != 4326:
             gdf = gdf.to_crs(4326)
@@ -45,10 +70,16 @@ class DataLoader:
             "Expected GOaS split files under 'data/GOaS_v1_20211214_gpkg/split/'."
         )
 
+        files = self._goas_files()
+        return self._cached("goas", [Path(fp) for fp in files], lambda: self._read_goas(files))
+
+    def _goas_files(self) -> list[str]:
         files = sorted(glob.glob(str(self.goas_split_dir / "*.gpkg")))
         if not files:
             raise FileNotFoundError(f"No '*.gpkg' files found in {self.goas_split_dir}")
+        return files
 
+    def _read_goas(self, files: Sequence[str]) -> gpd.GeoDataFrame:
         # read each .gpkg directly (no layer logic)
         frames = [gpd.read_file(fp) for fp in files]
 
@@ -79,3 +110,144 @@ class DataLoader:
 
     def load_all(self):
         return self.load_eez_land_union(), self.load_goas()
+
+    def load_grid_indexes(self, resolution: float = 0.5) -> tuple[GridIndex, GridIndex]:
+        """
+        Precomputed GridIndex for (EEZ, GOaS), built on first use and stored
+        next to the layer caches. Rebuilt whenever the source files change.
+        """
+        eez_grid = self._cached_grid(
+            "eez_land_union", self._eez_sources(), self.load_eez_land_union, resolution
+        )
+        goas_grid = self._cached_grid(
+            "goas", [Path(fp) for fp in self._goas_files()], self.load_goas, resolution
+        )
+        return eez_grid, goas_grid
+
+    def sources_fingerprint(self) -> str:
+        """Fingerprint over all EEZ + GOaS source files, without parsing them."""
+        return self.source_fingerprint(self._eez_sources() + [Path(fp) for fp in self._goas_files()])
+
+    # --- caching ---
+
+    @staticmethod
+    def source_fingerprint(paths: Sequence[Path]) -> str:
+        """Cheap fingerprint of source files: name, size and mtime of each."""
+        h = hashlib.sha1()
+        for p in sorted(paths):
+            st = p.stat()
+            h.update(f"{p.name}:{st.st_size}:{st.st_mtime_ns};".encode())
+        return h.hexdigest()[:16]
+
+    @staticmethod
+    def clear_memo() -> None:
+        """Drop the process-wide memo (the on-disk cache is left alone)."""
+        with _MEMO_LOCK:
+            _MEMO.clear()
+            _GRID_MEMO.clear()
+
+    def _cached(
+        self,
+        key: str,
+        sources: Sequence[Path],
+        build: Callable[[], gpd.GeoDataFrame],
+    ) -> gpd.GeoDataFrame:
+        """
+        Return the layer `key`, looking in order at:
+          1. the process-wide memo
+          2. the GeoParquet file in cache_dir matching the sources' fingerprint
+          3. build() (the slow path), whose result is then written to disk
+
+        The returned frame is shared; callers must not mutate it in place.
+        """
+        fingerprint = self.source_fingerprint(sources)
+
+        with _MEMO_LOCK:
+            hit = _MEMO.get(key)
+            if hit and hit[0] == fingerprint:
+                return hit[1]
+
+            gdf = self._read_disk_cache(key, fingerprint)
+            if gdf is None:
+                gdf = build()
+                self._write_disk_cache(key, fingerprint, gdf)
+
+            # build the spatial index once, it lives with the memoized frame
+            _ = gdf.sindex
+            _MEMO[key] = (fingerprint, gdf)
+            return gdf
+
+    def _cache_path(self, key: str, fingerprint: str) -> Path:
+        return self.cache_dir / f"{key}-{fingerprint}.parquet"
+
+    def _read_disk_cache(self, key: str, fingerprint: str) -> gpd.GeoDataFrame | None:
+        if not self.use_disk_cache:
+            return None
+        path = self._cache_path(key, fingerprint)
+        if not path.exists():
+            return None
+        try:
+            return gpd.read_parquet(path)
+        except Exception as e:
+            # corrupt file or missing pyarrow -> fall back to the source files
+            print(f"Ignoring geometry cache {path.name}: {e}")
+            return None
+
+    def _write_disk_cache(self, key: str, fingerprint: str, gdf: gpd.GeoDataFrame) -> None:
+        if not self.use_disk_cache:
+            return
+        path = self._cache_path(key, fingerprint)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            gdf.to_parquet(tmp)
+            tmp.replace(path)
+        except Exception as e:
+            print(f"Could not write geometry cache {path.name}: {e}")
+            return
+
+        # drop caches of older source versions
+        for stale in self.cache_dir.glob(f"{key}-*.parquet"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+
+
+    def _cached_grid(
+        self,
+        key: str,
+        sources: Sequence[Path],
+        load_layer: Callable[[], gpd.GeoDataFrame],
+        resolution: float,
+    ) -> GridIndex:
+        """Same lookup order as _cached(), for the GridIndex of a layer."""
+        fingerprint = self.source_fingerprint(sources)
+        grid_key = f"{key}_grid_{resolution:g}"
+        path = self._cache_path(grid_key, fingerprint).with_suffix(".npz")
+
+        with _MEMO_LOCK:
+            hit = _GRID_MEMO.get(grid_key)
+            if hit and hit[0] == fingerprint:
+                return hit[1]
+
+        grid = None
+        if self.use_disk_cache and path.exists():
+            try:
+                grid = GridIndex.load(path)
+            except Exception as e:
+                print(f"Ignoring grid index cache {path.name}: {e}")
+
+        if grid is None:
+            grid = GridIndex.build(load_layer(), resolution)
+            if self.use_disk_cache:
+                try:
+                    self.cache_dir.mkdir(parents=True, exist_ok=True)
+                    grid.save(path)
+                    for stale in self.cache_dir.glob(f"{grid_key}-*.npz"):
+                        if stale != path:
+                            stale.unlink(missing_ok=True)
+                except Exception as e:
+                    print(f"Could not write grid index cache {path.name}: {e}")
+
+        with _MEMO_LOCK:
+            _GRID_MEMO[grid_key] = (fingerprint, grid)
+        return grid
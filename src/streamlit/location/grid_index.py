@@ -0,0 +1,119 @@
+from __future__ import annotations
+from pathlib import Path
+import numpy as np
+import shapely
+import geopandas as gpd
+
+
+def first_hits(n: int, left_idx: np.ndarray, right_idx: np.ndarray) -> np.ndarray:
+    """
+    Reduce the (left, right) pairs of a bulk sindex.query to one hit per left
+    item: the lowest right position, or -1 if the item had no hit at all.
+    """
+    pos = np.full(n, -1, dtype=np.int64)
+    if len(left_idx) == 0:
+        return pos
+    order = np.lexsort((right_idx, left_idx))
+    left_idx, right_idx = left_idx[order], right_idx[order]
+    _, first = np.unique(left_idx, return_index=True)
+    pos[left_idx[first]] = right_idx[first]
+    return pos
+
+
+def classify_boxes(gdf: gpd.GeoDataFrame, boxes: np.ndarray) -> np.ndarray:
+    """
+    Per box: the position of the polygon answering every point inside it,
+    GridIndex.NONE if no polygon touches it, or GridIndex.BOUNDARY otherwise.
+
+    A box is only assigned a polygon if the first (lowest position) polygon
+    intersecting it also covers it, so the answer agrees with the exact
+    "first covering polygon" rule used by LocationResolver.
+    """
+    out = np.full(len(boxes), GridIndex.NONE, dtype=np.int64)
+    if len(boxes) == 0 or len(gdf) == 0:
+        return out
+
+    box_idx, poly_idx = gdf.sindex.query(boxes, predicate="intersects")
+    first = first_hits(len(boxes), box_idx, poly_idx)
+    hit = np.flatnonzero(first >= 0)
+    if len(hit) == 0:
+        return out
+
+    geoms = np.asarray(gdf.geometry.array)
+    covered = shapely.covers(geoms[first[hit]], boxes[hit])
+    out[hit] = np.where(covered, first[hit], GridIndex.BOUNDARY)
+    return out
+
+
+class GridIndex:
+    """
+    Fixed-resolution lat/lon grid over one polygon layer.
+
+    Each cell holds either:
+      - the iloc position of the polygon that answers every point in it
+      - NONE     -> no polygon touches the cell
+      - BOUNDARY -> a polygon edge crosses the cell, use the exact test
+
+    Cells are classified with classify_boxes().
+    """
+
+    NONE = -1
+    BOUNDARY = -2
+
+    def __init__(self, cells: np.ndarray, resolution: float):
+        self.cells = cells
+        self.resolution = float(resolution)
+
+    @classmethod
+    def build(cls, gdf: gpd.GeoDataFrame, resolution: float = 0.5) -> "GridIndex":
+        n_rows = int(round(180 / resolution))
+        n_cols = int(round(360 / resolution))
+        cells = np.full((n_rows, n_cols), cls.NONE, dtype=np.int32)
+
+        lon_edges = -180.0 + resolution * np.arange(n_cols + 1)
+
+        # one bulk query per grid row keeps the box array small
+        for r in range(n_rows):
+            lat0 = -90.0 + r * resolution
+            boxes = shapely.box(lon_edges[:-1], lat0, lon_edges[1:], lat0 + resolution)
+            cells[r] = classify_boxes(gdf, boxes)
+
+        return cls(cells, resolution)
+
+    def lookup(self, lats, lons) -> np.ndarray:
+        """
+        Cell value per point: a polygon position, NONE or BOUNDARY.
+        Non-finite or out-of-range coordinates are reported as BOUNDARY so the
+        caller's exact path decides.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        out = np.full(lats.shape, self.BOUNDARY, dtype=np.int64)
+
+        ok = np.isfinite(lats) & np.isfinite(lons) & (np.abs(lats) <= 90) & (np.abs(lons) <= 180)
+        n_rows, n_cols = self.cells.shape
+        rows = np.minimum(((lats[ok] + 90.0) // self.resolution).astype(np.int64), n_rows - 1)
+        cols = np.minimum(((lons[ok] + 180.0) // self.resolution).astype(np.int64), n_cols - 1)
+        out[ok] = self.cells[rows, cols]
+        return out
+
+    def stats(self) -> dict[str, float]:
+        """Share of cells per class; the interior share is the fast-path hit rate."""
+        total = self.cells.size
+        boundary = int((self.cells == self.BOUNDARY).sum())
+        empty = int((self.cells == self.NONE).sum())
+        return {
+            "interior": (total - boundary - empty) / total,
+            "none": empty / total,
+            "boundary": boundary / total,
+        }
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez_compressed(tmp, cells=self.cells, resolution=self.resolution)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "GridIndex":
+        with np.load(path) as data:
+            return cls(data["cells"], float(data["resolution"]))
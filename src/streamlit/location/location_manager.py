@@ -1,11 +1,20 @@
 from __future__ import annotations
 from typing import Iterable
-import pandas as pd  # (not strictly used right now, so you *can* drop this import)
+import multiprocessing as mp
+import os
+import time
+import numpy as np
 from sqlalchemy import text
 
 from location.data_loader import DataLoader
 from location.location_resolver import LocationResolver
-from data.db import get_session
+from location.postgis_resolver import PostGISLocationResolver
+from location.resolver_cache import CachedLocationResolver
+from data.db import get_session, get_engine
+
+# Resolver used by pool workers. Set in the parent right before forking so
+# children inherit the geometries copy-on-write instead of unpickling them.
+_WORKER_RESOLVER: LocationResolver | None = None
 
 
 class LocationManager:
@@ -22,12 +31,33 @@ class LocationManager:
     - PostGIS + schema were created by init SQL (01_schema.sql).
     """
 
-    def __init__(self, resolver: LocationResolver | None = None):
-        # Build resolver from DataLoader if none provided
-        if resolver is None:
+    def __init__(
+        self,
+        resolver: LocationResolver | None = None,
+        grid_resolution: float | None = 0.5,
+        backend: str = "python",
+        cache_precision: float | None = None,
+    ):
+        # backend: "python" resolves with LocationResolver, "postgis" runs the
+        # whole enrichment inside the database (PostGISLocationResolver).
+        if backend not in ("python", "postgis"):
+            raise ValueError(f"Unknown location backend: {backend!r}")
+        self.backend = backend
+        self.postgis = PostGISLocationResolver() if backend == "postgis" else None
+
+        # Build resolver from DataLoader if none provided.
+        # grid_resolution (degrees) enables the precomputed GridIndex; None = exact tests only.
+        if resolver is None and backend == "python":
             loader = DataLoader()
             eez, goas = loader.load_all()
-            resolver = LocationResolver(eez, goas)
+            eez_grid = goas_grid = None
+            if grid_resolution:
+                eez_grid, goas_grid = loader.load_grid_indexes(grid_resolution)
+            resolver = LocationResolver(eez, goas, eez_grid, goas_grid)
+
+        # cache_precision (degrees) puts a CachedLocationResolver in front; None = no cache
+        if resolver is not None and cache_precision:
+            resolver = CachedLocationResolver(resolver, precision=cache_precision)
         self.resolver = resolver
 
     def upsert_locations_for_quakes(self, quakes: Iterable[object]) -> int:
@@ -40,48 +70,28 @@ class LocationManager:
         Skips quakes missing lat/lon.
         Returns number of rows upserted.
         """
-        records = []
+        ids, lats, lons = [], [], []
         for q in quakes:
             if q.lat is None or q.lon is None:
                 continue
+            ids.append(int(q.id))
+            lats.append(q.lat)
+            lons.append(q.lon)
 
-            resolved = self.resolver.resolve(q.lat, q.lon)
-
-            sea_id = None
-            if resolved and resolved.sea is not None:
-                # resolved.sea is expected to be an integer-like ID into `sea.id`
-                sea_id = int(resolved.sea)
-
-            records.append({
-                "quake_id": int(q.id),
-                "country_iso": (resolved.country if resolved else None),
-                "sea_id": sea_id,
-            })
-
-        if not records:
-            return 0
-
-        with get_session() as session:
-            session.execute(
-                text("""
-                    INSERT INTO location (quake_id, country_iso, sea_id)
-                    VALUES (:quake_id, :country_iso, :sea_id)
-                    ON CONFLICT (quake_id) DO UPDATE
-                    SET country_iso = EXCLUDED.country_iso,
-                        sea_id      = EXCLUDED.sea_id
-                """),
-                records,
-            )
-            session.commit()
+        if self.postgis is not None:
+            return self.postgis.upsert_locations(only_missing=False, quake_ids=ids)
 
-        return len(records)
+        return self._resolve_and_upsert(ids, lats, lons)
 
     def upsert_locations_for_all_quakes(self) -> int:
         """
         Convenience helper:
         - pulls all quakes (id, lat, lon) from DB
-        - runs upsert_locations_for_quakes() on them
+        - resolves them in one batch and upserts into 'location'
         """
+        if self.postgis is not None:
+            return self.postgis.upsert_locations(only_missing=False)
+
         with get_session() as session:
             rows = session.exec(text("""
                 SELECT id, lat, lon
@@ -90,16 +100,195 @@ class LocationManager:
                   AND lon IS NOT NULL
             """)).fetchall()
 
-        # Build lightweight quake-like objects with attributes .id / .lat / .lon
-        class _Q:
-            __slots__ = ("id", "lat", "lon")
+        if not rows:
+            return 0
+
+        ids, lats, lons = zip(*rows)
+        return self._resolve_and_upsert(ids, lats, lons)
+
+    def upsert_locations_for_new_quakes(self) -> tuple[int, int]:
+        """
+        Incremental variant of upsert_locations_for_all_quakes():
+        - anti-joins quake against location, so only quakes without a
+          location row are resolved and written
+        - a revision that moves a quake drops its location row (see
+          quake_loader.bulk_load_into_db), so an existing row never goes stale
+
+        The quakes that already have a row are counted in the same pass over
+        the join, so the report costs no extra query.
+
+        Returns (num_rows_upserted, num_quakes_skipped).
+        """
+        with get_session() as session:
+            skipped, ids, lats, lons = session.exec(text("""
+                SELECT count(*) FILTER (WHERE l.quake_id IS NOT NULL),
+                       array_agg(q.id)  FILTER (WHERE l.quake_id IS NULL),
+                       array_agg(q.lat) FILTER (WHERE l.quake_id IS NULL),
+                       array_agg(q.lon) FILTER (WHERE l.quake_id IS NULL)
+                FROM quake q
+                LEFT JOIN location l ON l.quake_id = q.id
+                WHERE q.lat IS NOT NULL
+                  AND q.lon IS NOT NULL
+            """)).one()
+
+        if not ids:
+            return 0, int(skipped)
+
+        if self.postgis is not None:
+            return self.postgis.upsert_locations(only_missing=False, quake_ids=ids), int(skipped)
+        return self._resolve_and_upsert(ids, lats, lons), int(skipped)
+
+    def _resolve_and_upsert(self, ids, lats, lons) -> int:
+        """Resolve all points with one bulk query per layer, then upsert the results."""
+        if len(ids) == 0:
+            return 0
+
+        seas, countries = self.resolver.resolve_many(
+            np.asarray(lats, dtype=float),
+            np.asarray(lons, dtype=float),
+        )
+
+        records = [
+            {
+                "quake_id": int(qid),
+                "country_iso": iso,
+                # sea is expected to be an integer-like ID into `sea.id`
+                "sea_id": int(sea) if sea is not None else None,
+            }
+            for qid, sea, iso in zip(ids, seas, countries)
+        ]
+
+        return self._write_locations(records)
+
+    @staticmethod
+    def _write_locations(records: list[dict], batch_size: int = 5000) -> int:
+        """Upsert location rows, committing every `batch_size` rows."""
+        with get_session() as session:
+            for i in range(0, len(records), batch_size):
+                session.execute(
+                    text("""
+                        INSERT INTO location (quake_id, country_iso, sea_id)
+                        VALUES (:quake_id, :country_iso, :sea_id)
+                        ON CONFLICT (quake_id) DO UPDATE
+                        SET country_iso = EXCLUDED.country_iso,
+                            sea_id      = EXCLUDED.sea_id
+                    """),
+                    records[i:i + batch_size],
+                )
+                session.commit()
+
+        return len(records)
+
+    def upsert_locations_parallel(
+        self,
+        workers: int | None = None,
+        chunk_size: int = 20_000,
+        only_missing: bool = False,
+    ) -> tuple[int, float]:
+        """
+        Backfill mode: resolve quakes in a process pool.
+
+        - quake ids are split into contiguous chunks of `chunk_size`
+        - each worker selects its id range, resolves it with resolve_many()
+          and upserts the results itself in batches
+        - with the 'fork' start method workers inherit this manager's resolver;
+          otherwise each worker builds one once from the DataLoader cache
+
+        Returns (num_rows_upserted, points_per_second).
+        """
+        global _WORKER_RESOLVER
+
+        if self.resolver is None:
+            raise RuntimeError("Parallel backfill needs the Python backend.")
+
+        workers = workers or os.cpu_count() or 1
+        t0 = time.perf_counter()
+
+        with get_session() as session:
+            ids = session.exec(text(f"""
+                SELECT q.id
+                FROM quake q
+                {_MISSING_JOIN if only_missing else ""}
+                WHERE q.lat IS NOT NULL
+                  AND q.lon IS NOT NULL
+                  {_MISSING_COND if only_missing else ""}
+                ORDER BY q.id
+            """)).scalars().all()
+
+        if not ids:
+            return 0, 0.0
+
+        # [lo, hi] id bounds per chunk
+        ranges = [
+            (ids[i], ids[min(i + chunk_size, len(ids)) - 1], only_missing)
+            for i in range(0, len(ids), chunk_size)
+        ]
+
+        if workers == 1:
+            _WORKER_RESOLVER = self.resolver
+            total = sum(_resolve_id_range(r) for r in ranges)
+        else:
+            use_fork = "fork" in mp.get_all_start_methods()
+            ctx = mp.get_context("fork" if use_fork else None)
+            _WORKER_RESOLVER = self.resolver if use_fork else None
+            # forked children must not reuse the parent's pooled connections
+            get_engine().dispose()
+            with ctx.Pool(processes=workers, initializer=_init_worker) as pool:
+                total = sum(pool.imap_unordered(_resolve_id_range, ranges))
+
+        elapsed = time.perf_counter() - t0
+        rate = total / elapsed if elapsed > 0 else 0.0
+        print(f"Resolved {total} locations in {elapsed:.1f}s ({rate:.0f} points/s, {workers} workers)")
+        return total, rate
+
+
+# --- process pool helpers (module-level so they can be pickled) ---
+
+_MISSING_JOIN = "LEFT JOIN location l ON l.quake_id = q.id"
+_MISSING_COND = "AND l.quake_id IS NULL"
+
+
+def _init_worker() -> None:
+    global _WORKER_RESOLVER
+    # drop connections inherited from the parent; the worker opens its own
+    get_engine().dispose(close=False)
+    if _WORKER_RESOLVER is None:
+        loader = DataLoader()
+        eez, goas = loader.load_all()
+        eez_grid, goas_grid = loader.load_grid_indexes()
+        _WORKER_RESOLVER = LocationResolver(eez, goas, eez_grid, goas_grid)
+
+
+def _resolve_id_range(args: tuple[int, int, bool]) -> int:
+    lo, hi, only_missing = args
+    with get_session() as session:
+        rows = session.execute(
+            text(f"""
+                SELECT q.id, q.lat, q.lon
+                FROM quake q
+                {_MISSING_JOIN if only_missing else ""}
+                WHERE q.id BETWEEN :lo AND :hi
+                  AND q.lat IS NOT NULL
+                  AND q.lon IS NOT NULL
+                  {_MISSING_COND if only_missing else ""}
+            """),
+            {"lo": lo, "hi": hi},
+        ).fetchall()
+
+    if not rows:
+        return 0
+
+    ids, lats, lons = zip(*rows)
+    return LocationManager(_WORKER_RESOLVER)._resolve_and_upsert(ids, lats, lons)
+
+
+if __name__ == "__main__":
+    import argparse
 
-        quakes = []
-        for (qid, qlat, qlon) in rows:
-            q = _Q()
-            q.id = qid
-            q.lat = qlat
-            q.lon = qlon
-            quakes.append(q)
+    parser = argparse.ArgumentParser(description="Parallel backfill of the location table.")
+    parser.add_argument("--workers", type=int, default=None, help="process count (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=20_000)
+    parser.add_argument("--only-missing", action="store_true", help="skip quakes that already have a location")
+    args = parser.parse_args()
 
-        return self.upsert_locations_for_quakes(quakes)
+    LocationManager().upsert_locations_parallel(args.workers, args.chunk_size, args.only_missing)
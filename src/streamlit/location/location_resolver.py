@@ -2,6 +2,9 @@ from dataclasses import dataclass
 from typing import Optional
 from shapely.geometry import Point
 import geopandas as gpd
+import numpy as np
+
+from location.grid_index import GridIndex, first_hits
 
 @dataclass
 class Location:
@@ -9,14 +12,30 @@ class Location:
     country: Optional[str]
 
 class LocationResolver:
-    def __init__(self, eez_land_union: gpd.GeoDataFrame, goas: gpd.GeoDataFrame):
+    def __init__(
+        self,
+        eez_land_union: gpd.GeoDataFrame,
+        goas: gpd.GeoDataFrame,
+        eez_grid: Optional[GridIndex] = None,
+        goas_grid: Optional[GridIndex] = None,
+    ):
         self.eez_land_union = eez_land_union
         self.goas = goas
+        # optional precomputed grids: interior cells skip the polygon test
+        self.eez_grid = eez_grid
+        self.goas_grid = goas_grid
 
     def resolve(self, lat: float, lon: float) -> Optional[Location]:
         return Location(self.resolve_sea(lat, lon), self.resolve_country(lat, lon))
 
     def resolve_sea(self, lat: float, lon: float) -> Optional[str]:
+        if self.goas_grid is not None:
+            cell = int(self.goas_grid.lookup([lat], [lon])[0])
+            if cell == GridIndex.NONE:
+                return None
+            if cell >= 0:
+                return self.goas.index[cell]
+
         pt = Point(lon, lat)
         candidates = self.goas.sindex.query(pt)
         if len(candidates) == 0:
@@ -29,6 +48,13 @@ class LocationResolver:
 
     def resolve_country(self, lat: float, lon: float) -> Optional[str]:
         try:
+            if self.eez_grid is not None:
+                cell = int(self.eez_grid.lookup([lat], [lon])[0])
+                if cell == GridIndex.NONE:
+                    return None
+                if cell >= 0:
+                    return self.eez_land_union.iloc[cell].get("ISO_SOV1")
+
             pt = Point(lon, lat)
             candidates = self.eez_land_union.sindex.query(pt)
             if len(candidates) == 0:
@@ -40,3 +66,67 @@ class LocationResolver:
             return row.get("ISO_SOV1")
         except Exception:
             return None
+
+    # --- bulk resolution ---
+
+    def resolve_many(self, lats, lons) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized counterpart of resolve() for many points at once.
+
+        Takes array-likes of latitudes/longitudes (same length) and returns
+        (seas, countries) as object arrays aligned with the input, holding
+        None where a point is not covered by any polygon.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        if lats.shape != lons.shape:
+            raise ValueError("lats and lons must have the same shape.")
+
+        sea_pos = self._positions(self.goas, self.goas_grid, lats, lons)
+        country_pos = self._positions(self.eez_land_union, self.eez_grid, lats, lons)
+
+        seas = self._take(self.goas.index.to_numpy(), sea_pos)
+        if "ISO_SOV1" in self.eez_land_union.columns:
+            countries = self._take(self.eez_land_union["ISO_SOV1"].to_numpy(), country_pos)
+        else:
+            countries = np.full(len(lats), None, dtype=object)
+        return seas, countries
+
+    @classmethod
+    def _positions(
+        cls,
+        gdf: gpd.GeoDataFrame,
+        grid: Optional[GridIndex],
+        lats: np.ndarray,
+        lons: np.ndarray,
+    ) -> np.ndarray:
+        """Polygon position per point: grid lookup first, exact test only where needed."""
+        if grid is None:
+            return cls._first_covering(gdf, gpd.points_from_xy(lons, lats))
+
+        pos = grid.lookup(lats, lons)
+        exact = pos == GridIndex.BOUNDARY
+        if exact.any():
+            pos[exact] = cls._first_covering(gdf, gpd.points_from_xy(lons[exact], lats[exact]))
+        return pos
+
+    @staticmethod
+    def _first_covering(gdf: gpd.GeoDataFrame, points) -> np.ndarray:
+        """
+        One bulk spatial-index query per layer. Returns, per point, the iloc
+        position of the first polygon covering it (lowest position, matching
+        the single-point path), or -1 if none does.
+        """
+        if len(points) == 0 or len(gdf) == 0:
+            return np.full(len(points), -1, dtype=np.int64)
+
+        # "covered_by" evaluates point.covered_by(polygon) == polygon.covers(point)
+        point_idx, poly_idx = gdf.sindex.query(points, predicate="covered_by")
+        return first_hits(len(points), point_idx, poly_idx)
+
+    @staticmethod
+    def _take(values: np.ndarray, pos: np.ndarray) -> np.ndarray:
+        out = np.full(len(pos), None, dtype=object)
+        hit = pos >= 0
+        out[hit] = values[pos[hit]]
+        return out
@@ -0,0 +1,190 @@
+from __future__ import annotations
+from typing import Sequence
+import numpy as np
+from sqlalchemy import text
+
+from location.data_loader import DataLoader
+from location.location_resolver import LocationResolver
+from data.db import get_session
+
+# Subdivided polygon parts used by the in-database resolver.
+# src_pos keeps the row position in the source layer, so "first covering
+# polygon" means the same thing here as in LocationResolver.
+_LOAD_EEZ = """
+    INSERT INTO eez_part (src_pos, iso, geom)
+    SELECT :src_pos, :iso, ST_Subdivide(g, :max_vertices)
+    FROM (
+        SELECT ST_MakeValid(ST_SetSRID(ST_GeomFromWKB(decode(:wkb, 'hex')), 4326)) AS g
+    ) s
+"""
+
+_LOAD_GOAS = """
+    INSERT INTO goas_part (src_pos, sea_id, geom)
+    SELECT :src_pos, :sea_id, ST_Subdivide(g, :max_vertices)
+    FROM (
+        SELECT ST_MakeValid(ST_SetSRID(ST_GeomFromWKB(decode(:wkb, 'hex')), 4326)) AS g
+    ) s
+"""
+
+# (quake_id, country_iso, sea_id) for the quakes in `source`
+_RESOLVE_SELECT = """
+    SELECT q.id, e.iso, g.sea_id
+    FROM {source}
+    LEFT JOIN LATERAL (
+        SELECT iso FROM eez_part
+        WHERE ST_Covers(eez_part.geom, q.geom)
+        ORDER BY src_pos
+        LIMIT 1
+    ) e ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT sea_id FROM goas_part
+        WHERE ST_Covers(goas_part.geom, q.geom)
+        ORDER BY src_pos
+        LIMIT 1
+    ) g ON TRUE
+"""
+
+
+class PostGISLocationResolver:
+    """
+    Resolves quake locations inside Postgres instead of in Python.
+
+    EEZ and GOaS polygons are loaded once into eez_part / goas_part
+    (ST_Subdivide'd, GiST-indexed, see 01_schema.sql), after which 'location'
+    is filled by one INSERT ... SELECT ... ST_Covers over the quake table.
+    """
+
+    def __init__(self, loader: DataLoader | None = None, max_vertices: int = 256):
+        self.loader = loader or DataLoader()
+        self.max_vertices = max_vertices
+
+    def polygons_loaded(self) -> bool:
+        with get_session() as session:
+            return bool(session.exec(text("""
+                SELECT EXISTS (SELECT 1 FROM eez_part)
+                   AND EXISTS (SELECT 1 FROM goas_part)
+            """)).scalar_one())
+
+    def load_polygons(self, force: bool = False) -> tuple[int, int]:
+        """
+        Copy EEZ/GOaS polygons into the subdivided part tables.
+        No-op if they are already populated, unless force=True.
+        Returns (num_eez_parts, num_goas_parts).
+        """
+        if not force and self.polygons_loaded():
+            return self._part_counts()
+
+        eez = self.loader.load_eez_land_union()
+        goas = self.loader.load_goas()
+
+        eez_rows = [
+            {"src_pos": pos, "iso": iso, "wkb": geom.wkb_hex, "max_vertices": self.max_vertices}
+            for pos, (iso, geom) in enumerate(zip(eez["ISO_SOV1"], eez.geometry))
+            if geom is not None
+        ]
+        goas_rows = [
+            {"src_pos": pos, "sea_id": int(sea_id), "wkb": geom.wkb_hex, "max_vertices": self.max_vertices}
+            for pos, (sea_id, geom) in enumerate(zip(goas.index, goas.geometry))
+            if geom is not None
+        ]
+
+        with get_session() as session:
+            session.execute(text("TRUNCATE eez_part, goas_part"))
+            session.execute(text(_LOAD_EEZ), eez_rows)
+            session.execute(text(_LOAD_GOAS), goas_rows)
+            session.execute(text("ANALYZE eez_part"))
+            session.execute(text("ANALYZE goas_part"))
+            session.commit()
+
+        return self._part_counts()
+
+    def _part_counts(self) -> tuple[int, int]:
+        with get_session() as session:
+            return (
+                session.exec(text("SELECT COUNT(*) FROM eez_part")).scalar_one(),
+                session.exec(text("SELECT COUNT(*) FROM goas_part")).scalar_one(),
+            )
+
+    def upsert_locations(self, only_missing: bool = True, quake_ids: Sequence[int] | None = None) -> int:
+        """
+        Fill 'location' with one set-based statement.
+        only_missing=True restricts it to quakes without a location row,
+        quake_ids (if given) to those quakes.
+        Returns number of rows upserted.
+        """
+        self.load_polygons()
+
+        conds, params = [], {}
+        if only_missing:
+            conds.append("NOT EXISTS (SELECT 1 FROM location l WHERE l.quake_id = quake.id)")
+        if quake_ids is not None:
+            if len(quake_ids) == 0:
+                return 0
+            conds.append("quake.id = ANY(:ids)")
+            params["ids"] = [int(i) for i in quake_ids]
+
+        source = "quake q"
+        if conds:
+            source = f"(SELECT quake.* FROM quake WHERE {' AND '.join(conds)}) q"
+
+        with get_session() as session:
+            result = session.execute(text(f"""
+                INSERT INTO location (quake_id, country_iso, sea_id)
+                {_RESOLVE_SELECT.format(source=source)}
+                WHERE q.geom IS NOT NULL
+                ON CONFLICT (quake_id) DO UPDATE
+                SET country_iso = EXCLUDED.country_iso,
+                    sea_id      = EXCLUDED.sea_id
+            """), params)
+            session.commit()
+            return result.rowcount
+
+    def compare_with(self, resolver: LocationResolver, sample_size: int = 5000) -> list[tuple]:
+        """
+        Parity check against the Python resolver on a random sample of quakes.
+        Returns [(quake_id, lat, lon, (db_iso, db_sea), (py_iso, py_sea)), ...]
+        for every disagreement.
+        """
+        self.load_polygons()
+
+        sample = """(
+            SELECT * FROM quake
+            WHERE geom IS NOT NULL
+            ORDER BY random()
+            LIMIT :n
+        ) q"""
+        with get_session() as session:
+            rows = session.execute(
+                text(f"""
+                    SELECT r.id, r.iso, r.sea_id, qq.lat, qq.lon
+                    FROM ({_RESOLVE_SELECT.format(source=sample)}) r
+                    JOIN quake qq ON qq.id = r.id
+                """),
+                {"n": sample_size},
+            ).fetchall()
+
+        if not rows:
+            return []
+
+        lats = np.array([r[3] for r in rows], dtype=float)
+        lons = np.array([r[4] for r in rows], dtype=float)
+        seas, countries = resolver.resolve_many(lats, lons)
+
+        mismatches = []
+        for (qid, db_iso, db_sea, lat, lon), py_sea, py_iso in zip(rows, seas, countries):
+            py_sea = int(py_sea) if py_sea is not None else None
+            if (db_iso, db_sea) != (py_iso, py_sea):
+                mismatches.append((qid, lat, lon, (db_iso, db_sea), (py_iso, py_sea)))
+
+        print(f"PostGIS vs Python resolver: {len(mismatches)} mismatches out of {len(rows)} quakes")
+        return mismatches
+
+
+if __name__ == "__main__":
+    # parity check: python -m location.postgis_resolver
+    loader = DataLoader()
+    eez, goas = loader.load_all()
+    db_resolver = PostGISLocationResolver(loader)
+    print(f"Polygon parts (eez, goas): {db_resolver.load_polygons()}")
+    for m in db_resolver.compare_with(LocationResolver(eez, goas))[:20]:
+        print(m)
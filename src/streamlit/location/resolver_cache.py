@@ -0,0 +1,162 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Optional
+import threading
+import numpy as np
+import shapely
+import geopandas as gpd
+
+from location.grid_index import GridIndex, classify_boxes
+from location.location_resolver import Location, LocationResolver
+
+
+class _LRU:
+    """Minimal bounded LRU map with hit/miss/eviction counters."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.data: OrderedDict[int, int] = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: int) -> Optional[int]:
+        value = self.data.get(key)
+        if value is not None:
+            self.data.move_to_end(key)
+        return value
+
+    def put(self, key: int, value: int) -> None:
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_entries:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+
+class CachedLocationResolver:
+    """
+    Memoizing front for LocationResolver, keyed on coordinates snapped to
+    `precision` degrees (0.01 deg ~ 1 km).
+
+    What gets cached is the classification of each snapped cell, not the
+    result of the first point that landed in it:
+      - cells fully inside one polygon (or touching none) answer from cache
+      - cells crossed by a polygon edge are remembered as BOUNDARY and their
+        points always go to the exact test
+    so results are identical to the wrapped resolver.
+
+    Drop-in for LocationResolver: resolve(), resolve_sea(), resolve_country()
+    and resolve_many() behave the same.
+    """
+
+    def __init__(self, resolver: LocationResolver, precision: float = 0.01, max_entries: int = 200_000):
+        self.resolver = resolver
+        self.precision = float(precision)
+        self.n_cols = int(round(360 / self.precision))
+        self.n_rows = int(round(180 / self.precision))
+        # one LRU per layer, shared budget
+        self._caches = {"goas": _LRU(max_entries // 2), "eez": _LRU(max_entries // 2)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    # --- LocationResolver API ---
+
+    def resolve(self, lat: float, lon: float) -> Optional[Location]:
+        seas, countries = self.resolve_many([lat], [lon])
+        return Location(seas[0], countries[0])
+
+    def resolve_sea(self, lat: float, lon: float) -> Optional[str]:
+        return self.resolve(lat, lon).sea
+
+    def resolve_country(self, lat: float, lon: float) -> Optional[str]:
+        return self.resolve(lat, lon).country
+
+    def resolve_many(self, lats, lons) -> tuple[np.ndarray, np.ndarray]:
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        if lats.shape != lons.shape:
+            raise ValueError("lats and lons must have the same shape.")
+
+        r = self.resolver
+        sea_pos = self._positions("goas", r.goas, r.goas_grid, lats, lons)
+        country_pos = self._positions("eez", r.eez_land_union, r.eez_grid, lats, lons)
+
+        seas = r._take(r.goas.index.to_numpy(), sea_pos)
+        if "ISO_SOV1" in r.eez_land_union.columns:
+            countries = r._take(r.eez_land_union["ISO_SOV1"].to_numpy(), country_pos)
+        else:
+            countries = np.full(len(lats), None, dtype=object)
+        return seas, countries
+
+    # --- stats ---
+
+    def stats(self) -> dict[str, int]:
+        """Counters are per point and per layer (one point = two lookups)."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": sum(c.evictions for c in self._caches.values()),
+            "size": sum(len(c.data) for c in self._caches.values()),
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            for c in self._caches.values():
+                c.data.clear()
+
+    # --- internals ---
+
+    def _positions(
+        self,
+        layer: str,
+        gdf: gpd.GeoDataFrame,
+        grid: Optional[GridIndex],
+        lats: np.ndarray,
+        lons: np.ndarray,
+    ) -> np.ndarray:
+        pos = np.full(len(lats), GridIndex.BOUNDARY, dtype=np.int64)
+
+        ok = np.isfinite(lats) & np.isfinite(lons) & (np.abs(lats) <= 90) & (np.abs(lons) <= 180)
+        rows = np.minimum(((lats[ok] + 90.0) // self.precision).astype(np.int64), self.n_rows - 1)
+        cols = np.minimum(((lons[ok] + 180.0) // self.precision).astype(np.int64), self.n_cols - 1)
+        keys, inverse, counts = np.unique(rows * self.n_cols + cols, return_inverse=True, return_counts=True)
+
+        cache = self._caches[layer]
+        cell_values = np.empty(len(keys), dtype=np.int64)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys.tolist()):
+                value = cache.get(key)
+                if value is None:
+                    missing.append(i)
+                else:
+                    cell_values[i] = value
+
+        if missing:
+            missing = np.asarray(missing)
+            r, c = np.divmod(keys[missing], self.n_cols)
+            boxes = shapely.box(
+                -180.0 + c * self.precision, -90.0 + r * self.precision,
+                -180.0 + (c + 1) * self.precision, -90.0 + (r + 1) * self.precision,
+            )
+            cell_values[missing] = classify_boxes(gdf, boxes)
+            with self._lock:
+                for key, value in zip(keys[missing].tolist(), cell_values[missing].tolist()):
+                    cache.put(key, value)
+
+        pos[ok] = cell_values[inverse]
+
+        is_missing = np.zeros(len(keys), dtype=bool)
+        is_missing[missing] = True
+        is_boundary = cell_values == GridIndex.BOUNDARY
+        with self._lock:
+            self.bypassed += int(counts[is_boundary].sum())
+            self.misses += int(counts[is_missing & ~is_boundary].sum())
+            self.hits += int(counts[~is_missing & ~is_boundary].sum())
+
+        exact = pos == GridIndex.BOUNDARY
+        if exact.any():
+            pos[exact] = LocationResolver._positions(gdf, grid, lats[exact], lons[exact])
+        return pos
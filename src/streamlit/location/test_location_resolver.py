@@ -20,3 +20,48 @@ location_resolver = LocationResolver(eez_land_union, goas)
 for lat, lon, note in test_points:
     location = location_resolver.resolve(lat, lon)
     print(f"{note}: {location.country}, {location.sea}")
+
+# --- GridIndex parity: grid-backed resolver must agree with the exact one ---
+import numpy as np
+
+eez_grid, goas_grid = loader.load_grid_indexes(0.5)
+grid_resolver = LocationResolver(eez_land_union, goas, eez_grid, goas_grid)
+print(f"EEZ grid cells: {eez_grid.stats()}")
+print(f"GOaS grid cells: {goas_grid.stats()}")
+
+rng = np.random.default_rng(42)
+n_random = 20_000
+lats = np.concatenate([[p[0] for p in test_points], rng.uniform(-90, 90, n_random)])
+lons = np.concatenate([[p[1] for p in test_points], rng.uniform(-180, 180, n_random)])
+
+exact_seas, exact_countries = location_resolver.resolve_many(lats, lons)
+grid_seas, grid_countries = grid_resolver.resolve_many(lats, lons)
+
+mismatches = [
+    (lat, lon)
+    for lat, lon, es, ec, gs, gc in zip(lats, lons, exact_seas, exact_countries, grid_seas, grid_countries)
+    if es != gs or ec != gc
+]
+print(f"Grid vs exact: {len(mismatches)} mismatches out of {len(lats)} points")
+
+for lat, lon, note in test_points:
+    single = grid_resolver.resolve(lat, lon)
+    expected = location_resolver.resolve(lat, lon)
+    assert (single.sea, single.country) == (expected.sea, expected.country), note
+
+assert not mismatches, mismatches[:10]
+
+# --- EEZ layer without ISO_SOV1: countries come back as None, seas still resolve ---
+from shapely.geometry import box
+import geopandas as gpd
+
+eez_no_iso = gpd.GeoDataFrame({"name": ["square"]}, geometry=[box(-10, -10, 10, 10)], crs="EPSG:4326")
+goas_small = gpd.GeoDataFrame(geometry=[box(-20, -20, 20, 20)], index=["Test Sea"], crs="EPSG:4326")
+no_iso_resolver = LocationResolver(eez_no_iso, goas_small)
+
+seas, countries = no_iso_resolver.resolve_many([0.0, 15.0, 50.0], [0.0, 15.0, 50.0])
+assert list(countries) == [None, None, None], countries
+assert list(seas) == ["Test Sea", "Test Sea", None], seas
+single = no_iso_resolver.resolve(0.0, 0.0)
+assert (single.sea, single.country) == ("Test Sea", None), single
+print("EEZ without ISO_SOV1: ok")
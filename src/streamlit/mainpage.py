@@ -1,19 +1,25 @@
+import pandas as pd
 import streamlit as st
 from sqlalchemy import text
 
-from location.country_sea_manager import CountrySeaManager
-from location.data_loader import DataLoader
-from location.location_manager import LocationManager
-from data.db import get_session
-from quake.quake_loader import load_last_30_days
-from utils.utils import fetch_geojson_for_cfg
+from data.data_sources import PostgresORMDataSource
+from data.db import get_session, pool_stats, run_concurrently, use_statement_timeout
+from data.query_cache import query_cache
+from utils.utils import (
+    fetch_columns_for_cfg, fetch_map_geojson_text_for_cfg, distributions_for_cfg,
+    location_counts_for_cfg, map_view, rollup_views_for_cfg,
+)
 from components.sidebar import render_sidebar_return_config
-from components.map_view import render_map
+from components.map_view import MAP_KEY, render_map
 from components.table import render_table
-from components.histograms import render_mag_hist, render_depth_hist
+from components.histograms import render_mag_hist, render_depth_hist, render_mag_bands, render_time_series
 
 st.set_page_config(page_title="Earthquakes", layout="wide")
 
+# DB_STATEMENT_TIMEOUT_MS is meant for the dashboard only; opt in before the
+# first query (the sidebar already reads from the DB)
+use_statement_timeout()
+
 # Sidebar -> render sidebar and get config
 config = render_sidebar_return_config()
 
@@ -23,49 +29,123 @@ if config.start_dt >= config.end_dt:
     st.stop()
 
 #
-# 1. Make sure we have quake data in the DB
+# 1. Independent queries run in parallel on pooled connections:
+#    - whether any events were loaded (the dashboard only reads; loading +
+#      location enrichment run in quake/ingest_worker.py)
+#    - loaded coverage from data_load_log
+#    - the table columns (from DB if available, else the USGS feed), read as
+#      columns without a GeoJSON round-trip
+#    - histogram inputs over all matching events, streamed in chunks
+#    - the map payload for the viewport the map last reported: clusters at
+#      coarse zoom, single events when zoomed in, nothing outside the view
+#    - matching events per country / sea (location table)
+#    - magnitude bands and time series over all matching events (quake_rollup)
 #
-with get_session() as s:
-    quake_count = s.exec(text("SELECT COUNT(*) FROM quake")).scalar_one()
+def has_quakes() -> bool:
+    """Whether anything was ingested yet; one index probe, cached until the data changes."""
+    def compute():
+        with get_session() as s:
+            return s.exec(text("SELECT EXISTS (SELECT 1 FROM quake)")).scalar_one()
+    return query_cache.get_or_compute(("quake", "exists"), compute, version=PostgresORMDataSource().data_version)
 
-if quake_count == 0:
-    with st.spinner("Loading earthquake data for the last 30 days..."):
-        load_last_30_days()
+def loaded_coverage():
+    with get_session() as s:
+        return s.exec(text("""
+            SELECT MIN(start_time_utc) AT TIME ZONE 'UTC',
+                   MAX(end_time_utc) AT TIME ZONE 'UTC',
+                   MAX(created_at) AT TIME ZONE 'UTC'
+            FROM data_load_log WHERE status = 'success'
+        """)).one()
 
-#
-# 2. Fill lookup tables (country, sea) and enrich quake locations
-#
-try:
-    data_loader = DataLoader()
+view = map_view(st.session_state.get(MAP_KEY))
 
-    country_sea_manager = CountrySeaManager(data_loader)
-    country_sea_manager.fill_all()
+results = run_concurrently(
+    {
+        "has_quakes": has_quakes,
+        "coverage": loaded_coverage,
+        "events": lambda: fetch_columns_for_cfg(config),
+        "dists": lambda: distributions_for_cfg(config),
+        # the map gets the JSON string built by the data source as-is
+        "map_text": lambda: fetch_map_geojson_text_for_cfg(config, view),
+        "location_counts": lambda: location_counts_for_cfg(config),
+        "rollups": lambda: rollup_views_for_cfg(config),
+    },
+    return_exceptions=True,
+)
 
-    location_manager = LocationManager()
-    upserted = location_manager.upsert_locations_for_all_quakes()
-    print(f"Upserted {upserted} location rows.")
+if isinstance(results["has_quakes"], Exception):
+    st.error(f"Database unavailable: {results['has_quakes']}")
+elif not results["has_quakes"]:
+    st.info(
+        "No earthquake data yet. Start the ingest worker from src/streamlit: "
+        "`python -m quake.ingest_worker`"
+    )
 
-except Exception as e:
-    st.error(f"Failed to prepare location / lookup data: {e}")
-    st.stop()
+coverage = results["coverage"]
+if not isinstance(coverage, Exception) and coverage[0] is not None:
+    st.sidebar.caption(
+        f"Loaded: {coverage[0]:%Y-%m-%d} to {coverage[1]:%Y-%m-%d %H:%M} UTC "
+        f"(last load {coverage[2]:%Y-%m-%d %H:%M} UTC)"
+    )
 
 #
-# 3. Fetch geojson for map/table (from DB if available, else HTTP fallback)
+# 2. Results the table, histograms and map depend on
 #
 try:
-    geojson = fetch_geojson_for_cfg(config)
+    for name in ("events", "map_text"):
+        if isinstance(results[name], Exception):
+            raise results[name]
+    events, meta = results["events"]
+    if meta.get("truncated"):
+        st.warning(
+            f"Showing the newest {meta['count']} events only; more match the filters. "
+            "Raise 'Max events' or narrow the time range."
+        )
 except Exception as e:
     st.error(f"Failed to load quake data: {e}")
     st.stop()
 
 # --------------------
-# 4. Render UI components
+# 3. Render UI components
 # --------------------
-render_map(config, geojson)
+render_map(config, results["map_text"], view)
 
 st.subheader("Event Data Table")
-render_table(geojson)
+render_table(events)
 
 st.subheader("Distributions")
-render_mag_hist(geojson)
-render_depth_hist(geojson)
+# binned server-side; the charts only get the bin counts
+dists = results["dists"]
+if isinstance(dists, Exception):
+    st.error(f"Failed to load distributions: {dists}")
+else:
+    render_mag_hist(dists)
+    render_depth_hist(dists)
+
+rollups = results["rollups"]
+if isinstance(rollups, Exception):
+    st.error(f"Failed to load magnitude bands / time series: {rollups}")
+elif rollups is not None:
+    render_time_series(rollups["time_series"])
+    render_mag_bands(rollups["mag_bands"])
+
+location_counts = results["location_counts"]
+if isinstance(location_counts, Exception):
+    st.error(f"Failed to count events by country/sea: {location_counts}")
+elif location_counts is not None:
+    st.subheader("Events by country / sea")
+    c1, c2 = st.columns(2)
+    c1.dataframe(pd.DataFrame(location_counts["countries"], columns=["iso", "name", "count"]),
+                 use_container_width=True, hide_index=True)
+    c2.dataframe(pd.DataFrame(location_counts["seas"], columns=["id", "name", "count"]),
+                 use_container_width=True, hide_index=True)
+    if location_counts["unresolved"]:
+        st.caption(f"{location_counts['unresolved']} matching events are in neither a country nor a sea.")
+    if location_counts["pending"]:
+        st.caption(f"{location_counts['pending']} matching events have not been located yet.")
+
+with st.sidebar.expander("Query cache", expanded=False):
+    st.write(query_cache.stats())
+
+with st.sidebar.expander("DB connection pool", expanded=False):
+    st.write(pool_stats())
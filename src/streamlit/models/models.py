@@ -2,18 +2,24 @@ from __future__ import annotations
 from typing import Optional
 from datetime import datetime
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Index, Column
+from sqlalchemy import Index, Column, text
 from geoalchemy2 import Geometry
 
 class Earthquake(SQLModel, table=True):
     """
-    ORM for: quake
+    ORM for: quake (range-partitioned by month on time_utc, see 01_schema.sql)
     """
     __tablename__ = "quake"
 
     __table_args__ = (
-        Index("quake_time_idx", "time_utc"),
+        Index("quake_time_brin", "time_utc", postgresql_using="brin"),
+        Index("quake_time_id_idx", text("time_utc DESC"), text("id DESC")),
+        Index("quake_usgs_id_idx", "usgs_id"),
         Index("quake_mag_idx", "mag"),
+        Index("quake_place_trgm_idx", "place",
+              postgresql_using="gin", postgresql_ops={"place": "gin_trgm_ops"}),
+        Index("quake_title_trgm_idx", "title",
+              postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
         {"extend_existing": True},
     )
 
@@ -0,0 +1,136 @@
+"""
+Resumable backfill of USGS events over an arbitrary date range.
+
+The range is cut into fixed windows (same cut on every run). Each window is
+loaded and checkpointed in data_load_log with status success/partial/error,
+so a restarted job skips windows that already succeeded and only retries the
+rest. Several windows are processed in parallel.
+
+Run from src/streamlit:
+
+    python -m quake.backfill --start 2015-01-01 --end 2025-01-01 --window-days 7
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+import argparse
+import time
+from sqlalchemy import text
+
+from data.db import get_session
+from quake.partitioning import ensure_partitions
+from quake.quake_loader import MAX_WORKERS, load_range
+
+
+def backfill_windows(start: datetime, end: datetime, window_days: int) -> list[tuple[datetime, datetime]]:
+    """
+    Windows of `window_days` days covering [start, end], each starting where
+    the previous one ends (see quake_loader.plan_windows()).
+    """
+    windows = []
+    curr = start
+    while curr < end:
+        w_end = min(curr + timedelta(days=window_days), end)
+        windows.append((curr, w_end))
+        curr = w_end
+    return windows
+
+
+def completed_windows(start: datetime, end: datetime) -> set[tuple[datetime, datetime]]:
+    """Windows inside [start, end] with a 'success' checkpoint in data_load_log."""
+    with get_session() as session:
+        rows = session.execute(
+            text("""
+                SELECT DISTINCT start_time_utc, end_time_utc
+                FROM data_load_log
+                WHERE status = 'success'
+                  AND start_time_utc >= :start
+                  AND end_time_utc   <= :end
+            """),
+            {"start": start, "end": end},
+        ).fetchall()
+    return {(s, e) for s, e in rows}
+
+
+def run_backfill(
+    start: datetime,
+    end: datetime,
+    window_days: int = 7,
+    workers: int = MAX_WORKERS,
+    retries: int = 2,
+) -> list[tuple[datetime, datetime]]:
+    """
+    Load every window of [start, end] that has no successful checkpoint yet.
+    Failed windows are retried up to `retries` more times within this run.
+    Returns the windows still not successful at the end (empty when done).
+    """
+    windows = backfill_windows(start, end, window_days)
+    done = completed_windows(start, end)
+    todo = [w for w in windows if w not in done]
+    print(f"Backfill {start:%Y-%m-%d} to {end:%Y-%m-%d}: "
+          f"{len(windows)} windows, {len(windows) - len(todo)} already done")
+    if todo:
+        # once for the whole range, before the windows load in parallel
+        ensure_partitions(start, end)
+
+    for attempt in range(retries + 1):
+        if not todo:
+            break
+        if attempt:
+            print(f"Retrying {len(todo)} failed windows (attempt {attempt + 1})")
+            time.sleep(min(60, 5 * 2 ** attempt))
+        todo = _run_windows(todo, workers)
+
+    if todo:
+        print(f"{len(todo)} windows still incomplete, rerun to resume.")
+    return todo
+
+
+def _run_windows(windows: list[tuple[datetime, datetime]], workers: int) -> list[tuple[datetime, datetime]]:
+    """Load windows in parallel with progress/ETA output; returns the failed ones."""
+    failed = []
+    rows_total = 0
+    t0 = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # one request per window at a time, parallelism comes from the pool
+        futures = {pool.submit(load_range, ws, we, 1): (ws, we) for ws, we in windows}
+        for n, fut in enumerate(as_completed(futures), start=1):
+            window = futures[fut]
+            try:
+                rows, status = fut.result()
+            except Exception as e:
+                # load_range logs its own failures; this covers e.g. a lost DB connection
+                print(f"Window {window[0]:%Y-%m-%d} failed: {e}")
+                rows, status = 0, "error"
+            rows_total += rows
+            if status != "success":
+                failed.append(window)
+
+            elapsed = time.monotonic() - t0
+            eta = elapsed / n * (len(windows) - n)
+            print(f"[{n}/{len(windows)}] {window[0]:%Y-%m-%d}: {status}, "
+                  f"{rows_total} rows so far, ETA {timedelta(seconds=int(eta))}")
+
+    return sorted(failed)
+
+
+def _parse_date(s: str) -> datetime:
+    return datetime.fromisoformat(s).replace(tzinfo=timezone.utc)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", type=_parse_date, required=True, help="UTC date, e.g. 2015-01-01")
+    parser.add_argument("--end", type=_parse_date, required=True, help="UTC date; the last window ends there")
+    parser.add_argument("--window-days", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--retries", type=int, default=2)
+    args = parser.parse_args()
+
+    remaining = run_backfill(args.start, args.end, args.window_days, args.workers, args.retries)
+    raise SystemExit(1 if remaining else 0)
+
+
+if __name__ == "__main__":
+    main()
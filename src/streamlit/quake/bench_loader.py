@@ -0,0 +1,89 @@
+"""
+Benchmark: row-at-a-time load_into_db vs COPY-based bulk_load_into_db.
+
+Run from src/streamlit against a scratch database (it inserts and then
+deletes synthetic quakes with usgs_id 'bench-*', recounting the
+quake_rollup buckets they touched):
+
+    python -m quake.bench_loader --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+import time
+from sqlalchemy import text
+
+from data.db import get_session
+from quake.quake_loader import bulk_load_into_db, load_into_db
+from quake.rollups import ROLLUP_GRAINS, rollup_refresh_sql
+
+
+def synthetic_features(n: int, tag: str) -> list[dict]:
+    rnd = random.Random(n)
+    t0 = 1_700_000_000_000
+    return [
+        {
+            "id": f"bench-{tag}-{i}",
+            "properties": {
+                "mag": round(rnd.uniform(0, 8), 2),
+                "place": f"{rnd.randint(1, 100)} km N of Benchville",
+                "time": t0 + i * 1000,
+                "updated": t0 + i * 1000,
+                "url": "https://example.invalid",
+                "detail": "https://example.invalid/detail",
+                "tsunami": 0,
+                "sig": rnd.randint(0, 1000),
+                "magType": "ml",
+                "type": "earthquake",
+                "title": f"M {i % 8} - Benchville",
+                "net": "bx",
+                "code": str(i),
+            },
+            "geometry": {
+                "type": "Point",
+                "coordinates": [rnd.uniform(-180, 180), rnd.uniform(-90, 90), rnd.uniform(0, 700)],
+            },
+        }
+        for i in range(n)
+    ]
+
+
+def cleanup() -> None:
+    """Delete the synthetic quakes and recount the rollup buckets bulk_load_into_db() added them to."""
+    with get_session() as session:
+        session.execute(text("CREATE TEMP TABLE bench_deleted (time_utc timestamptz) ON COMMIT DROP"))
+        session.execute(text("""
+            WITH d AS (DELETE FROM quake WHERE usgs_id LIKE 'bench-%' RETURNING time_utc)
+            INSERT INTO bench_deleted SELECT DISTINCT time_utc FROM d
+        """))
+        for grain in ROLLUP_GRAINS:
+            for stmt in rollup_refresh_sql("bench_deleted", grain):
+                session.execute(text(stmt))
+        session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'executemany s':>14} {'COPY s':>10} {'speedup':>8}")
+    for n in args.sizes:
+        cleanup()
+        feats = synthetic_features(n, "a")
+        t = time.perf_counter()
+        load_into_db(feats)
+        t_exec = time.perf_counter() - t
+
+        cleanup()
+        feats = synthetic_features(n, "b")
+        t = time.perf_counter()
+        inserted, skipped = bulk_load_into_db(feats)
+        t_copy = time.perf_counter() - t
+
+        print(f"{n:>10} {t_exec:>14.2f} {t_copy:>10.2f} {t_exec / t_copy:>7.1f}x"
+              f"   (COPY inserted {inserted}, skipped {skipped})")
+    cleanup()
+
+
+if __name__ == "__main__":
+    main()
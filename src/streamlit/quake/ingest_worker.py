@@ -0,0 +1,105 @@
+"""
+Standalone ingest worker: keeps the database fresh so the dashboard only reads.
+
+Each run (under a Postgres advisory lock, so only one instance ingests at a time):
+  0. creates quake partitions for the coming months
+  1. loads new USGS events since the last successful load (or the last 30 days
+     on an empty database), logged in data_load_log with its status
+  2. refreshes the country/sea lookup tables if their sources changed
+  3. resolves locations for quakes that do not have one yet
+
+Run from src/streamlit:
+
+    python -m quake.ingest_worker              # every INGEST_INTERVAL_S seconds
+    python -m quake.ingest_worker --once
+"""
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+import argparse
+import os
+import time
+from sqlalchemy import text
+
+from data.db import get_engine, get_session
+from location.country_sea_manager import CountrySeaManager
+from location.location_manager import LocationManager
+from quake.partitioning import ensure_upcoming_partitions
+from quake.quake_loader import load_last_30_days, load_range
+
+# Arbitrary app-wide key for pg_try_advisory_lock ("quake" in ASCII).
+INGEST_LOCK_KEY = 0x7175616B65
+INGEST_INTERVAL_S = int(os.getenv("INGEST_INTERVAL_S", "300"))
+# Re-fetch a little before the last loaded end to catch late-arriving events.
+INGEST_OVERLAP = timedelta(minutes=int(os.getenv("INGEST_OVERLAP_MIN", "60")))
+
+
+def last_loaded_until() -> datetime | None:
+    """End of the most recent successful load, or None on an empty log."""
+    with get_session() as session:
+        return session.exec(text("""
+            SELECT MAX(end_time_utc)
+            FROM data_load_log
+            WHERE status = 'success'
+        """)).scalar_one()
+
+
+def ingest() -> None:
+    """One ingest pass, without locking (see run_once())."""
+    created = ensure_upcoming_partitions()
+    if created:
+        print(f"Created {created} quake partitions")
+
+    since = last_loaded_until()
+    if since is None:
+        load_last_30_days()
+    else:
+        end = datetime.now(timezone.utc).replace(microsecond=0)
+        load_range(since - INGEST_OVERLAP, end)
+
+    c, s = CountrySeaManager().fill_all()
+    if c or s:
+        print(f"Refreshed lookups: {c} countries, {s} seas")
+
+    upserted, skipped = LocationManager().upsert_locations_for_new_quakes()
+    print(f"Upserted {upserted} location rows ({skipped} already located, skipped).")
+
+
+def run_once() -> bool:
+    """
+    Run ingest() if no other instance holds the ingest lock.
+    Returns False if another instance is already ingesting.
+    """
+    with get_engine().connect() as conn:
+        got = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": INGEST_LOCK_KEY}).scalar()
+        conn.commit()
+        if not got:
+            print("Another ingest worker holds the lock, skipping this run.")
+            return False
+        try:
+            ingest()
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": INGEST_LOCK_KEY})
+            conn.commit()
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="run a single ingest pass and exit")
+    parser.add_argument("--interval", type=int, default=INGEST_INTERVAL_S, help="seconds between runs")
+    args = parser.parse_args()
+
+    while True:
+        started = time.monotonic()
+        try:
+            run_once()
+        except Exception as e:
+            # keep the worker alive; the failed load is already in data_load_log
+            print(f"Ingest run failed: {e}")
+        if args.once:
+            break
+        time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Monthly range partitions for the quake table (see 01_schema.sql).
+
+    python -m quake.partitioning ensure --months-ahead 2
+    python -m quake.partitioning migrate          # convert an unpartitioned quake table
+
+The migration copies rows in id batches up to a watermark while the old table
+keeps serving reads and writes, then catches up on rows inserted or revised
+past the watermark. Only the last, small catch-up + rename holds a lock
+(writes wait, reads continue). The old table is kept as quake_unpartitioned.
+Loaders work against either layout, so ingest keeps running before and
+during the migration.
+"""
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+import argparse
+from sqlalchemy import text
+
+from data.db import get_engine, get_session
+
+# Same definition as in 01_schema.sql, for databases created before partitioning.
+ENSURE_PARTITIONS_FN = """
+CREATE OR REPLACE FUNCTION ensure_quake_partitions(from_ts timestamptz, to_ts timestamptz)
+RETURNS integer AS $$
+DECLARE
+    -- UTC wall-clock month start; stepping a timestamp (not a timestamptz)
+    -- keeps the session TimeZone and its DST changes out of the arithmetic
+    m       timestamp := date_trunc('month', from_ts AT TIME ZONE 'UTC');
+    created integer := 0;
+    part    text;
+BEGIN
+    -- one creator at a time (key 'qpart'); later callers then find the partitions
+    PERFORM pg_advisory_xact_lock(487216738932);
+    WHILE m AT TIME ZONE 'UTC' <= to_ts LOOP
+        part := format('quake_y%sm%s', to_char(m, 'YYYY'), to_char(m, 'MM'));
+        IF to_regclass(part) IS NULL THEN
+            BEGIN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF quake FOR VALUES FROM (%L) TO (%L)',
+                    part, m AT TIME ZONE 'UTC', (m + interval '1 month') AT TIME ZONE 'UTC'
+                );
+                created := created + 1;
+            EXCEPTION WHEN duplicate_table THEN
+                NULL;  -- created by a caller that did not take the lock
+            END;
+        END IF;
+        m := m + interval '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# (name, definition) of the indexes on the partitioned table
+QUAKE_INDEXES = [
+    ("quake_time_brin", "USING BRIN (time_utc)"),
+    ("quake_time_id_idx", "(time_utc DESC, id DESC)"),
+    ("quake_usgs_id_idx", "(usgs_id)"),
+    ("quake_mag_idx", "(mag)"),
+    ("quake_geom_gix", "USING GIST (geom)"),
+    ("quake_place_trgm_idx", "USING GIN (place gin_trgm_ops)"),
+    ("quake_title_trgm_idx", "USING GIN (title gin_trgm_ops)"),
+]
+
+
+def is_partitioned() -> bool:
+    with get_session() as session:
+        return _is_partitioned(session)
+
+
+def _is_partitioned(session) -> bool:
+    return session.execute(text("SELECT relkind FROM pg_class WHERE oid = 'quake'::regclass")).scalar() == "p"
+
+
+def _utc(dt: datetime) -> datetime:
+    # loaders pass naive UTC datetimes; don't let the session time zone reinterpret them
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def ensure_partitions(start: datetime, end: datetime) -> int:
+    """
+    Create the missing monthly partitions covering [start, end] in a short
+    transaction of its own: creating a partition locks quake until commit, so
+    this must never run inside a loader's merge transaction. Returns number
+    created; 0 (and nothing to do) while quake is not partitioned yet.
+    """
+    with get_session() as session:
+        if not _is_partitioned(session):
+            return 0
+        created = session.execute(
+            text("SELECT ensure_quake_partitions(:start, :end)"),
+            {"start": _utc(start), "end": _utc(end)},
+        ).scalar_one()
+        session.commit()
+    return created
+
+
+def ensure_upcoming_partitions(months_ahead: int = 2) -> int:
+    """Partitions from the current month up to `months_ahead` months ahead."""
+    now = datetime.now(timezone.utc)
+    month = now.month - 1 + months_ahead
+    ahead = now.replace(year=now.year + month // 12, month=month % 12 + 1, day=1)
+    return ensure_partitions(now, ahead)
+
+
+def _create_month_partitions(conn, parent: str, start: datetime, end: datetime) -> None:
+    """Monthly partitions quake_yYYYYmMM of `parent` covering [start, end]."""
+    start, end = _utc(start), _utc(end)
+    m = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while m <= end:
+        nxt = m.replace(year=m.year + m.month // 12, month=m.month % 12 + 1)
+        part = f"quake_y{m:%Y}m{m:%m}"
+        if conn.execute(text("SELECT to_regclass(:p)"), {"p": part}).scalar() is None:
+            conn.execute(
+                text(f"CREATE TABLE {part} PARTITION OF {parent} FOR VALUES FROM (:a) TO (:b)"),
+                {"a": m, "b": nxt},
+            )
+        m = nxt
+
+
+def _watermark(conn) -> tuple:
+    """
+    (max id, max updated_utc) of quake, read under the loaders' merge lock so
+    no merge is in flight: every row at or below the mark is committed.
+    """
+    from quake.quake_loader import MERGE_LOCK_KEY  # quake_loader imports this module
+
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MERGE_LOCK_KEY})
+    mark = conn.execute(text("""
+        SELECT COALESCE(MAX(id), 0), COALESCE(MAX(updated_utc), '-infinity')
+        FROM quake
+    """)).one()
+    conn.commit()
+    return tuple(mark)
+
+
+def _sync_since(conn, mark: tuple) -> int:
+    """
+    Copy into quake_new the rows inserted (id) or revised (updated_utc) after
+    `mark`, replacing their earlier copies, which a revision may have moved to
+    another month. Index lookups only (quake's primary key and
+    quake_updated_mig_idx), so the cost follows what changed, not the table
+    size. Returns rows copied.
+    """
+    changed = """
+        FROM quake q
+        WHERE (q.id > :id OR q.updated_utc > :updated)
+          AND q.time_utc IS NOT NULL
+    """
+    params = {"id": mark[0], "updated": mark[1]}
+    lo, hi = conn.execute(text(f"SELECT MIN(q.time_utc), MAX(q.time_utc) {changed}"), params).one()
+    if lo is None:
+        return 0
+    _create_month_partitions(conn, "quake_new", lo, hi)
+    conn.execute(text(f"DELETE FROM quake_new WHERE id IN (SELECT q.id {changed})"), params)
+    return conn.execute(text(f"INSERT INTO quake_new SELECT q.* {changed}"), params).rowcount
+
+
+def migrate_to_partitioned(batch_size: int = 50_000, catch_up_passes: int = 5) -> None:
+    if is_partitioned():
+        print("quake is already partitioned.")
+        return
+
+    # lets the catch-ups find revised rows without scanning quake; built
+    # without blocking writes, and dropped with quake_unpartitioned
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("CREATE INDEX CONCURRENTLY IF NOT EXISTS quake_updated_mig_idx ON quake (updated_utc)"))
+
+    with get_engine().connect() as conn:
+        min_t, max_t, no_time = conn.execute(text("""
+            SELECT MIN(time_utc), MAX(time_utc), count(*) FILTER (WHERE time_utc IS NULL)
+            FROM quake
+        """)).one()
+        now = datetime.now(timezone.utc)
+        min_t = min(min_t or now, now)
+        max_t = max(max_t or now, now)
+
+        # 1. empty partitioned twin, partitions for all existing data + 2 months.
+        # The partitions get their final names right away; quake itself has
+        # none, so the names are free.
+        conn.execute(text("""
+            CREATE TABLE quake_new (
+                LIKE quake INCLUDING DEFAULTS,
+                PRIMARY KEY (id, time_utc),
+                UNIQUE (usgs_id, time_utc)
+            ) PARTITION BY RANGE (time_utc)
+        """))
+        for name, definition in QUAKE_INDEXES:
+            conn.execute(text(f"CREATE INDEX {name}_new ON quake_new {definition}"))
+        _create_month_partitions(conn, "quake_new", min_t, max_t + timedelta(days=62))
+        conn.commit()
+
+        # 2. bulk copy up to a watermark in id batches, one commit each; quake
+        # stays fully usable
+        mark = _watermark(conn)
+        max_id = mark[0]
+        last = 0
+        while last < max_id:
+            conn.execute(text("""
+                INSERT INTO quake_new
+                SELECT * FROM quake
+                WHERE id > :lo AND id <= :hi AND time_utc IS NOT NULL
+            """), {"lo": last, "hi": last + batch_size})
+            conn.commit()
+            last += batch_size
+            print(f"Copied ids up to {min(last, max_id)} / {max_id}")
+
+        # 3. catch up on what changed since the last watermark without a lock
+        # until little is left, then once more under a write lock and swap;
+        # reads continue throughout, writes only wait for the last delta
+        for _ in range(catch_up_passes):
+            next_mark = _watermark(conn)
+            copied = _sync_since(conn, mark)
+            conn.commit()
+            mark = next_mark
+            print(f"Caught up {copied} rows")
+            if copied < batch_size // 10:
+                break
+        conn.execute(text("LOCK TABLE quake IN EXCLUSIVE MODE"))
+        _sync_since(conn, mark)
+
+        conn.execute(text("ALTER TABLE location DROP CONSTRAINT IF EXISTS location_quake_fk"))
+        conn.execute(text("ALTER TABLE quake RENAME TO quake_unpartitioned"))
+        for name, _ in QUAKE_INDEXES:
+            conn.execute(text(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_old"))
+        conn.execute(text("ALTER INDEX IF EXISTS quake_time_idx RENAME TO quake_time_idx_old"))
+        conn.execute(text("ALTER TABLE quake_new RENAME TO quake"))
+        for name, _ in QUAKE_INDEXES:
+            conn.execute(text(f"ALTER INDEX {name}_new RENAME TO {name}"))
+        conn.execute(text("ALTER SEQUENCE quake_id_seq OWNED BY quake.id"))
+        conn.execute(text(ENSURE_PARTITIONS_FN))
+        conn.commit()
+
+    print("Migrated. Old table kept as quake_unpartitioned; drop it once verified.")
+    if no_time:
+        # time_utc is part of the primary key, so these rows cannot be partitioned
+        print(f"{no_time} rows without time_utc were not copied; they remain in quake_unpartitioned.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_ensure = sub.add_parser("ensure", help="create partitions for the coming months")
+    p_ensure.add_argument("--months-ahead", type=int, default=2)
+    p_migrate = sub.add_parser("migrate", help="convert an unpartitioned quake table")
+    p_migrate.add_argument("--batch-size", type=int, default=50_000)
+    args = parser.parse_args()
+
+    if args.cmd == "ensure":
+        print(f"Created {ensure_upcoming_partitions(args.months_ahead)} partitions")
+    else:
+        migrate_to_partitioned(args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
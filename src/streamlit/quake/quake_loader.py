@@ -1,67 +1,202 @@
 # src/data/quake_loader.py
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from itertools import islice
+from typing import Iterable, Iterator
+import csv
+import io
+import math
+import os
+import threading
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from sqlalchemy import text
-from data.db import get_session
+from data.db import get_session, get_engine
+from quake.partitioning import ensure_partitions
+from quake.rollups import ROLLUP_GRAINS, rollup_refresh_sql, rollup_upsert_sql
 
-USGS_BASE = "https://earthquake.usgs.gov/fdsnws/event/1/query?format=geojson"
+try:
+    import ijson  # incremental JSON parsing; optional, falls back to resp.json()
+except ImportError:
+    ijson = None
 
-def fetch_usgs_batch(start: datetime, end: datetime) -> list[dict]:
-    """Fetch earthquakes between start and end (inclusive). Split recursively on 400 errors."""
-    params = {
-        "starttime": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
-        "endtime": end.strftime("%Y-%m-%dT%H:%M:%SZ"),
-    }
-    url = USGS_BASE
-    try:
-        resp = requests.get(url, params=params, timeout=60)
-        if resp.status_code == 400:
-            # Too many events — split in half recursively
+# FDSN event service; override USGS_FDSN_BASE to point at a local stub server.
+FDSN_BASE = os.getenv("USGS_FDSN_BASE", "https://earthquake.usgs.gov/fdsnws/event/1")
+USGS_BASE = f"{FDSN_BASE}/query?format=geojson"
+USGS_COUNT = f"{FDSN_BASE}/count?format=geojson"
+
+# USGS rejects queries matching more than 20000 events (HTTP 400).
+MAX_EVENTS_PER_REQUEST = 20_000
+# Concurrent requests against USGS; keep it modest, it is a shared public service.
+MAX_WORKERS = int(os.getenv("USGS_MAX_WORKERS", "4"))
+# Windows are not split below this; USGS never has 20000 events in a second.
+ONE_SECOND = timedelta(seconds=1)
+# Rows per staged COPY + commit when streaming a window into the DB.
+CHUNK_ROWS = int(os.getenv("QUAKE_CHUNK_ROWS", "5000"))
+# Transaction-level advisory lock ("qmerge") held while merging into quake:
+# the "usgs_id not stored yet" check is not covered by a unique constraint on
+# the partitioned table, so concurrent loaders must not run it side by side.
+MERGE_LOCK_KEY = 0x716D65726765
+# app_metadata counter of merges that revised stored events
+REVISIONS_KEY = "quake_revisions"
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Process-wide pooled session with retry/backoff on transient errors."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=int(os.getenv("USGS_RETRIES", "4")),
+                backoff_factor=float(os.getenv("USGS_BACKOFF", "1.0")),
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=("GET",),
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=max(MAX_WORKERS, 4))
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _fdsn_time(t: datetime) -> str:
+    # event times are milliseconds; keep them, whole seconds would open gaps between windows
+    return f"{t:%Y-%m-%dT%H:%M:%S}.{t.microsecond // 1000:03d}Z"
+
+
+def _time_params(start: datetime, end: datetime) -> dict:
+    return {"starttime": _fdsn_time(start), "endtime": _fdsn_time(end)}
+
+
+def count_usgs(start: datetime, end: datetime) -> int:
+    """Number of events between start and end, via the cheap FDSN count endpoint."""
+    resp = get_http_session().get(USGS_COUNT, params=_time_params(start, end), timeout=30)
+    resp.raise_for_status()
+    return int(resp.json()["count"])
+
+
+def plan_windows(
+    start: datetime,
+    end: datetime,
+    max_events: int = MAX_EVENTS_PER_REQUEST,
+) -> list[tuple[datetime, datetime]]:
+    """
+    Split [start, end] into windows of at most `max_events` events each,
+    sized from count_usgs() so no full query is ever rejected with 400.
+    Each window starts where the previous one ends: FDSN bounds are
+    inclusive, so an event exactly on a boundary is fetched twice (and
+    stored once), but no instant is left out.
+    """
+    n = count_usgs(start, end)
+    if n <= max_events or end - start <= ONE_SECOND:
+        return [(start, end)]
+
+    # split into enough equal parts for the average to fit with some headroom,
+    # then refine parts that are still too dense (swarms)
+    parts = math.ceil(n / (max_events * 0.8))
+    step = (end - start) / parts
+    windows = []
+    for i in range(parts):
+        w_start = start if i == 0 else windows[-1][1]
+        w_end = end if i == parts - 1 else start + step * (i + 1)
+        if w_start >= w_end:
+            continue
+        windows.extend(plan_windows(w_start, w_end, max_events))
+    return windows
+
+
+def iter_usgs_features(start: datetime, end: datetime) -> Iterator[dict]:
+    """
+    Stream features between start and end (inclusive) while the response
+    downloads, parsed incrementally with ijson. Splits recursively on 400,
+    into halves sharing the midpoint (see plan_windows()).
+    Errors are raised, the caller decides what a failed window means.
+    """
+    resp = get_http_session().get(USGS_BASE, params=_time_params(start, end), timeout=60, stream=True)
+    with resp:
+        if resp.status_code == 400 and end - start > ONE_SECOND:
+            resp.close()
             midpoint = start + (end - start) / 2
-            left = fetch_usgs_batch(start, midpoint)
-            right = fetch_usgs_batch(midpoint + timedelta(seconds=1), end)
-            return left + right
+            yield from iter_usgs_features(start, midpoint)
+            yield from iter_usgs_features(midpoint, end)
+            return
         resp.raise_for_status()
-        data = resp.json()
-        feats = data.get("features", [])
-        return feats
+
+        if ijson is None:
+            yield from resp.json().get("features", [])
+            return
+
+        resp.raw.decode_content = True
+        yield from ijson.items(resp.raw, "features.item", use_float=True)
+
+
+def _plan_or_single(start: datetime, end: datetime) -> list[tuple[datetime, datetime]]:
+    try:
+        return plan_windows(start, end)
     except Exception as e:
-        print(f"Error fetching {start} to {end}: {e}")
-        return []
+        # count endpoint unavailable -> single window, iter_usgs_features bisects on 400
+        print(f"Error counting {start} to {end}: {e}")
+        return [(start, end)]
+
+
+# quake columns filled from a USGS feature, in COPY order (geom is computed in SQL)
+QUAKE_COLUMNS = (
+    "usgs_id", "mag", "place", "time_utc", "updated_utc", "url", "detail_url",
+    "tsunami", "sig", "mag_type", "typ", "title", "net", "code",
+    "depth_km", "lon", "lat",
+)
+
+
+def feature_to_row(f: dict) -> dict:
+    """Map one USGS GeoJSON feature onto the quake columns."""
+    p = f.get("properties", {})
+    g = f.get("geometry", {})
+    coords = g.get("coordinates", [None, None, None])
+
+    return {
+        "usgs_id": f.get("id"),
+        "mag": p.get("mag"),
+        "place": p.get("place"),
+        "time_utc": datetime.utcfromtimestamp(p["time"]/1000.0) if p.get("time") else None,
+        "updated_utc": datetime.utcfromtimestamp(p["updated"]/1000.0) if p.get("updated") else None,
+        "url": p.get("url"),
+        "detail_url": p.get("detail"),
+        "tsunami": p.get("tsunami"),
+        "sig": p.get("sig"),
+        "mag_type": p.get("magType"),
+        "typ": p.get("type"),
+        "title": p.get("title"),
+        "net": p.get("net"),
+        "code": p.get("code"),
+        "depth_km": coords[2],
+        "lon": coords[0],
+        "lat": coords[1],
+    }
+
 
 def load_into_db(records: list[dict]):
-    """Insert GeoJSON features into quake table."""
-    if not records:
+    """
+    Insert GeoJSON features into quake table (row-at-a-time executemany).
+    Kept for benchmarking; does not maintain quake_rollup (see quake.rollups).
+    Features without a time are skipped (time_utc is part of quake's key).
+    """
+    rows = [r for r in (feature_to_row(f) for f in records) if r["time_utc"] is not None]
+    if len(rows) < len(records):
+        print(f"Skipped {len(records) - len(rows)} features without a time")
+    if not rows:
         return 0
 
-    rows = []
-    for f in records:
-        p = f.get("properties", {})
-        g = f.get("geometry", {})
-        coords = g.get("coordinates", [None, None, None])
-
-        rows.append({
-            "usgs_id": f.get("id"),
-            "mag": p.get("mag"),
-            "place": p.get("place"),
-            "time_utc": datetime.utcfromtimestamp(p["time"]/1000.0) if p.get("time") else None,
-            "updated_utc": datetime.utcfromtimestamp(p["updated"]/1000.0) if p.get("updated") else None,
-            "url": p.get("url"),
-            "detail_url": p.get("detail"),
-            "tsunami": p.get("tsunami"),
-            "sig": p.get("sig"),
-            "mag_type": p.get("magType"),
-            "typ": p.get("type"),
-            "title": p.get("title"),
-            "net": p.get("net"),
-            "code": p.get("code"),
-            "depth_km": coords[2],
-            "lon": coords[0],
-            "lat": coords[1],
-        })
+    times = [r["time_utc"] for r in rows]
+    ensure_partitions(min(times), max(times))
 
     with get_session() as session:
+        session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MERGE_LOCK_KEY})
         session.execute(
             text("""
                 INSERT INTO quake (
@@ -69,56 +204,314 @@ def load_into_db(records: list[dict]):
                     tsunami, sig, mag_type, typ, title, net, code,
                     depth_km, lon, lat, geom
                 )
-                VALUES (
+                SELECT
                     :usgs_id, :mag, :place, :time_utc, :updated_utc, :url, :detail_url,
                     :tsunami, :sig, :mag_type, :typ, :title, :net, :code,
                     :depth_km, :lon, :lat,
                     ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)
-                )
-                ON CONFLICT (usgs_id) DO NOTHING
+                WHERE NOT EXISTS (SELECT 1 FROM quake WHERE usgs_id = :usgs_id)
+                ON CONFLICT DO NOTHING
             """),
             rows,
         )
         session.commit()
     return len(rows)
 
-def log_load(start: datetime, end: datetime, rows: int):
+
+class _CsvStream(io.TextIOBase):
+    """
+    File-like view over an iterator of quake rows rendered as CSV, so COPY can
+    pull data in chunks instead of needing the whole payload in memory.
+    """
+
+    def __init__(self, rows: Iterable[dict]):
+        self._rows = iter(rows)
+        self._buf = ""
+        self.count = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        while size < 0 or len(self._buf) + out.tell() < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            writer.writerow([_csv_value(row[c]) for c in QUAKE_COLUMNS])
+            self.count += 1
+        data = self._buf + out.getvalue()
+        if size < 0:
+            self._buf = ""
+            return data
+        self._buf = data[size:]
+        return data[:size]
+
+
+def _csv_value(v):
+    if v is None:
+        return ""  # unquoted empty field == NULL in COPY csv
+    if isinstance(v, datetime):
+        # feature_to_row yields naive UTC; make that explicit for timestamptz
+        return v.isoformat() + "+00:00"
+    return v
+
+
+def bulk_load_into_db(records: Iterable[dict]) -> tuple[int, int]:
+    """
+    Bulk-merge GeoJSON features into quake:
+      1. COPY rows into a temp staging table (streamed, no per-row statements)
+      2. keep the latest revision per usgs_id (highest `updated`)
+      3. UPDATE stored events the batch has a newer revision of
+      4. INSERT ... SELECT the events not stored yet, geom built in SQL
+
+    Returns (rows_inserted, rows_skipped); skipped rows are duplicates
+    (already in quake with the same or a newer revision, or repeated within
+    the batch) or have no time (counted and reported separately, time_utc is
+    part of quake's key). Revised events are reported separately as well.
+
+    The inserted rows are added to quake_rollup in the same statement, so the
+    rollups never disagree with quake; for revised rows, whose old
+    contribution cannot be subtracted (mag_max), the buckets they leave and
+    enter are recomputed (see quake.rollups.rollup_refresh_sql). A revision
+    that moves an event also drops its location row, so it is resolved again.
+
+    Missing monthly partitions for the batch are created first, in their own
+    short transaction (see quake.partitioning.ensure_partitions). quake's
+    unique key is (usgs_id, time_utc) because it is partitioned, so usgs_ids
+    already stored under another time are matched explicitly, under
+    MERGE_LOCK_KEY. The conflict target is left open so the merge works on
+    the partitioned table as well as on one not migrated yet.
+    """
+    cols = ", ".join(QUAKE_COLUMNS)
+    stream = _CsvStream(feature_to_row(f) for f in records)
+
+    conn = get_engine().raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TEMP TABLE quake_stage (
+                usgs_id text, mag numeric, place text,
+                time_utc timestamptz, updated_utc timestamptz,
+                url text, detail_url text, tsunami smallint, sig integer,
+                mag_type text, typ text, title text, net text, code text,
+                depth_km numeric, lon double precision, lat double precision
+            ) ON COMMIT DROP
+        """)
+        cur.copy_expert(f"COPY quake_stage ({cols}) FROM STDIN WITH (FORMAT csv)", stream)
+        cur.execute("""
+            SELECT count(*) FILTER (WHERE time_utc IS NULL), MIN(time_utc), MAX(time_utc)
+            FROM quake_stage
+        """)
+        no_time, t_min, t_max = cur.fetchone()
+        if no_time:
+            print(f"Skipped {no_time} features without a time")
+        if t_min is not None:
+            # separate connection: this transaction has not touched quake yet
+            ensure_partitions(t_min, t_max)
+
+        cur.execute("""
+            CREATE TEMP TABLE quake_src ON COMMIT DROP AS
+            SELECT DISTINCT ON (usgs_id) *
+            FROM quake_stage
+            WHERE time_utc IS NOT NULL AND usgs_id IS NOT NULL
+            ORDER BY usgs_id, updated_utc DESC NULLS LAST
+        """)
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MERGE_LOCK_KEY,))
+
+        # stored events with a newer revision in the batch, as they are now
+        cur.execute("""
+            CREATE TEMP TABLE quake_revised ON COMMIT DROP AS
+            SELECT q.id, q.usgs_id, q.time_utc, q.lon, q.lat
+            FROM quake q
+            JOIN quake_src s ON s.usgs_id = q.usgs_id
+            WHERE s.updated_utc > COALESCE(q.updated_utc, '-infinity')
+        """)
+        revised = cur.rowcount
+        if revised:
+            cur.execute(f"""
+                UPDATE quake q
+                SET {", ".join(f"{c} = s.{c}" for c in QUAKE_COLUMNS if c != "usgs_id")},
+                    geom = ST_SetSRID(ST_MakePoint(s.lon, s.lat), 4326)
+                FROM quake_revised r
+                JOIN quake_src s ON s.usgs_id = r.usgs_id
+                WHERE q.id = r.id AND q.time_utc = r.time_utc
+            """)
+            cur.execute("""
+                DELETE FROM location l
+                USING quake_revised r
+                JOIN quake_src s ON s.usgs_id = r.usgs_id
+                WHERE l.quake_id = r.id
+                  AND (s.lon, s.lat) IS DISTINCT FROM (r.lon, r.lat)
+            """)
+            # revisions keep MAX(id); bump the counter data_version() also watches
+            cur.execute("""
+                INSERT INTO app_metadata (key, value) VALUES (%(key)s, '1')
+                ON CONFLICT (key) DO UPDATE
+                SET value = (app_metadata.value::bigint + 1)::text, updated_at = now()
+            """, {"key": REVISIONS_KEY})
+            print(f"Revised {revised} events")
+
+        # only rows actually inserted (RETURNING) are added to the rollups
+        rollups = ",\n".join(
+            f"rollup_{grain} AS ({rollup_upsert_sql('ins', grain)})" for grain in ROLLUP_GRAINS
+        )
+        cur.execute(f"""
+            WITH ins AS (
+                INSERT INTO quake ({cols}, geom)
+                SELECT {", ".join("s." + c for c in QUAKE_COLUMNS)},
+                       ST_SetSRID(ST_MakePoint(s.lon, s.lat), 4326)
+                FROM quake_src s
+                WHERE NOT EXISTS (SELECT 1 FROM quake q WHERE q.usgs_id = s.usgs_id)
+                ORDER BY s.usgs_id
+                ON CONFLICT DO NOTHING
+                RETURNING time_utc, lon, lat, mag, tsunami
+            ),
+            {rollups}
+            SELECT count(*) FROM ins
+        """)
+        inserted = cur.fetchone()[0]
+
+        if revised:
+            # old and new times of the revised events
+            touched = """(
+                SELECT time_utc FROM quake_revised
+                UNION ALL
+                SELECT s.time_utc FROM quake_src s JOIN quake_revised r ON r.usgs_id = s.usgs_id
+            ) t"""
+            for grain in ROLLUP_GRAINS:
+                for stmt in rollup_refresh_sql(touched, grain):
+                    cur.execute(stmt)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return inserted, stream.count - inserted - revised
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+def stream_load_into_db(features: Iterable[dict], chunk_rows: int = CHUNK_ROWS) -> Iterator[tuple[int, int]]:
+    """
+    Constant-memory load: consumes `features` lazily and bulk-loads them
+    chunk by chunk (one COPY + merge + commit per chunk).
+    Yields (rows_inserted, rows_skipped) after each committed chunk.
+    """
+    for chunk in chunked(features, chunk_rows):
+        yield bulk_load_into_db(chunk)
+
+
+def load_window(start: datetime, end: datetime) -> tuple[int, int, bool]:
+    """
+    Download one window and stream it into the DB: first rows are committed
+    before the download finishes, and memory stays at ~CHUNK_ROWS features.
+    Returns (rows_inserted, rows_skipped, ok) for what was committed;
+    ok is False if the window failed part-way.
+    """
+    inserted = skipped = 0
+    try:
+        for i, s in stream_load_into_db(iter_usgs_features(start, end)):
+            inserted += i
+            skipped += s
+    except Exception as e:
+        print(f"Error loading {start} to {end}: {e}")
+        return inserted, skipped, False
+    return inserted, skipped, True
+
+
+def load_status(rows: int, ok: bool) -> str:
+    """data_load_log.status for a load: success, partial (some rows landed) or error."""
+    if ok:
+        return "success"
+    return "partial" if rows > 0 else "error"
+
+
+def log_load(start: datetime, end: datetime, rows: int, status: str = "success"):
     with get_session() as session:
         session.execute(
             text("""
-                INSERT INTO data_load_log (start_time_utc, end_time_utc, rows_inserted)
-                VALUES (:start_time_utc, :end_time_utc, :rows_inserted)
+                INSERT INTO data_load_log (start_time_utc, end_time_utc, rows_inserted, status)
+                VALUES (:start_time_utc, :end_time_utc, :rows_inserted, :status)
             """),
-            {"start_time_utc": start, "end_time_utc": end, "rows_inserted": rows},
+            {"start_time_utc": start, "end_time_utc": end, "rows_inserted": rows, "status": status},
         )
         session.commit()
 
-def load_last_year():
-    """Run initial load for last 12 months in monthly chunks."""
+
+def load_range(start: datetime, end: datetime, max_workers: int = MAX_WORKERS) -> tuple[int, str]:
+    """
+    Load [start, end]: count-sized windows (see plan_windows()) streamed into
+    the DB concurrently, then one data_load_log entry for the whole range.
+    Returns (rows_inserted, status).
+    """
+    print(f"Fetching {start:%Y-%m-%d %H:%M:%S} to {end:%Y-%m-%d %H:%M:%S}")
+    # all partitions up front, so the concurrent windows never create them
+    ensure_partitions(start, end)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(lambda w: load_window(*w), _plan_or_single(start, end)))
+
+    rows = sum(r[0] for r in results)
+    skipped = sum(r[1] for r in results)
+    status = load_status(rows, all(r[2] for r in results))
+    log_load(start, end, rows, status)
+    print(f"Inserted {rows} rows ({skipped} skipped), status {status}")
+    return rows, status
+
+
+def load_last_year(max_workers: int = MAX_WORKERS):
+    """
+    Run initial load for last 12 months in monthly chunks.
+    Windows are streamed into the DB concurrently; each month is logged
+    once all of its windows are done.
+    """
     end = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     start = end - timedelta(days=365)
 
+    months = []
     curr = start
     while curr < end:
-        month_end = (curr + timedelta(days=32)).replace(day=1) - timedelta(seconds=1)
-        print(f"Fetching {curr:%Y-%m-%d} to {month_end:%Y-%m-%d}")
-        feats = fetch_usgs_batch(curr, month_end)
-        rows = load_into_db(feats)
-        log_load(curr, month_end, rows)
-        print(f"Inserted {rows} rows")
-        curr = month_end + timedelta(seconds=1)
+        # months share their boundary instant, like plan_windows()
+        month_end = (curr + timedelta(days=32)).replace(day=1)
+        months.append((curr, month_end))
+        curr = month_end
 
-def load_last_30_days():
-    """
-    Load quakes for the last 30 days in one request.
-    If USGS returns 400 (too many events), fetch_usgs_batch()
-    will recursively split into smaller ranges as needed.
-    """
+    ensure_partitions(start, end)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # size every month's windows up front (cheap count requests)
+        plans = list(pool.map(lambda m: _plan_or_single(*m), months))
+
+        pending = {m: len(plan) for m, plan in zip(months, plans)}
+        totals = {m: [0, 0, True] for m in months}
+        futures = {
+            pool.submit(load_window, ws, we): m
+            for m, plan in zip(months, plans)
+            for ws, we in plan
+        }
+
+        for fut in as_completed(futures):
+            month = futures[fut]
+            inserted, skipped, ok = fut.result()
+            totals[month][0] += inserted
+            totals[month][1] += skipped
+            totals[month][2] &= ok
+            pending[month] -= 1
+            if pending[month] == 0:
+                m_start, m_end = month
+                rows, skipped, ok = totals[month]
+                status = load_status(rows, ok)
+                log_load(m_start, m_end, rows, status)
+                print(f"Inserted {rows} rows ({skipped} skipped) for {m_start:%Y-%m-%d} to {m_end:%Y-%m-%d}, status {status}")
+
+
+def load_last_30_days(max_workers: int = MAX_WORKERS):
+    """Load quakes for the last 30 days (see load_range())."""
     end = datetime.utcnow().replace(microsecond=0)
     start = end - timedelta(days=30)
-
-    print(f"Fetching {start:%Y-%m-%d %H:%M:%S} to {end:%Y-%m-%d %H:%M:%S}")
-    feats = fetch_usgs_batch(start, end)
-    rows = load_into_db(feats)
-    log_load(start, end, rows)
-    print(f"Inserted {rows} rows total for last 30 days")
\ No newline at end of file
+    return load_range(start, end, max_workers)
@@ -0,0 +1,139 @@
+"""
+Maintenance of the quake_rollup table (see 01_schema.sql).
+
+    python -m quake.rollups rebuild                       # everything
+    python -m quake.rollups rebuild --start 2024-01-01    # from a date on
+
+The bulk loader keeps the rollups current (rollup_upsert_sql() runs in the
+same statement as the insert into quake, rollup_refresh_sql() recounts the
+buckets of revised events), so a rebuild is only needed for
+rows written another way: databases created before the rollups existed,
+load_into_db(), or manual edits. Run it while no loader is active.
+"""
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Optional
+import argparse
+from sqlalchemy import text
+
+from data.db import get_session
+
+ROLLUP_GRAINS = ("hour", "day")
+
+# Sentinels for rows without a position / magnitude (key columns are NOT NULL).
+UNKNOWN_CELL = -999
+UNKNOWN_BAND = -9
+
+
+def rollup_select_sql(source: str, grain: str) -> str:
+    """
+    SELECT producing quake_rollup rows for `grain` from `source`, a table or
+    CTE with quake's time_utc, lon, lat, mag and tsunami columns. Also used by
+    the query layer for the raw fallback, so both agree on buckets and cells.
+    """
+    return f"""
+        SELECT '{grain}' AS grain,
+               date_trunc('{grain}', time_utc AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket,
+               COALESCE(floor(lon)::smallint, {UNKNOWN_CELL}) AS cell_x,
+               COALESCE(floor(lat)::smallint, {UNKNOWN_CELL}) AS cell_y,
+               COALESCE(floor(mag)::smallint, {UNKNOWN_BAND}) AS mag_band,
+               count(*) AS n,
+               COALESCE(sum(mag), 0) AS mag_sum,
+               max(mag) AS mag_max,
+               count(*) FILTER (WHERE tsunami = 1) AS tsunami_n
+        FROM {source}
+        WHERE time_utc IS NOT NULL
+        GROUP BY 2, 3, 4, 5
+    """
+
+
+def rollup_upsert_sql(source: str, grain: str) -> str:
+    """
+    INSERT adding the rows of `source` (newly inserted quakes) to the rollup.
+    Rows are written in key order so concurrent loaders lock them in the same
+    order.
+    """
+    return f"""
+        INSERT INTO quake_rollup (grain, bucket, cell_x, cell_y, mag_band, n, mag_sum, mag_max, tsunami_n)
+        {rollup_select_sql(source, grain)}
+        ORDER BY 2, 3, 4, 5
+        ON CONFLICT (grain, bucket, cell_x, cell_y, mag_band) DO UPDATE SET
+            n         = quake_rollup.n + EXCLUDED.n,
+            mag_sum   = quake_rollup.mag_sum + EXCLUDED.mag_sum,
+            mag_max   = GREATEST(quake_rollup.mag_max, EXCLUDED.mag_max),
+            tsunami_n = quake_rollup.tsunami_n + EXCLUDED.tsunami_n
+    """
+
+
+def rollup_refresh_sql(source: str, grain: str) -> tuple[str, str]:
+    """
+    (DELETE, INSERT) recomputing from quake the whole `grain` buckets that the
+    rows of `source` (a table or subquery with a time_utc column) fall into.
+    Used for revised quakes: their old contribution cannot be subtracted again
+    (mag_max is not invertible), but a bucket is small enough to recount.
+    """
+    buckets = f"""
+        SELECT DISTINCT date_trunc('{grain}', time_utc AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket
+        FROM {source}
+        WHERE time_utc IS NOT NULL
+    """
+    rows = f"""(
+        SELECT q.time_utc, q.lon, q.lat, q.mag, q.tsunami
+        FROM quake q
+        JOIN ({buckets}) b ON q.time_utc >= b.bucket AND q.time_utc < b.bucket + interval '1 {grain}'
+    ) q"""
+    return (
+        f"DELETE FROM quake_rollup WHERE grain = '{grain}' AND bucket IN ({buckets})",
+        f"INSERT INTO quake_rollup (grain, bucket, cell_x, cell_y, mag_band, n, mag_sum, mag_max, tsunami_n) "
+        f"{rollup_select_sql(rows, grain)}",
+    )
+
+
+def rebuild_rollups(start: Optional[datetime] = None) -> int:
+    """
+    Recompute quake_rollup from quake, for all buckets from `start` on
+    (default: everything). Returns the number of rollup rows written.
+    """
+    where = ""
+    params = {}
+    if start is not None:
+        # whole days, so both grains are rebuilt over the same buckets
+        where = "AND time_utc >= date_trunc('day', :start AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'"
+        params["start"] = start
+
+    written = 0
+    with get_session() as session:
+        if start is None:
+            session.execute(text("DELETE FROM quake_rollup"))
+        else:
+            session.execute(
+                text("DELETE FROM quake_rollup WHERE bucket >= date_trunc('day', :start AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'"),
+                params,
+            )
+        source = f"(SELECT time_utc, lon, lat, mag, tsunami FROM quake WHERE TRUE {where}) q"
+        for grain in ROLLUP_GRAINS:
+            written += session.execute(
+                text(f"INSERT INTO quake_rollup (grain, bucket, cell_x, cell_y, mag_band, n, mag_sum, mag_max, tsunami_n) "
+                     f"{rollup_select_sql(source, grain)}"),
+                params,
+            ).rowcount
+        session.commit()
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_rebuild = sub.add_parser("rebuild", help="recompute quake_rollup from quake")
+    p_rebuild.add_argument("--start", type=datetime.fromisoformat, default=None,
+                           help="only rebuild buckets from this UTC date on")
+    args = parser.parse_args()
+
+    start = args.start
+    if start is not None and start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    print(f"Wrote {rebuild_rollups(start)} rollup rows")
+
+
+if __name__ == "__main__":
+    main()
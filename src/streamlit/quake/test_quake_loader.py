@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from sqlalchemy import text
+
+
+def ms(dt: datetime) -> int:
+    return int(dt.timestamp() * 1000)
+
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+T1 = NOW - timedelta(days=2, hours=3)
+T2 = NOW - timedelta(days=20, minutes=7)
+# outside the last 30 days: must not be requested
+T_OLD = NOW - timedelta(days=45)
+
+
+def feature(usgs_id, time, updated, mag, lon, lat, depth):
+    return {
+        "type": "Feature",
+        "id": usgs_id,
+        "properties": {
+            "mag": mag, "place": f"stub place {usgs_id}", "time": time, "updated": updated,
+            "url": f"https://example.invalid/{usgs_id}", "detail": None, "tsunami": 0, "sig": 100,
+            "magType": "ml", "type": "earthquake", "title": f"M {mag} - stub", "net": "zz", "code": usgs_id[2:],
+        },
+        "geometry": {"type": "Point", "coordinates": [lon, lat, depth]},
+    }
+
+
+FEATURES = [
+    feature("zzstub1", ms(T1), ms(T1), 2.5, -150.25, 61.5, 10.0),
+    # newer revision of zzstub1 in the same response: this one must win
+    feature("zzstub1", ms(T1), ms(T1) + 60_000, 2.7, -150.25, 61.5, 12.0),
+    feature("zzstub2", ms(T2), ms(T2), 4.1, 179.9, -18.0, 550.0),
+    feature("zzstub3", ms(T_OLD), ms(T_OLD), 3.0, 10.0, 10.0, 5.0),
+    # no time: skipped, time_utc is part of quake's key
+    feature("zzstub4", None, ms(T2), 1.0, 0.0, 0.0, 5.0),
+]
+STUB_IDS = ["zzstub1", "zzstub2", "zzstub3", "zzstub4"]
+requested = []
+
+
+def in_window(f, query) -> bool:
+    """FDSN semantics: starttime and endtime are both inclusive."""
+    def param(name):
+        return ms(datetime.strptime(query[name][0], "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc))
+    t = f["properties"]["time"]
+    return t is None or param("starttime") <= t <= param("endtime")
+
+
+class StubFDSN(BaseHTTPRequestHandler):
+    """The two FDSN endpoints the loader uses, answering from FEATURES."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        requested.append(url.path)
+        matching = [f for f in FEATURES if in_window(f, query)]
+        if url.path.endswith("/count"):
+            body = {"count": len(matching)}
+        elif url.path.endswith("/query"):
+            body = {"type": "FeatureCollection", "features": matching}
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StubFDSN)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+# read at import, so set it before the loader is imported
+os.environ["USGS_FDSN_BASE"] = f"http://127.0.0.1:{server.server_port}/fdsnws/event/1"
+
+from data.db import get_session
+from quake.quake_loader import load_last_30_days
+from quake.rollups import ROLLUP_GRAINS, rollup_refresh_sql
+
+# recounts the rollup buckets of the stub rows once they are deleted again
+STUB_TIMES = "(SELECT unnest(CAST(:times AS timestamptz[])) AS time_utc) s"
+
+
+def cleanup(log_mark: int):
+    with get_session() as session:
+        session.execute(text("DELETE FROM quake WHERE usgs_id = ANY(:ids)"), {"ids": STUB_IDS})
+        for grain in ROLLUP_GRAINS:
+            for stmt in rollup_refresh_sql(STUB_TIMES, grain):
+                session.execute(text(stmt), {"times": [T1, T2]})
+        session.execute(text("DELETE FROM data_load_log WHERE id > :mark"), {"mark": log_mark})
+        session.commit()
+
+
+with get_session() as session:
+    log_mark = session.execute(text("SELECT COALESCE(MAX(id), 0) FROM data_load_log")).scalar_one()
+
+cleanup(log_mark)
+try:
+    load_last_30_days(max_workers=1)
+    print(f"requests: {requested}")
+    assert any(p.endswith("/count") for p in requested) and any(p.endswith("/query") for p in requested)
+
+    with get_session() as session:
+        stored = session.execute(
+            text("""
+                SELECT usgs_id, mag, time_utc, updated_utc, depth_km, lon, lat,
+                       ST_X(geom), ST_Y(geom), net, code, mag_type
+                FROM quake WHERE usgs_id = ANY(:ids) ORDER BY usgs_id
+            """),
+            {"ids": STUB_IDS},
+        ).all()
+        rollup_n = session.execute(
+            text("""
+                SELECT COALESCE(SUM(n), 0) FROM quake_rollup
+                WHERE grain = 'day' AND bucket = ANY(CAST(:days AS timestamptz[]))
+            """),
+            {"days": [t.replace(hour=0, minute=0, second=0) for t in (T1, T2)]},
+        ).scalar_one()
+        logged = session.execute(
+            text("SELECT rows_inserted, status FROM data_load_log WHERE id > :mark"),
+            {"mark": log_mark},
+        ).all()
+
+    for r in stored:
+        print(tuple(r))
+    assert [r[0] for r in stored] == ["zzstub1", "zzstub2"], "expected the two timed events of the last 30 days"
+
+    s1, s2 = stored
+    assert float(s1[1]) == 2.7 and float(s1[4]) == 12.0, "latest revision of zzstub1 not kept"
+    assert s1[2] == T1 and s1[3] == T1 + timedelta(minutes=1)
+    assert (s1[5], s1[6]) == (-150.25, 61.5) and (s1[7], s1[8]) == (-150.25, 61.5)
+    assert (s1[9], s1[10], s1[11]) == ("zz", "stub1", "ml")
+
+    assert float(s2[1]) == 4.1 and s2[2] == T2 and float(s2[4]) == 550.0
+    assert (s2[7], s2[8]) == (179.9, -18.0)
+
+    assert rollup_n >= 2, "inserted rows missing from quake_rollup"
+    assert logged == [(2, "success")], logged
+    print("OK")
+finally:
+    cleanup(log_mark)
+    server.shutdown()
@@ -0,0 +1,123 @@
+"""
+Stream consumer: reads micro-batches from the local log, writes them to
+quake, enriches them with locations and commits offsets afterwards
+(at-least-once; the DB writes are idempotent).
+
+Run from src/streamlit:
+
+    python -m stream.consumer
+    python -m stream.consumer --from-beginning      # replay the whole log
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import argparse
+import time
+import numpy as np
+from sqlalchemy import text
+
+from data.db import get_session
+from location.location_manager import LocationManager
+from quake.quake_loader import bulk_load_into_db
+from stream.log_broker import LogBroker
+from stream.settings import STREAM_DIR, TOPIC, PARTITIONS, CONSUMER_GROUP
+
+
+@dataclass
+class BatchMetrics:
+    records: int
+    inserted: int
+    seconds: float
+    # produced -> committed to DB
+    latency_p50_ms: float
+    latency_max_ms: float
+    lag_bytes: int
+
+    @property
+    def records_per_s(self) -> float:
+        return self.records / self.seconds if self.seconds > 0 else 0.0
+
+
+class MicroBatchConsumer:
+    def __init__(
+        self,
+        broker: LogBroker,
+        group: str = CONSUMER_GROUP,
+        max_batch: int = 5000,
+        location_manager: LocationManager | None = None,
+    ):
+        self.broker = broker
+        self.group = group
+        self.max_batch = max_batch
+        self.location_manager = location_manager or LocationManager()
+
+    def poll_batch(self) -> BatchMetrics | None:
+        """Process one micro-batch. Returns None if the log had nothing new."""
+        t0 = time.perf_counter()
+        offsets = self.broker.committed(self.group)
+
+        # the batch budget is split across partitions; the rest stays in the
+        # log until the next poll (backpressure)
+        per_partition = max(1, self.max_batch // self.broker.partitions)
+        records = []
+        for p in range(self.broker.partitions):
+            batch, offsets[p] = self.broker.read(p, offsets[p], per_partition)
+            records.extend(batch)
+
+        if not records:
+            return None
+
+        inserted, _ = bulk_load_into_db(r["feature"] for r in records)
+        self._enrich([r["id"] for r in records])
+        self.broker.commit(self.group, offsets)
+
+        done_ms = time.time() * 1000
+        latencies = np.array([done_ms - r["produced_ms"] for r in records])
+        return BatchMetrics(
+            records=len(records),
+            inserted=inserted,
+            seconds=time.perf_counter() - t0,
+            latency_p50_ms=float(np.median(latencies)),
+            latency_max_ms=float(latencies.max()),
+            lag_bytes=self.broker.lag(self.group),
+        )
+
+    def _enrich(self, usgs_ids: list[str]) -> int:
+        """Resolve locations for the batch's quakes."""
+        with get_session() as session:
+            rows = session.execute(
+                text("""
+                    SELECT id, lat, lon
+                    FROM quake
+                    WHERE usgs_id = ANY(:ids)
+                      AND lat IS NOT NULL
+                      AND lon IS NOT NULL
+                """),
+                {"ids": usgs_ids},
+            ).fetchall()
+        return self.location_manager.upsert_locations_for_quakes(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-batch", type=int, default=5000)
+    parser.add_argument("--idle-sleep", type=float, default=2.0, help="seconds to wait when the log is drained")
+    parser.add_argument("--from-beginning", action="store_true", help="reset the group's offsets and replay")
+    args = parser.parse_args()
+
+    broker = LogBroker(STREAM_DIR, TOPIC, PARTITIONS)
+    if args.from_beginning:
+        broker.commit(CONSUMER_GROUP, [0] * broker.partitions)
+
+    consumer = MicroBatchConsumer(broker, max_batch=args.max_batch)
+    while True:
+        m = consumer.poll_batch()
+        if m is None:
+            time.sleep(args.idle_sleep)
+            continue
+        print(f"batch {m.records} records ({m.inserted} new) in {m.seconds:.2f}s, "
+              f"{m.records_per_s:.0f} rec/s, latency p50 {m.latency_p50_ms:.0f} ms / "
+              f"max {m.latency_max_ms:.0f} ms, lag {m.lag_bytes} bytes")
+
+
+if __name__ == "__main__":
+    main()
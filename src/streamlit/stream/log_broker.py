@@ -0,0 +1,95 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Iterable
+import json
+import os
+import threading
+import zlib
+
+
+class LogBroker:
+    """
+    File-backed stand-in for a Kafka topic.
+
+    - one append-only JSON-lines file per partition:  <root>/<topic>/partition-<n>.log
+    - records are routed by a stable hash of their key
+    - offsets are byte positions in the partition file
+    - consumer groups commit offsets to <root>/<topic>/offsets/<group>.json
+
+    Single-writer: run one producer per topic.
+    """
+
+    def __init__(self, root: Path, topic: str, partitions: int = 4):
+        self.dir = Path(root) / topic
+        self.partitions = partitions
+        (self.dir / "offsets").mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _partition_path(self, partition: int) -> Path:
+        return self.dir / f"partition-{partition}.log"
+
+    def _offsets_path(self, group: str) -> Path:
+        return self.dir / "offsets" / f"{group}.json"
+
+    # --- producer side ---
+
+    def append(self, records: Iterable[dict], key: Callable[[dict], str]) -> int:
+        """Append records, routed by crc32(key(record)). Returns number appended."""
+        lines: dict[int, list[str]] = {}
+        for r in records:
+            p = zlib.crc32(key(r).encode()) % self.partitions
+            lines.setdefault(p, []).append(json.dumps(r, separators=(",", ":")) + "\n")
+
+        with self._lock:
+            for p, chunk in lines.items():
+                with open(self._partition_path(p), "a", encoding="utf-8") as f:
+                    f.writelines(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+        return sum(len(c) for c in lines.values())
+
+    def end_offsets(self) -> list[int]:
+        return [
+            self._partition_path(p).stat().st_size if self._partition_path(p).exists() else 0
+            for p in range(self.partitions)
+        ]
+
+    # --- consumer side ---
+
+    def read(self, partition: int, offset: int, max_records: int) -> tuple[list[dict], int]:
+        """
+        Up to max_records complete records from `offset` on.
+        Returns (records, next_offset); a half-written trailing line is left for later.
+        """
+        path = self._partition_path(partition)
+        if not path.exists():
+            return [], offset
+
+        records = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while len(records) < max_records:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                records.append(json.loads(line))
+                offset += len(line)
+        return records, offset
+
+    def committed(self, group: str) -> list[int]:
+        path = self._offsets_path(group)
+        if not path.exists():
+            return [0] * self.partitions
+        offsets = json.loads(path.read_text())
+        return [int(offsets.get(str(p), 0)) for p in range(self.partitions)]
+
+    def commit(self, group: str, offsets: list[int]) -> None:
+        """Atomically store the group's offsets (write + rename)."""
+        path = self._offsets_path(group)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({str(p): o for p, o in enumerate(offsets)}))
+        tmp.replace(path)
+
+    def lag(self, group: str) -> int:
+        """Unconsumed bytes across partitions; a cheap backpressure signal."""
+        return sum(e - c for e, c in zip(self.end_offsets(), self.committed(group)))
@@ -0,0 +1,85 @@
+"""
+Stream producer: polls the USGS summary feed and appends new or updated
+events to the local log (see LogBroker).
+
+Run from src/streamlit:
+
+    python -m stream.producer --interval 30
+"""
+from __future__ import annotations
+from pathlib import Path
+import argparse
+import json
+import time
+
+from stream.log_broker import LogBroker
+from stream.settings import STREAM_DIR, TOPIC, PARTITIONS
+from data.data_sources import USGS_FEEDS
+from quake.quake_loader import get_http_session
+
+
+class FeedProducer:
+    """
+    Dedups on (event id, updated): an event is re-sent only when USGS revises
+    it, and the consumer then replaces the stored event with the newer
+    revision (see quake_loader.bulk_load_into_db). The dedup map is the
+    producer's cursor; it is kept next to the log so a restart does not
+    re-append the whole feed.
+    """
+
+    def __init__(self, broker: LogBroker, feed_url: str = USGS_FEEDS["hour"], state_path: Path | None = None):
+        self.broker = broker
+        self.feed_url = feed_url
+        self.state_path = state_path or broker.dir / "producer.json"
+        self._seen: dict[str, int] = self._load_seen()  # id -> last 'updated' sent
+
+    def _load_seen(self) -> dict[str, int]:
+        if not self.state_path.exists():
+            return {}
+        return {i: int(u) for i, u in json.loads(self.state_path.read_text()).items()}
+
+    def _save_seen(self) -> None:
+        """Atomically store the dedup map (write + rename), like LogBroker.commit()."""
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._seen))
+        tmp.replace(self.state_path)
+
+    def poll_once(self) -> int:
+        resp = get_http_session().get(self.feed_url, timeout=15)
+        resp.raise_for_status()
+        features = resp.json().get("features", []) or []
+
+        now_ms = int(time.time() * 1000)
+        fresh = []
+        for f in features:
+            updated = (f.get("properties") or {}).get("updated") or 0
+            if f.get("id") and self._seen.get(f["id"]) != updated:
+                fresh.append({"id": f["id"], "updated": updated, "produced_ms": now_ms, "feature": f})
+
+        n = self.broker.append(fresh, key=lambda r: r["id"])
+        # keep only ids still in the feed, so the dedup map stays bounded
+        current = {f.get("id") for f in features}
+        self._seen = {i: u for i, u in self._seen.items() if i in current}
+        self._seen.update({r["id"]: r["updated"] for r in fresh})
+        # after the append: a crash in between re-sends, which the consumer tolerates
+        self._save_seen()
+        return n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interval", type=int, default=30, help="seconds between polls")
+    args = parser.parse_args()
+
+    producer = FeedProducer(LogBroker(STREAM_DIR, TOPIC, PARTITIONS))
+    while True:
+        started = time.monotonic()
+        try:
+            print(f"Appended {producer.poll_once()} events")
+        except Exception as e:
+            print(f"Poll failed: {e}")
+        time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    main()
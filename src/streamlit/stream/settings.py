@@ -0,0 +1,8 @@
+import os
+from pathlib import Path
+
+# Local log directory (stand-in for a Kafka cluster) and topic layout.
+STREAM_DIR = Path(os.getenv("STREAM_DIR", Path(__file__).resolve().parents[1] / "data" / "stream"))
+TOPIC = os.getenv("STREAM_TOPIC", "usgs-events")
+PARTITIONS = int(os.getenv("STREAM_PARTITIONS", "4"))
+CONSUMER_GROUP = os.getenv("STREAM_GROUP", "db-writer")
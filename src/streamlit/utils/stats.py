@@ -0,0 +1,83 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class Distribution:
+    """
+    Sorted, NaN-free values of one numeric event property plus their summary
+    stats. Built once per result; binning afterwards only does binary searches,
+    so it costs O(bins * log n) and never touches the events again.
+    """
+    values: np.ndarray
+    stats: Dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_values(cls, values: np.ndarray) -> "Distribution":
+        values = np.sort(values[~np.isnan(values)])
+        return cls(values=values, stats=summary_stats(values))
+
+    @property
+    def empty(self) -> bool:
+        return self.values.size == 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+    def histogram(self, bins: int) -> pd.DataFrame:
+        """Equal-width bins over [min, max]: columns bin_start, bin_end, count."""
+        if self.empty:
+            return pd.DataFrame({"bin_start": [], "bin_end": [], "count": []})
+        lo, hi = float(self.values[0]), float(self.values[-1])
+        if hi == lo:
+            hi = lo + 1.0
+        edges = np.linspace(lo, hi, bins + 1)
+        # right edge inclusive for the last bin, like np.histogram
+        idx = np.searchsorted(self.values, edges, side="left")
+        idx[-1] = self.values.size
+        return pd.DataFrame({
+            "bin_start": edges[:-1],
+            "bin_end": edges[1:],
+            "count": np.diff(idx),
+        })
+
+
+def summary_stats(sorted_values: np.ndarray) -> Dict[str, float]:
+    """Same fields as pandas describe(): count, mean, std, min, 25%, 50%, 75%, max."""
+    n = sorted_values.size
+    if n == 0:
+        return {"count": 0}
+    q25, q50, q75 = np.quantile(sorted_values, [0.25, 0.5, 0.75])
+    return {
+        "count": n,
+        "mean": float(sorted_values.mean()),
+        "std": float(sorted_values.std(ddof=1)) if n > 1 else float("nan"),
+        "min": float(sorted_values[0]),
+        "25%": float(q25),
+        "50%": float(q50),
+        "75%": float(q75),
+        "max": float(sorted_values[-1]),
+    }
+
+
+def event_distributions(chunks: Iterable[pd.DataFrame]) -> Dict[str, Distribution]:
+    """
+    Distributions for the dashboard histograms (magnitude, non-negative depth)
+    from DataSource.iter_columns() chunks. Only the two value columns of each
+    chunk are kept, so the events themselves are never all in memory at once.
+    """
+    mags, depths = [], []
+    for events in chunks:
+        mags.append(events["mag"].to_numpy(dtype=float, na_value=np.nan))
+        depth = events["depth_km"].to_numpy(dtype=float, na_value=np.nan)
+        depth[depth < 0] = np.nan
+        depths.append(depth)
+    return {
+        "mag": Distribution.from_values(np.concatenate(mags) if mags else np.empty(0)),
+        "depth_km": Distribution.from_values(np.concatenate(depths) if depths else np.empty(0)),
+    }
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 
 @dataclass
@@ -26,4 +26,12 @@ class AppConfig:
     tsunami_only: bool
     text_query: str
     networks_csv: str
-    bbox: list | None
\ No newline at end of file
+    bbox: list | None
+
+    # result size cap; the data source reports when it was hit
+    max_events: int = 5000
+
+    # location filters (ISO3 codes / sea ids from the location table);
+    # an event matches if it is in any of them
+    countries: list[str] = field(default_factory=list)
+    seas: list[int] = field(default_factory=list)
\ No newline at end of file
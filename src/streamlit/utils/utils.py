@@ -1,125 +1,180 @@
-import json
+import math
 import pandas as pd
-from typing import Dict, Any, List
-from datetime import datetime, timezone
+from typing import Dict, Any, Tuple
 
 from utils.types import AppConfig
+from data.query_cache import query_cache, normalize_filters
+from data.rollup_queries import magnitude_bands, map_clusters, time_series
+from utils.stats import Distribution, event_distributions
+
+
+# Map level of detail (see map_view()): below this zoom the map gets clusters
+MAP_EVENTS_ZOOM = 5
+# cluster cells across the width of the world at zoom 0; halves per zoom level
+MAP_CLUSTER_CELLS = 32
+WORLD_BBOX = [-180.0, -90.0, 180.0, 90.0]
+
+
+def map_config(cfg: AppConfig) -> Dict[str, Any]:
+    """Settings the map component (components/html/earthquakes.js) needs from the sidebar config."""
+    return {
+        "mapbox_token": cfg.mapbox_token,
+        "style_url": cfg.style_url,
+        "style_name": cfg.style_name,
+        "layer_mode": cfg.layer_mode.lower(),
+        "speed_hps": cfg.speed_hps,
+        "start_ms": int(cfg.start_dt.timestamp() * 1000),
+        "end_ms": int(cfg.end_dt.timestamp() * 1000),
+        "mag_min": cfg.mag_min,
+        "mag_max": cfg.mag_max,
+        "depth_min": cfg.depth_min,
+        "depth_max": cfg.depth_max,
+        "tsunami_only": cfg.tsunami_only,
+    }
+
+
+def map_view(viewport: Dict[str, Any] | None) -> Dict[str, Any]:
+    """
+    What to send the map for the viewport it last reported
+    ({"bbox": [w, s, e, n], "zoom": z}, None before the first report):
 
+    - bbox: area to fetch, the viewport padded by half its size on every side
+      and snapped outward to a zoom-dependent grid, so small pans stay inside
+      it (no refetch) and nearby viewports share cache entries. w > e when it
+      crosses the antimeridian (see data.data_sources.split_bbox)
+    - zoom: integer zoom level the view was computed for
+    - cell_deg: cluster grid size in degrees, None from MAP_EVENTS_ZOOM on
 
-def js_bool(b: bool) -> str:
-    return "true" if b else "false"
+    The map only reports a new viewport once it leaves bbox or changes zoom level.
+    """
+    vp = viewport or {}
+    zoom = max(0, int(math.floor(float(vp.get("zoom", 1)))))
+    w, s, e, n = vp.get("bbox") or WORLD_BBOX
+    if e < w:
+        e += 360.0  # crosses the antimeridian; unwrap, padding may extend it further
+    dx, dy = (e - w) / 2, (n - s) / 2
+    step = 360.0 / 2 ** zoom / 4
+    west = math.floor((w - dx) / step) * step
+    width = math.ceil((e + dx) / step) * step - west
+    if width >= 360.0:
+        west, east = WORLD_BBOX[0], WORLD_BBOX[2]
+    else:
+        # wrap back into [-180, 180); step divides 360, so the grid is kept
+        west = (west + 180.0) % 360.0 - 180.0
+        east = west + width
+        if east > 180.0:
+            east -= 360.0
+    bbox = [
+        west,
+        max(WORLD_BBOX[1], math.floor((s - dy) / step) * step),
+        east,
+        min(WORLD_BBOX[3], math.ceil((n + dy) / step) * step),
+    ]
+    cell = 360.0 / (2 ** zoom * MAP_CLUSTER_CELLS) if zoom < MAP_EVENTS_ZOOM else None
+    return {"bbox": bbox, "zoom": zoom, "cell_deg": cell}
+
+
+def filters_for_cfg(cfg) -> Dict[str, Any]:
+    """DataSource.fetch_geojson keyword filters for the sidebar config."""
+    return dict(
+        start_ms=int(cfg.start_dt.timestamp() * 1000),
+        end_ms=int(cfg.end_dt.timestamp() * 1000),
+        mag_min=cfg.mag_min,
+        mag_max=cfg.mag_max,
+        depth_min=cfg.depth_min,
+        depth_max=cfg.depth_max,
+        tsunami_only=cfg.tsunami_only,
+        text_query=cfg.text_query,
+        networks=[s.strip() for s in cfg.networks_csv.split(",") if s.strip()],
+        bbox=cfg.bbox,
+        limit=cfg.max_events,
+        countries=list(cfg.countries),
+        seas=list(cfg.seas),
+    )
 
-def js_str(s: str) -> str:
-    # robust JS string literal (uses Python's repr for basic escaping)
-    return repr(s)
 
-def fill_template_vars(template: str, cfg: AppConfig, geojson: dict | None) -> str:
+def fetch_columns_for_cfg(cfg) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Table/histogram columns and result metadata for the sidebar config (see
+    DataSource.fetch_columns). Served from the shared query cache while the
+    source's data version is unchanged.
     """
-    Replace placeholders in a template string (JS or HTML).
+    ds = cfg.ds_choice
+    filters = filters_for_cfg(cfg)
+    if not getattr(ds, "cacheable", False):
+        return ds.fetch_columns(**filters)
+
+    return query_cache.get_or_compute(
+        (ds.name(), "columns", normalize_filters(filters)),
+        lambda: ds.fetch_columns(**filters),
+        version=ds.data_version,
+    )
 
-    Args:
-        template: the JS/HTML string with placeholders like __MAPBOX_TOKEN__
-        cfg: your config object with attributes (mapbox_token, style_url, etc.)
-        data_endpoint: string, the HTTP endpoint ("" if not used)
-        geojson: dict or None, FeatureCollection from ORM datasource
 
-    Returns:
-        str with placeholders replaced.
+def fetch_map_geojson_text_for_cfg(cfg, view: Dict[str, Any]) -> str:
+    """
+    Map payload for the sidebar config and map view (see
+    DataSource.fetch_map_geojson_text). Coarse views are clustered from
+    quake_rollup where the source has it (see data.rollup_queries.map_clusters).
     """
-    return (
-        template
-        .replace("__MAPBOX_TOKEN__", js_str(cfg.mapbox_token))
-        .replace("__MAP_STYLE__", js_str(cfg.style_url))
-        .replace("__MAP_STYLE_NAME__", js_str(cfg.style_name))
-        .replace("__LAYER_MODE__", js_str(cfg.layer_mode.lower()))
-        .replace("__SPEED_HPS__", str(cfg.speed_hps))
-        .replace("__START_MS__", str(int(cfg.start_dt.timestamp() * 1000)))
-        .replace("__END_MS__", str(int(cfg.end_dt.timestamp() * 1000)))
-        .replace("__MAG_MIN__", str(cfg.mag_min))
-        .replace("__MAG_MAX__", str(cfg.mag_max))
-        .replace("__DEPTH_MIN__", str(cfg.depth_min))
-        .replace("__DEPTH_MAX__", str(cfg.depth_max))
-        .replace("__TSUNAMI_ONLY__", js_bool(cfg.tsunami_only))
-        .replace("__TEXT_QUERY__", js_str(cfg.text_query.strip().lower()))
-        .replace(
-            "__NETWORKS_JSON__",
-            str([s.strip().lower() for s in cfg.networks_csv.split(",") if s.strip()])
-        )
-        .replace("__BBOX_JSON__", "null" if cfg.bbox is None else str(cfg.bbox))
-        .replace("__GEOJSON__", json.dumps(geojson) if geojson else "null")
-        .replace("__START_ISO__", cfg.start_dt.isoformat().replace("T", " ").replace("+00:00", " Z"))
-        .replace("__END_ISO__", cfg.end_dt.isoformat().replace("T", " ").replace("+00:00", " Z"))
+    ds = cfg.ds_choice
+    filters = filters_for_cfg(cfg)
+    if not getattr(ds, "cacheable", False):
+        return ds.fetch_map_geojson_text(view=view, **filters)
+
+    if getattr(ds, "supports_rollups", False):
+        clusters = map_clusters(view, **filters)
+        if clusters is not None:
+            return clusters
+
+    return query_cache.get_or_compute(
+        (ds.name(), "map_geojson_text", normalize_filters(view), normalize_filters(filters)),
+        lambda: ds.fetch_map_geojson_text(view=view, **filters),
+        version=ds.data_version,
+    )
+
+
+def location_counts_for_cfg(cfg) -> Dict[str, Any] | None:
+    """Per-country/per-sea event counts for the sidebar config; None if the source has no locations."""
+    ds = cfg.ds_choice
+    if not getattr(ds, "supports_location_filters", False):
+        return None
+    filters = filters_for_cfg(cfg)
+    return query_cache.get_or_compute(
+        (ds.name(), "location_counts", normalize_filters(filters)),
+        lambda: ds.location_counts(**filters),
+        version=ds.data_version,
     )
 
-def features_to_dataframe(gj: Dict[str, Any]) -> pd.DataFrame:
-    feats = (gj or {}).get("features", []) or []
-    rows: List[Dict[str, Any]] = []
-    for f in feats:
-        p = f.get("properties", {}) or {}
-        g = f.get("geometry", {}) or {}
-        # lat, lon, depth (depth not needed)
-        coords = g.get("coordinates", [None, None, None]) or [None, None, None]
-
-        time_ms = p.get("time_ms")
-        if time_ms is None:
-            time_ms = p.get("time")
-
-        time = to_iso(time_ms)
-
-        if p and g:
-            rows.append({
-                "time": time,
-                "time_ms": time_ms,
-                "mag": p.get("mag"),
-                "depth_km": coords[2] if len(coords) > 2 else p.get("depth_km"),
-                "lon": coords[0],
-                "lat": coords[1],
-                "place": p.get("place") or p.get("title"),
-                "net": p.get("net"),
-                "tsunami": p.get("tsunami"),
-                "url": p.get("url"),
-            })
-
-    df = pd.DataFrame(rows)
-    if not df.empty:
-        for col in ["mag", "depth_km", "lon", "lat", "time_ms"]:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        if "time_ms" in df.columns:
-            df["time"] = pd.to_datetime(df["time_ms"], unit="ms", utc=True, errors="coerce")
-    return df
-
-
-def to_iso(ts_ms: int) -> str:
-    if not ts_ms:
-        return "—"
-    # render as UTC
-    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-
-
-def fetch_geojson_for_cfg(cfg):
-    start_ms = int(cfg.start_dt.timestamp() * 1000)
-    end_ms   = int(cfg.end_dt.timestamp() * 1000)
-
-    # Prefer ORM/DB when the datasource provides it
-    if hasattr(cfg.ds_choice, "fetch_geojson"):
-        return cfg.ds_choice.fetch_geojson(
-            start_ms=start_ms,
-            end_ms=end_ms,
-            mag_min=cfg.mag_min,
-            mag_max=cfg.mag_max,
-            depth_min=cfg.depth_min,
-            depth_max=cfg.depth_max,
-            tsunami_only=cfg.tsunami_only,
-            text_query=cfg.text_query,
-            networks=[s.strip() for s in cfg.networks_csv.split(",") if s.strip()],
-            bbox=cfg.bbox,
-        )
-    # Fallback to HTTP endpoint
-    import requests
-    resp = requests.get(
-        cfg.ds_choice.get_endpoint(start_ms=start_ms, end_ms=end_ms),
-        timeout=15,
+
+def distributions_for_cfg(cfg) -> Dict[str, Distribution]:
+    """
+    Histogram/stats inputs over every event matching cfg, not capped at
+    max_events (see utils.stats.event_distributions). The events are streamed
+    from DataSource.iter_columns() chunk by chunk; the result is cached, so
+    reruns (e.g. moving a bin slider) do not read them again.
+    """
+    ds = cfg.ds_choice
+    filters = filters_for_cfg(cfg)
+    filters.pop("limit")
+    if not getattr(ds, "cacheable", False):
+        return event_distributions(ds.iter_columns(**filters))
+
+    return query_cache.get_or_compute(
+        (ds.name(), "distributions", normalize_filters(filters)),
+        lambda: event_distributions(ds.iter_columns(**filters)),
+        version=ds.data_version,
     )
-    resp.raise_for_status()
-    return resp.json()
+
+
+def rollup_views_for_cfg(cfg) -> Dict[str, Any] | None:
+    """
+    Magnitude bands and time series over every event matching cfg (not capped
+    at max_events), answered from quake_rollup; None if the source has no
+    rollups. Cached by data.rollup_queries itself.
+    """
+    if not getattr(cfg.ds_choice, "supports_rollups", False):
+        return None
+    filters = filters_for_cfg(cfg)
+    filters.pop("limit")
+    return {"mag_bands": magnitude_bands(**filters), "time_series": time_series(**filters)}